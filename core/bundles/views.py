@@ -0,0 +1,121 @@
+from http import HTTPStatus
+from urllib.parse import urlsplit, parse_qs
+
+from django.conf import settings
+from pydash import get
+from rest_framework import status
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from core.common.terminology import TerminologyService, get_validation_parameters
+from core.parameters.serializers import ParametersSerializer
+
+BUNDLE_RESPONSE_TYPES = {'batch': 'batch-response', 'transaction': 'transaction-response'}
+PARAMETER_VALUE_KEYS = ['valueString', 'valueCode', 'valueUri', 'valueUrl', 'valueCanonical', 'valueCoding']
+# coding fields to the parameter names of each operation
+CODING_PARAMETERS = {
+    ('CodeSystem', '$validate-code'): dict(system='url', code='code', version='version', display='display'),
+    ('ValueSet', '$validate-code'): dict(system='system', code='code', version='systemVersion', display='display'),
+    ('CodeSystem', '$lookup'): dict(system='system', code='code', version='version'),
+}
+
+
+def get_operation_outcome(diagnostics, code='invalid'):
+    return {
+        'resourceType': 'OperationOutcome',
+        'issue': [{'severity': 'error', 'code': code, 'diagnostics': diagnostics}]
+    }
+
+
+def get_response_entry(resource, status_code=status.HTTP_200_OK):
+    """A batch-response entry, resource is an OperationOutcome (response.outcome) for failures."""
+    response = {'status': f'{status_code} {HTTPStatus(status_code).phrase}'}
+    if status_code != status.HTTP_200_OK:
+        return {'response': {**response, 'outcome': resource}}
+    return {'resource': resource, 'response': response}
+
+
+def get_operation_parameters(entry):
+    """(resource type, operation) and parameters of an entry, from its request url and Parameters resource."""
+    url = urlsplit(get(entry, 'request.url') or '')
+    operation = tuple(url.path.strip('/').split('/')[-2:])
+    parameters = {name: values[0] for name, values in parse_qs(url.query).items()}
+    for parameter in get(entry, 'resource.parameter') or []:
+        value = next((parameter[key] for key in PARAMETER_VALUE_KEYS if key in parameter), None)
+        if parameter.get('name') and value is not None:
+            parameters[parameter['name']] = value
+    coding = parameters.pop('coding', None)
+    if isinstance(coding, dict):
+        for field, name in CODING_PARAMETERS.get(operation, {}).items():
+            if coding.get(field):
+                parameters[name] = coding[field]
+    return operation, parameters
+
+
+class FHIRBatchView(APIView):
+    """
+    POST of a Bundle of type batch (or transaction) with CodeSystem/ValueSet $validate-code and CodeSystem $lookup
+    requests, as GET urls with query params or POSTs of a Parameters resource (a coding parameter works too).
+    One TerminologyService answers all the entries, so each system/version is resolved and its index fetched once
+    per Bundle. Responds a batch-response (transaction-response) Bundle with an entry per request entry, in order.
+    A transaction fails (400) as a whole if any of its entries fails.
+    """
+    permission_classes = (AllowAny, )
+
+    @staticmethod
+    def process_entry(service, entry):
+        operation, parameters = get_operation_parameters(entry)
+        if operation not in CODING_PARAMETERS:
+            return get_response_entry(
+                get_operation_outcome(f"Unsupported operation {'/'.join(operation)}.", 'not-supported'),
+                status.HTTP_400_BAD_REQUEST
+            )
+        required = ['url', 'code'] if operation == ('CodeSystem', '$validate-code') else (
+            ['url', 'system', 'code'] if operation[0] == 'ValueSet' else ['system', 'code'])
+        missing = [name for name in required if not parameters.get(name)]
+        if missing:
+            return get_response_entry(
+                get_operation_outcome(f"{', '.join(missing)} required.", 'required'), status.HTTP_400_BAD_REQUEST)
+
+        if operation == ('CodeSystem', '$lookup'):
+            source, code_entry = service.lookup(parameters['system'], parameters['code'], parameters.get('version'))
+            if not code_entry:
+                return get_response_entry(
+                    get_operation_outcome('Code not found.', 'not-found'), status.HTTP_404_NOT_FOUND)
+            _, name, display_name, _ = code_entry
+            return get_response_entry(ParametersSerializer.from_lookup(source, name or display_name).data)
+
+        if operation[0] == 'ValueSet':
+            validation = service.validate_value_set_code(
+                parameters['url'], parameters['system'], parameters['code'], parameters.get('systemVersion'),
+                parameters.get('display')
+            )
+        else:
+            validation = service.validate_code(
+                parameters['url'], parameters['code'], parameters.get('version'), parameters.get('display'))
+        return get_response_entry(ParametersSerializer({'parameter': get_validation_parameters(validation)}).data)
+
+    def post(self, request):
+        bundle_type = request.data.get('type') if isinstance(request.data, dict) else None
+        if get(request.data, 'resourceType') != 'Bundle' or bundle_type not in BUNDLE_RESPONSE_TYPES:
+            return Response(
+                get_operation_outcome('A Bundle of type batch or transaction is required.'),
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        entries = request.data.get('entry') or []
+        if len(entries) > settings.TERMINOLOGY_BATCH_MAX_CODINGS:
+            return Response(
+                get_operation_outcome(f'At most {settings.TERMINOLOGY_BATCH_MAX_CODINGS} entries are allowed.'),
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        service = TerminologyService(request)
+        response_entries = [self.process_entry(service, entry) for entry in entries]
+        if bundle_type == 'transaction':
+            failed = [entry for entry in response_entries if 'outcome' in entry['response']]
+            if failed:
+                return Response(failed[0]['response']['outcome'], status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(
+            {'resourceType': 'Bundle', 'type': BUNDLE_RESPONSE_TYPES[bundle_type], 'entry': response_entries})
@@ -168,6 +168,85 @@ class CodeSystemTest(OCLTestCase):
                 {'name': 'version', 'valueString': self.org_source_v2.version},
                 {'name': 'display', 'valueString': self.concept_1.display_name}]}))
 
+    def test_validate_code_batch_for_code_system(self):
+        response = self.client.post(
+            '/fhir/CodeSystem/$validate-code',
+            {'resourceType': 'Parameters', 'parameter': [
+                {'name': 'coding', 'valueCoding': {
+                    'system': self.org_source.canonical_url, 'code': self.concept_1.mnemonic}},
+                {'name': 'coding', 'valueCoding': {
+                    'system': self.org_source.canonical_url, 'code': self.concept_2.mnemonic, 'version': 'v1'}},
+                {'name': 'coding', 'valueCoding': {
+                    'system': self.org_source.canonical_url, 'code': self.concept_1.mnemonic,
+                    'display': 'wrong_display'}},
+            ]},
+            format='json'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        validations = response.data['parameter']
+        self.assertEqual([validation['name'] for validation in validations], ['validation'] * 3)
+        self.assertEqual(validations[0]['part'][0]['valueCoding']['code'], self.concept_1.mnemonic)
+        self.assertEqual(validations[0]['part'][1], {'name': 'result', 'valueBoolean': True})
+        self.assertEqual(validations[0]['part'][-1], {'name': 'inactive', 'valueBoolean': False})
+        self.assertEqual(validations[1]['part'][1:], [
+            {'name': 'result', 'valueBoolean': False}, {'name': 'message', 'valueString': 'The code is incorrect.'}])
+        self.assertEqual(validations[2]['part'][1:], [
+            {'name': 'result', 'valueBoolean': False}, {'name': 'message', 'valueString': 'The code is incorrect.'}])
+
+    def test_validate_code_batch_for_code_system_without_codings(self):
+        response = self.client.post(
+            '/fhir/CodeSystem/$validate-code', {'resourceType': 'Parameters', 'parameter': []}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_batch_bundle(self):
+        response = self.client.post(
+            '/fhir/',
+            {'resourceType': 'Bundle', 'type': 'batch', 'entry': [
+                {'request': {
+                    'method': 'GET',
+                    'url': f'CodeSystem/$validate-code'
+                           f'?url={self.org_source.canonical_url}&code={self.concept_1.mnemonic}'
+                }},
+                {'request': {'method': 'POST', 'url': 'CodeSystem/$validate-code'}, 'resource': {
+                    'resourceType': 'Parameters', 'parameter': [{'name': 'coding', 'valueCoding': {
+                        'system': self.org_source.canonical_url, 'code': 'non_existing_code'}}]}},
+                {'request': {
+                    'method': 'GET',
+                    'url': f'CodeSystem/$lookup?system={self.org_source.canonical_url}&code={self.concept_1.mnemonic}'
+                }},
+                {'request': {'method': 'GET', 'url': 'CodeSystem/$subsumes?code=foo'}},
+            ]},
+            format='json'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['type'], 'batch-response')
+        entries = response.data['entry']
+        self.assertEqual(len(entries), 4)
+        self.assertEqual(entries[0]['response'], {'status': '200 OK'})
+        self.assertEqual(entries[0]['resource']['parameter'], [{'name': 'result', 'valueBoolean': True}])
+        self.assertEqual(entries[1]['resource']['parameter'][0], {'name': 'result', 'valueBoolean': False})
+        self.assertEqual(entries[2]['resource']['parameter'], [
+            {'name': 'name', 'valueString': self.org_source.mnemonic},
+            {'name': 'version', 'valueString': self.org_source_v2.version},
+            {'name': 'display', 'valueString': self.concept_1.name or self.concept_1.display_name}])
+        self.assertEqual(entries[3]['response']['status'], '400 Bad Request')
+        self.assertEqual(entries[3]['response']['outcome']['issue'][0]['code'], 'not-supported')
+
+    def test_transaction_bundle_with_failed_entry(self):
+        response = self.client.post(
+            '/fhir/',
+            {'resourceType': 'Bundle', 'type': 'transaction', 'entry': [
+                {'request': {'method': 'GET', 'url': f'CodeSystem/$lookup?system={self.org_source.canonical_url}'}},
+            ]},
+            format='json'
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['resourceType'], 'OperationOutcome')
+
     def test_post_code_system_without_concepts(self):
         response = self.client.post(
             f'/users/{self.user.mnemonic}/CodeSystem/',
@@ -1,11 +1,16 @@
 import logging
 
+from django.conf import settings
 from django.db.models import F
+from django.http import Http404
+from rest_framework.response import Response
 
 from core.bundles.serializers import FHIRBundleSerializer
 from core.code_systems.serializers import CodeSystemDetailSerializer
 from core.common.constants import HEAD
 from core.common.fhir_helpers import translate_fhir_query
+from core.common.mixins import BatchValidateCodeMixin
+from core.common.terminology import TerminologyService, get_validation_parameters
 from core.concepts.views import ConceptRetrieveUpdateDestroyView
 from core.parameters.serializers import ParametersSerializer
 from core.sources.models import Source
@@ -66,13 +71,34 @@ class CodeSystemListLookupView(ConceptRetrieveUpdateDestroyView):
             return ParametersSerializer.from_concept(instance)
         return ParametersSerializer()
 
+    def get(self, request, *args, **kwargs):
+        code = request.query_params.get('code')
+        system = request.query_params.get('system')
+        if settings.TERMINOLOGY_INDEX_ENABLED and code and system:
+            source, entry = TerminologyService(request).lookup(system, code)
+            if not entry:
+                raise Http404()
+            _, name, display_name, _ = entry
+            return Response(ParametersSerializer.from_lookup(source, name or display_name).data)
+        return super().get(request, *args, **kwargs)
 
-class CodeSystemListValidateCodeView(ConceptRetrieveUpdateDestroyView):
+
+class CodeSystemListValidateCodeView(BatchValidateCodeMixin, ConceptRetrieveUpdateDestroyView):
     serializer_class = ParametersSerializer
 
     def is_container_version_specified(self):
         return True
 
+    def get(self, request, *args, **kwargs):
+        code = request.query_params.get('code')
+        system = request.query_params.get('url')
+        version = request.query_params.get('version')
+        if settings.TERMINOLOGY_INDEX_ENABLED and code and system and version != HEAD:
+            validation = TerminologyService(request).validate_code(
+                system, code, version, request.query_params.get('display'))
+            return Response(ParametersSerializer({'parameter': get_validation_parameters(validation)}).data)
+        return super().get(request, *args, **kwargs)
+
     def get_queryset(self):
         queryset = super().get_queryset()
         code = self.request.query_params.get('code')
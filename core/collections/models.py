@@ -1,4 +1,5 @@
 import time
+from collections import defaultdict
 
 from django.conf import settings
 from django.contrib.postgres.fields import ArrayField
@@ -7,6 +8,7 @@ from django.db import models, transaction
 from django.db.models import UniqueConstraint, F, QuerySet, Q, Max
 from django.utils import timezone
 from django.utils.functional import cached_property
+from elasticsearch_dsl import Q as es_Q
 from pydash import get, compact
 
 from core.collections.constants import (
@@ -16,15 +18,16 @@ from core.collections.constants import (
     TRANSFORM_TO_RESOURCE_VERSIONS, COLLECTION_REFERENCE_TYPE)
 from core.collections.parsers import CollectionReferenceParser
 from core.collections.utils import is_concept, is_mapping
+from core.common.caching import invalidate_expansion_cache
 from core.common.constants import (
     DEFAULT_REPOSITORY_TYPE, ACCESS_TYPE_VIEW, ACCESS_TYPE_EDIT,
-    ES_REQUEST_TIMEOUT, ES_REQUEST_TIMEOUT_ASYNC, HEAD)
+    ES_REQUEST_TIMEOUT, ES_REQUEST_TIMEOUT_ASYNC, HEAD, SEARCH_PKS_BATCH_SIZE)
 from core.common.models import ConceptContainerModel, BaseResourceModel
 from core.common.tasks import seed_children_to_expansion, batch_index_resources, index_expansion_concepts, \
     index_expansion_mappings
 from core.common.utils import drop_version, to_owner_uri, generate_temp_version, es_id_in, \
     es_wildcard_search, get_resource_class_from_resource_name, get_exact_search_fields, to_snake_case, \
-    es_exact_search, es_to_pks, batch_qs, split_list_by_condition, decode_string, is_canonical_uri
+    es_exact_search, es_to_pks, batch_qs, split_list_by_condition, decode_string, is_canonical_uri, es_to_pks_streamed
 from core.concepts.constants import LOCALES_FULLY_SPECIFIED
 from core.concepts.models import Concept
 from core.mappings.models import Mapping
@@ -187,10 +190,18 @@ class Collection(ConceptContainerModel):
     def add_references(self, references, user=None):
         errors = {}
         added_references = []
+        bulk_references = []
+        references = list(references)
         for reference in references:
             reference.expression = reference.build_expression()
             reference.collection = self
             reference.created_by = user
+        if settings.COLLECTION_REFERENCES_BULK_ADD and not (self.is_openmrs_schema and self.expansion_uri):
+            bulk_references, references = split_list_by_condition(
+                references, lambda reference: reference.can_resolve_in_bulk)
+            bulk_references, errors = self.bulk_add_references(bulk_references)
+
+        for reference in references:
             try:
                 self.validate(reference)
                 reference.save()
@@ -201,12 +212,54 @@ class Collection(ConceptContainerModel):
                 added_references.append(reference)
 
         if self.expansion_uri:
-            self.expansion.add_references(added_references)
+            if bulk_references:
+                self.expansion.add_resolved_references(bulk_references)
+            if added_references or not bulk_references:
+                self.expansion.add_references(added_references)
         if user and user.is_authenticated:
             self.updated_by = user
         self.save()
         self.update_children_counts()
-        return added_references, errors
+        return [*bulk_references, *added_references], errors
+
+    def bulk_add_references(self, references):
+        """
+        Set-wise validate/save of plain references (CollectionReference.can_resolve_in_bulk): one duplicate check,
+        one concepts/mappings query per system version and bulk inserts of the references and their resources.
+        """
+        errors = {}
+        existing = set(self.references.filter(
+            expression__in={reference.expression for reference in references}).values_list('expression', 'include'))
+        to_add = []
+        for reference in references:
+            key = (reference.expression, reference.include)
+            try:
+                reference.clean_fields(exclude=['collection', 'created_by'])
+                if key in existing:
+                    raise ValidationError({reference.expression: [REFERENCE_ALREADY_EXISTS]})
+            except ValidationError as ex:
+                errors[reference.expression] = ex.messages
+                continue
+            existing.add(key)
+            reference.original_expression = str(reference.expression)
+            to_add.append(reference)
+
+        resolved = CollectionReference.resolve_in_bulk(to_add) if self.should_auto_expand else {}
+        for reference in to_add:
+            if not resolved.get(id(reference)):
+                reference.last_resolved_at = None
+        CollectionReference.objects.bulk_create(to_add)
+
+        referenced_concepts, referenced_mappings = [], []
+        for reference in to_add:
+            for resource_id in resolved.get(id(reference), []):
+                if reference.is_concept:
+                    referenced_concepts.append(ReferencedConcept(reference_id=reference.id, concept_id=resource_id))
+                else:
+                    referenced_mappings.append(ReferencedMapping(reference_id=reference.id, mapping_id=resource_id))
+        ReferencedConcept.objects.bulk_create(referenced_concepts, batch_size=5000)
+        ReferencedMapping.objects.bulk_create(referenced_mappings, batch_size=5000)
+        return to_add, errors
 
     def seed_references(self):
         head = self.head
@@ -328,6 +381,15 @@ class CollectionReference(models.Model):
     OPERATOR_EQUAL = '='
     OPERATOR_IN = 'in'
     ALLOWED_FILTER_OPS = [OPERATOR_EQUAL, OPERATOR_IN]
+    # filter properties -> columns, for properties indexed as (lowercase normalized) keywords
+    SQL_FILTER_FIELDS = {
+        'Concept': dict(
+            id='mnemonic', concept_class='concept_class', datatype='datatype', retired='retired',
+            is_latest_version='is_latest_version'
+        ),
+        'Mapping': dict(id='mnemonic', map_type='map_type', retired='retired'),
+    }
+    SQL_BOOLEAN_FILTER_FIELDS = ['retired', 'is_latest_version']
 
     _concepts = None
     _mappings = None
@@ -367,6 +429,46 @@ class CollectionReference(models.Model):
     def resource_type(self):
         return COLLECTION_REFERENCE_TYPE
 
+    @property
+    def can_resolve_in_bulk(self):
+        """A plain include reference to a code (and version) of a system, see Collection.bulk_add_references"""
+        return bool(
+            self.include and self.system and self.code and (self.is_concept or self.is_mapping) and
+            not (self.filter or self.cascade or self.valueset or self.transform)
+        )
+
+    @staticmethod
+    def resolve_in_bulk(references):
+        """
+        Resolves references that can_resolve_in_bulk like get_concepts/get_mappings do, with one query per system
+        version. Returns {id(reference): [concept or mapping ids]} and sets resolve_system_version of each.
+        """
+        groups = defaultdict(list)
+        for reference in references:
+            groups[(reference.system, reference.namespace, reference.version, reference.is_concept)].append(reference)
+
+        resolved = {}
+        for (_, _, _, is_concept_reference), group in groups.items():
+            system_version = group[0].resolve_system_version
+            for reference in group:
+                reference.__dict__['resolve_system_version'] = system_version  # cached_property
+            if not system_version or not system_version.can_view_all_content(group[0].created_by):
+                continue
+            codes = {decode_string(reference.code) if is_concept_reference else reference.code for reference in group}
+            resources = defaultdict(list)
+            for resource_id, mnemonic, version, versioned_object_id in get(
+                    system_version, 'concepts' if is_concept_reference else 'mappings'
+            ).filter(mnemonic__in=codes).values_list('id', 'mnemonic', 'version', 'versioned_object_id'):
+                resources[mnemonic].append((resource_id, version, versioned_object_id))
+            for reference in group:
+                code = decode_string(reference.code) if is_concept_reference else reference.code
+                resolved[id(reference)] = [
+                    resource_id for resource_id, version, versioned_object_id in resources[code]
+                    if (version == reference.resource_version if reference.resource_version else (
+                        not system_version.is_head or resource_id == versioned_object_id))
+                ]
+        return resolved
+
     @property
     def can_compute_against_other_system_version(self):
         return (not self.system or not self.version) and not self.resource_version
@@ -553,38 +655,93 @@ class CollectionReference(models.Model):
             False
         ))
 
+    def get_filter_values(self, filter_def):
+        if filter_def['op'] == self.OPERATOR_IN:
+            return compact(value.strip() for value in filter_def['value'].split(','))
+        return [filter_def['value']]
+
+    def get_filters_sql_criteria(self, filters, resource_klass):
+        """
+        Q of the filters when they are all on columns (SQL_FILTER_FIELDS) the ES keyword fields match exactly
+        (case insensitively), else None.
+        """
+        fields = self.SQL_FILTER_FIELDS.get(resource_klass.__name__, {})
+        criteria = Q()
+        for filter_def in filters:
+            field = fields.get(to_snake_case(filter_def['property']))
+            if not field:
+                return None
+            values = self.get_filter_values(filter_def)
+            criterion = Q()
+            for value in values:
+                if field in self.SQL_BOOLEAN_FILTER_FIELDS:
+                    if value.lower() not in ['true', 'false']:
+                        return None
+                    criterion |= Q(**{field: value.lower() == 'true'})
+                else:
+                    criterion |= Q(**{f'{field}__iexact': value})
+            criteria &= criterion
+        return criteria
+
+    def get_filters_search(self, filters, resource_klass):
+        search = resource_klass.get_search_document().search()
+        is_exact_search = self.__is_exact_search_filter()
+        for filter_def in filters:
+            val = filter_def['value']
+            if filter_def['property'] == 'q':
+                exact_search_fields = get_exact_search_fields(resource_klass)
+                if is_exact_search:
+                    search = es_exact_search(search, val, exact_search_fields)
+                else:
+                    name_attr = '_name' if self.is_concept else 'name'
+                    search = es_wildcard_search(search, val, exact_search_fields, name_attr)
+            else:
+                criterion = None
+                for value in self.get_filter_values(filter_def):
+                    match = es_Q("match", **{to_snake_case(filter_def["property"]): value})
+                    criterion = match if criterion is None else criterion | match
+                search = search.filter(criterion)
+        return search
+
     def apply_filters(self, queryset, resource_klass):
-        if self.filter:
+        """
+        Filters on columns become a SQL predicate. Others are one ES query, scoped to the system's owner/source
+        (and version unless HEAD), whose hits are streamed with search_after and intersected with the queryset.
+        Without a system, the queryset ids are sent in batches of SEARCH_PKS_BATCH_SIZE.
+        """
+        if not self.filter:
+            return queryset
+
+        filters = [
+            filter_def for filter_def in self.filter  # pylint: disable=not-an-iterable
+            if to_snake_case(filter_def['property']) != 'exact_match'
+        ]
+        criteria = self.get_filters_sql_criteria(filters, resource_klass)
+        if criteria is not None:
+            return self.__get_filtered_resources(queryset.filter(criteria), resource_klass)
+
+        document = resource_klass.get_search_document()
+        search = self.get_filters_search(filters, resource_klass).params(request_timeout=ES_REQUEST_TIMEOUT_ASYNC)
+        system_version = self.resolve_system_version
+        if system_version:
+            search = search.filter('term', owner=str(system_version.parent).lower()).filter(
+                'term', source=system_version.mnemonic.lower())
+            if not system_version.is_head:
+                search = search.filter('term', source_version=system_version.version)
+            pks = es_to_pks_streamed(document, search)
+        else:
             pks = []
-            document = resource_klass.get_search_document()
-            search = document.search()
-            is_exact_search = self.__is_exact_search_filter()
-            for filter_def in self.filter:  # pylint: disable=not-an-iterable
-                if to_snake_case(filter_def['property']) == 'exact_match':
-                    continue
-                val = filter_def['value']
-                if filter_def['property'] == 'q':
-                    exact_search_fields = get_exact_search_fields(resource_klass)
-                    if is_exact_search:
-                        search = es_exact_search(search, val, exact_search_fields)
-                    else:
-                        name_attr = '_name' if self.is_concept else 'name'
-                        search = es_wildcard_search(search, val, exact_search_fields, name_attr)
-                else:
-                    search = search.filter("match", **{to_snake_case(filter_def["property"]): filter_def["value"]})
-            for _queryset in batch_qs(queryset.order_by('id'), 500):
-                # iterating on queryset because ES has max_clause limit default to 1024
-                search_within_queryset = es_id_in(search, list(_queryset.values_list('id', flat=True)))
-                pks += es_to_pks(search_within_queryset.params(request_timeout=ES_REQUEST_TIMEOUT_ASYNC))
-            if pks:
-                resource_versions = resource_klass.objects.filter(id__in=set(pks))
-                if self.version or self.valueset or self.transform:
-                    return resource_versions
-                return resource_klass.objects.filter(
-                    id__in=resource_versions.values_list('versioned_object_id', flat=True))
+            for _queryset in batch_qs(queryset.order_by('id'), SEARCH_PKS_BATCH_SIZE):
+                pks += es_to_pks_streamed(document, es_id_in(search, list(_queryset.values_list('id', flat=True))))
+        if not pks:
             return resource_klass.objects.none()
 
-        return queryset
+        return self.__get_filtered_resources(queryset.filter(id__in=set(pks)), resource_klass)
+
+    def __get_filtered_resources(self, resource_versions, resource_klass):
+        if self.version or self.valueset or self.transform:
+            return resource_versions
+        return resource_klass.objects.filter(id__in=resource_versions.values_list('versioned_object_id', flat=True))
 
     # returns intersection of system and valueset resources considering creator permissions
     def get_resource_queryset_from_system_and_valueset(self, resource_relation, system_version=None):
@@ -837,32 +994,67 @@ class Expansion(BaseResourceModel):
         return split_list_by_condition(refs, lambda ref: ref.include)
 
     def delete_references(self, references):
-        refs, _ = self.to_ref_list_separated(references)
+        """
+        Removes the resources the (include) references contributed and re-adds, from the remaining references, only
+        other versions of the versioned objects removed. Deleting an exclude reference re-adds all of them, and so
+        does an expansion with a system-version, re-evaluating them against it (the linked versions may not match).
+        """
+        refs, exclude_refs = self.to_ref_list_separated(references)
+        remaining_refs = self.collection_version.references.exclude(
+            id__in=[ref.id for ref in self.to_ref_list(references)])
+        removed_versioned_object_ids = self.__remove_references_resources(refs)
 
-        index_concepts = False
-        index_mappings = False
-        for reference in refs:
-            concepts = reference.concepts
-            if concepts.exists():
-                index_concepts = True
-                filters = dict(id__in=list(concepts.values_list('id', flat=True)))
-                self.concepts.set(self.concepts.exclude(**filters))
-                batch_index_resources.apply_async(('concept', filters), queue='indexing')
-            mappings = reference.mappings
-            if mappings.exists():
-                index_mappings = True
-                filters = dict(id__in=list(mappings.values_list('id', flat=True)))
-                self.mappings.set(self.mappings.exclude(**filters))
-                batch_index_resources.apply_async(('mapping', filters), queue='indexing')
-
-        if index_concepts:
-            self.index_concepts()
-        if index_mappings:
-            self.index_mappings()
+        has_system_version = bool(
+            self.parameters.get(ExpansionParameters.INCLUDE_SYSTEM)) and not self.is_auto_generated
+        if has_system_version or (exclude_refs.exists() if isinstance(exclude_refs, QuerySet) else exclude_refs):
+            self.add_references(remaining_refs, True, True, has_system_version)
+            return
 
-        references_to_readd = self.collection_version.references.exclude(
-            id__in=[ref.id for ref in self.to_ref_list(references)])
-        self.add_references(references_to_readd, True, True, False)
+        for rel, klass, resource_type in [
+                (self.concepts, Concept, 'concept'), (self.mappings, Mapping, 'mapping')
+        ]:
+            versioned_object_ids = removed_versioned_object_ids[resource_type]
+            if versioned_object_ids:
+                self.__readd_resources(rel, klass, resource_type, remaining_refs, versioned_object_ids)
+
+    def __remove_references_resources(self, refs):
+        """Removes the concepts/mappings of the references, returns the versioned object ids of the removed ones."""
+        removed_versioned_object_ids = {}
+        for rel, resource_type in [(self.concepts, 'concept'), (self.mappings, 'mapping')]:
+            removed = set()
+            for reference in refs:
+                removed |= set(getattr(reference, f'{resource_type}s').filter(
+                    expansion_set=self).values_list('id', 'versioned_object_id'))
+            if removed:
+                ids = [_id for _id, _ in removed]
+                rel.remove(*ids)
+                batch_index_resources.apply_async((resource_type, dict(id__in=ids)), queue='indexing')
+            removed_versioned_object_ids[resource_type] = {
+                versioned_object_id for _, versioned_object_id in removed}
+        return removed_versioned_object_ids
+
+    def __readd_resources(  # pylint: disable=too-many-arguments
+            self, rel, klass, resource_type, references, versioned_object_ids
+    ):
+        """
+        Adds back one version (the latest) of each of the versioned objects that the include references still
+        contribute after the expansion parameters and the exclude references.
+        """
+        is_concept_queryset = resource_type == 'concept'
+        resources = self.apply_parameters(klass.objects.filter(
+            references__in=references.filter(include=True), versioned_object_id__in=versioned_object_ids
+        ), is_concept_queryset)
+        for reference in references.exclude(include=True):
+            excluded = getattr(reference, f'{resource_type}s')
+            if reference.resource_version:
+                resources = resources.exclude(id__in=excluded.values('id'))
+            else:
+                resources = resources.exclude(versioned_object_id__in=excluded.values('versioned_object_id'))
+        ids = list(resources.order_by('versioned_object_id', '-id').distinct(
+            'versioned_object_id').values_list('id', flat=True))
+        if ids:
+            rel.add(*ids)
+            batch_index_resources.apply_async((resource_type, dict(id__in=ids)), queue='indexing')
 
     def delete_expressions(self, expressions):  # Deprecated: Old way, must use delete_references instead
         concepts_filters = None
@@ -923,10 +1115,14 @@ class Expansion(BaseResourceModel):
                 _mappings = ref.mappings.all()
             return _concepts, _mappings
 
+        added_versioned_object_ids = None if is_adding_all_references else dict(concept=set(), mapping=set())
         for reference in include_refs:
             concepts, mappings = get_ref_results(reference)
             index_concepts = self.__include_resources(self.concepts, concepts, True)
             index_mappings = self.__include_resources(self.mappings, mappings, False)
+            if added_versioned_object_ids is not None:
+                added_versioned_object_ids['concept'] |= set(concepts.values_list('versioned_object_id', flat=True))
+                added_versioned_object_ids['mapping'] |= set(mappings.values_list('versioned_object_id', flat=True))
 
         for reference in exclude_refs:
             concepts, mappings = get_ref_results(reference)
@@ -935,19 +1131,54 @@ class Expansion(BaseResourceModel):
 
         self.resolved_collection_versions.add(*compact(resolved_valueset_versions))
         self.resolved_source_versions.add(*compact(resolved_system_versions))
-        self.dedupe_resources()
+        self.dedupe_resources(added_versioned_object_ids)
         if index:
             self.index_resources(index_concepts, index_mappings)
 
-    def dedupe_resources(self):
-        self.__dedupe_concepts()
-        self.__dedupe_mappings()
+    def add_resolved_references(self, references, index=True):
+        """
+        add_references of references saved by Collection.bulk_add_references, adding the resources they are linked
+        to with one insert per relation. Falls back to add_references when the references are not linked (no auto
+        expand), need re-evaluation against the expansion's system-version or the collection has exclude references.
+        """
+        if not self.collection_version.should_auto_expand or (
+                self.parameters.get(ExpansionParameters.INCLUDE_SYSTEM) and not self.is_auto_generated
+        ) or self.collection_version.references.exclude(include=True).exists():
+            self.add_references(references, index)
+            return
 
-    def __dedupe_concepts(self):
-        self.concepts.set(self.concepts.distinct('versioned_object_id'))
+        reference_ids = [reference.id for reference in references]
+        concepts = Concept.objects.filter(references__id__in=reference_ids)
+        mappings = Mapping.objects.filter(references__id__in=reference_ids)
+        index_concepts = self.__include_resources(self.concepts, concepts, True)
+        index_mappings = self.__include_resources(self.mappings, mappings, False)
+        self.resolved_source_versions.add(
+            *{reference.resolve_system_version for reference in references if reference.resolve_system_version})
+        self.dedupe_resources(dict(
+            concept=set(concepts.values_list('versioned_object_id', flat=True)),
+            mapping=set(mappings.values_list('versioned_object_id', flat=True))
+        ))
+        if index:
+            self.index_resources(index_concepts, index_mappings)
 
-    def __dedupe_mappings(self):
-        self.mappings.set(self.mappings.distinct('versioned_object_id'))
+    def dedupe_resources(self, versioned_object_ids=None):
+        """
+        Keeps one version of each versioned object, of the given ones ({'concept': ids, 'mapping': ids}) or of all.
+        Only the duplicate rows are deleted from the expansion's concepts/mappings.
+        """
+        self.__dedupe(self.concepts, 'concept', get(versioned_object_ids, 'concept', None))
+        self.__dedupe(self.mappings, 'mapping', get(versioned_object_ids, 'mapping', None))
+
+    def __dedupe(self, rel, resource_type, versioned_object_ids=None):
+        if versioned_object_ids is not None and not versioned_object_ids:
+            return
+        resources = rel.all() if versioned_object_ids is None else rel.filter(
+            versioned_object_id__in=versioned_object_ids)
+        kept = resources.order_by('versioned_object_id', '-id').distinct('versioned_object_id').values('id')
+        rel.through.objects.filter(
+            expansion_id=self.id, **{f'{resource_type}_id__in': resources.values('id')}
+        ).exclude(**{f'{resource_type}_id__in': kept}).delete()
+        invalidate_expansion_cache(self)
 
     def __include_resources(self, rel, resources, is_concept_queryset):
         should_index = resources.exists()
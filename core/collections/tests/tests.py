@@ -1,6 +1,7 @@
 from django.core.exceptions import ValidationError
-from mock import patch, Mock, PropertyMock
+from mock import patch, Mock, PropertyMock, ANY
 
+from core.collections.constants import REFERENCE_ALREADY_EXISTS
 from core.collections.documents import CollectionDocument
 from core.collections.models import CollectionReference, Collection, Expansion
 from core.collections.models import ExpansionParameters
@@ -148,6 +149,91 @@ class CollectionTest(OCLTestCase):
         self.assertEqual(collection.references.first().expression, concept1.uri)
         batch_index_resources_mock.apply_async.assert_called()
 
+    def test_add_references_in_bulk(self):
+        collection = OrganizationCollectionFactory()
+        expansion = ExpansionFactory(collection_version=collection)
+        collection.expansion_uri = expansion.uri
+        collection.save()
+        source = OrganizationSourceFactory()
+        concept1 = ConceptFactory(parent=source)
+        concept2 = ConceptFactory(parent=source)
+        mapping = MappingFactory(from_concept=concept1, to_concept=concept2, parent=source)
+
+        added, errors = collection.add_expressions(
+            dict(expressions=[concept1.uri, concept2.uri, mapping.uri, f'{source.uri}concepts/unknown/']),
+            collection.created_by
+        )
+
+        self.assertEqual(len(added), 4)
+        self.assertEqual(errors, {})
+        self.assertEqual(collection.references.count(), 4)
+        self.assertEqual(collection.references.get(expression=concept1.uri).concepts.count(), 1)
+        self.assertEqual(collection.references.get(expression=mapping.uri).mappings.count(), 1)
+        self.assertIsNone(collection.references.get(expression=f'{source.uri}concepts/unknown/').last_resolved_at)
+        self.assertEqual(
+            sorted(collection.expansion.concepts.values_list('versioned_object_id', flat=True)),
+            sorted([concept1.versioned_object_id, concept2.versioned_object_id])
+        )
+        self.assertEqual(collection.expansion.mappings.count(), 1)
+
+        added, errors = collection.add_expressions(dict(expressions=[concept1.uri]), collection.created_by)
+
+        self.assertEqual(added, [])
+        self.assertEqual(errors, {concept1.uri: [REFERENCE_ALREADY_EXISTS]})
+        self.assertEqual(collection.references.count(), 4)
+
+    @patch('core.collections.models.batch_index_resources')
+    def test_delete_references_keeps_resources_of_remaining_references(self, batch_index_resources_mock):
+        batch_index_resources_mock.apply_async = Mock()
+        collection = OrganizationCollectionFactory()
+        expansion = ExpansionFactory(collection_version=collection)
+        collection.expansion_uri = expansion.uri
+        collection.save()
+        source = OrganizationSourceFactory()
+        concept1 = ConceptFactory(parent=source)
+        concept2 = ConceptFactory(parent=source)
+        collection.add_expressions(dict(expressions=[concept1.uri, concept2.uri]), collection.created_by)
+        collection.add_expressions(
+            dict(expressions=[concept1.get_latest_version().uri]), collection.created_by)
+
+        self.assertEqual(collection.references.count(), 3)
+        self.assertEqual(collection.expansion.concepts.count(), 2)
+
+        collection.delete_references([concept1.uri])
+
+        self.assertEqual(collection.references.count(), 2)
+        self.assertEqual(
+            sorted(collection.expansion.concepts.values_list('versioned_object_id', flat=True)),
+            sorted([concept1.versioned_object_id, concept2.versioned_object_id])
+        )
+
+        collection.delete_references([concept1.get_latest_version().uri])
+
+        self.assertEqual(collection.references.count(), 1)
+        self.assertEqual(
+            list(collection.expansion.concepts.values_list('versioned_object_id', flat=True)),
+            [concept2.versioned_object_id]
+        )
+
+    @patch('core.collections.models.batch_index_resources')
+    def test_delete_references_with_system_version_reevaluates_remaining_references(self, batch_index_resources_mock):
+        batch_index_resources_mock.apply_async = Mock()
+        collection = OrganizationCollectionFactory()
+        expansion = ExpansionFactory(collection_version=collection, parameters={'system-version': 'https://s1.com|v1'})
+        collection.expansion_uri = expansion.uri
+        collection.save()
+        source = OrganizationSourceFactory()
+        concept1 = ConceptFactory(parent=source)
+        concept2 = ConceptFactory(parent=source)
+        collection.add_expressions(dict(expressions=[concept1.uri, concept2.uri]), collection.created_by)
+
+        with patch.object(Expansion, 'add_references') as add_references_mock:
+            collection.delete_references([concept1.uri])
+
+        add_references_mock.assert_called_once_with(ANY, True, True, True)
+        self.assertEqual(
+            list(add_references_mock.call_args[0][0].values_list('expression', flat=True)), [concept2.uri])
+
     def test_seed_references(self):
         collection1 = OrganizationCollectionFactory()
         expansion1 = ExpansionFactory(collection_version=collection1)
@@ -766,6 +852,27 @@ class CollectionReferenceTest(OCLTestCase):
         )
 
 
+    def test_apply_filters_in_sql(self):
+        concept1 = ConceptFactory(concept_class='Diagnosis')
+        concept2 = ConceptFactory(concept_class='Symptom', parent=concept1.parent)
+        ConceptFactory(concept_class='Drug', parent=concept1.parent)
+        queryset = Concept.objects.filter(parent=concept1.parent)
+
+        reference = CollectionReference(
+            reference_type='concepts', version='v1',
+            filter=[dict(property='conceptClass', value='diagnosis, Symptom', op='in')]
+        )
+        self.assertIsNotNone(reference.get_filters_sql_criteria(reference.filter, Concept))
+        self.assertEqual(
+            sorted(reference.apply_filters(queryset, Concept).values_list('id', flat=True)),
+            sorted([concept1.id, concept2.id])
+        )
+
+        reference.filter = [dict(property='q', value='foo', op='=')]
+        self.assertIsNone(reference.get_filters_sql_criteria(reference.filter, Concept))
+        reference.filter = [dict(property='retired', value='maybe', op='=')]
+        self.assertIsNone(reference.get_filters_sql_criteria(reference.filter, Concept))
+
 class CollectionUtilsTest(OCLTestCase):
     def test_is_mapping(self):
         self.assertFalse(is_mapping(None))
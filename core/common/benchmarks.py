@@ -0,0 +1,259 @@
+import json
+import os
+import platform
+import resource
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from celery.utils.log import get_task_logger
+from django.db import connection
+from pydash import get
+
+from core.common.constants import HEAD
+
+logger = get_task_logger(__name__)
+
+
+class SyntheticDataset:
+    """
+    Generates an OCL bulk import (one dict per line) of configurable size: an organization owning `sources`
+    sources with `concepts` concepts (two names, one description) and `mappings` mappings each, then
+    `collections` collections with `references` concept references each.
+    """
+    def __init__(
+            self, org, sources=1, concepts=1000, mappings=1000, collections=1, references=100
+    ):  # pylint: disable=too-many-arguments
+        self.org = org
+        self.sources = sources
+        self.concepts = concepts
+        self.mappings = mappings
+        self.collections = collections
+        self.references = references
+
+    @property
+    def repo(self):
+        return dict(owner=self.org, owner_type='Organization')
+
+    @property
+    def source_ids(self):
+        return [f'S{index}' for index in range(self.sources)]
+
+    @property
+    def collection_ids(self):
+        return [f'C{index}' for index in range(self.collections)]
+
+    @property
+    def total(self):
+        return sum(1 for _ in self.lines())
+
+    def copy(self, org):
+        return SyntheticDataset(
+            org, self.sources, self.concepts, self.mappings, self.collections, self.references)
+
+    def concept_url(self, source, index):
+        return f'/orgs/{self.org}/sources/{source}/concepts/C{index}/'
+
+    def get_concept(self, source, index):
+        return dict(
+            type='Concept', id=f'C{index}', concept_class='Misc', datatype='N/A', source=source, **self.repo,
+            names=[
+                dict(name=f'Concept {index}', locale='en', locale_preferred=True, name_type='Fully Specified'),
+                dict(name=f'Synonym {index} {source}', locale='fr', locale_preferred=False, name_type='Short'),
+            ],
+            descriptions=[dict(description=f'Synthetic concept {index} of {source}', locale='en')]
+        )
+
+    def get_mapping(self, source, index):
+        from_index = index % self.concepts
+        to_index = (from_index + 1 + index // self.concepts) % self.concepts
+        return dict(
+            type='Mapping', source=source, **self.repo,
+            map_type=['Same As', 'Narrower Than', 'Broader Than'][index % 3],
+            from_concept_url=self.concept_url(source, from_index), to_concept_url=self.concept_url(source, to_index)
+        )
+
+    def lines(self):
+        yield dict(type='Organization', id=self.org, name=f'{self.org} Benchmark', public_access='View')
+        for source in self.source_ids:
+            yield dict(
+                type='Source', id=source, name=source, full_name=f'{self.org} {source}', **self.repo,
+                default_locale='en', supported_locales='en,fr', source_type='Dictionary', public_access='View'
+            )
+            for index in range(self.concepts):
+                yield self.get_concept(source, index)
+            for index in range(self.mappings if self.concepts else 0):
+                yield self.get_mapping(source, index)
+
+        expressions = [
+            self.concept_url(source, index) for index in range(self.concepts) for source in self.source_ids
+        ][:self.references]
+        for collection in self.collection_ids:
+            yield dict(
+                type='Collection', id=collection, name=collection, full_name=f'{self.org} {collection}', **self.repo,
+                default_locale='en', supported_locales='en', collection_type='Subset', public_access='View'
+            )
+            for start in range(0, len(expressions), 100):
+                yield dict(
+                    type='Reference', collection=collection, **self.repo,
+                    data=dict(expressions=expressions[start:start + 100])
+                )
+
+    def to_json(self):
+        return '\n'.join(json.dumps(line) for line in self.lines())
+
+
+@contextmanager
+def count_queries(counter):
+    def wrapper(execute, sql, params, many, context):
+        counter['queries'] += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(wrapper):
+        yield counter
+
+
+def get_peak_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class BenchmarkSuite:
+    """
+    Runs import, export, indexing, expansion and search of a SyntheticDataset against the configured
+    Postgres/ES/Redis/export service and records rows/sec, query count (of this process) and peak RSS of each.
+    export, index, expansion and search work on the import_inline data. import_parallel imports a copy under
+    another org and needs celery workers on the concurrent queue, its queries and memory are the workers'.
+    """
+    names = ['import_inline', 'import_parallel', 'export', 'index', 'expansion', 'search']
+
+    def __init__(self, dataset, username='ocladmin', parallel=5, searches=100):
+        self.dataset = dataset
+        self.username = username
+        self.parallel = parallel
+        self.searches = searches
+        self.org = None
+        self.results = []
+
+    def measure(self, name, func):
+        counter = dict(queries=0)
+        started = time.time()
+        with count_queries(counter):
+            rows = func()
+        seconds = time.time() - started
+        result = dict(
+            name=name, rows=rows, seconds=round(seconds, 3),
+            rows_per_sec=round(rows / seconds, 2) if seconds else 0, queries=counter['queries'],
+            peak_rss_kb=get_peak_rss_kb()
+        )
+        logger.info('%s: %s', name, result)
+        self.results.append(result)
+        return result
+
+    @property
+    def parallel_org(self):
+        return f'{self.dataset.org}-P'
+
+    def get_org(self):
+        from core.orgs.models import Organization
+        if not self.org:
+            self.org = Organization.objects.filter(mnemonic=self.dataset.org).first()
+        return self.org
+
+    def get_sources(self):
+        from core.sources.models import Source
+        return Source.objects.filter(organization=self.get_org(), version=HEAD)
+
+    def get_collections(self):
+        from core.collections.models import Collection
+        return Collection.objects.filter(organization=self.get_org(), version=HEAD)
+
+    def import_inline(self):
+        from core.importers.models import BulkImportInline
+        importer = BulkImportInline(
+            content=None, username=self.username, update_if_exists=True, input_list=list(self.dataset.lines()))
+        importer.run()
+        return importer.processed
+
+    def import_parallel(self):
+        from core.importers.models import BulkImportParallelRunner
+        result = BulkImportParallelRunner(
+            content=list(self.dataset.copy(self.parallel_org).lines()), username=self.username,
+            update_if_exists=True, parallel=self.parallel
+        ).run()
+        return get(result, 'json.processed', 0)
+
+    def export(self):
+        from core.common.utils import write_export_file
+        cwd = os.getcwd()
+        rows = 0
+        try:
+            for source in self.get_sources():
+                write_export_file(source, 'source', 'core.sources.serializers.SourceVersionExportSerializer', logger)
+                rows += source.concepts.count() + source.mappings.count()
+        finally:
+            os.chdir(cwd)
+        return rows
+
+    def index(self):
+        from core.concepts.models import Concept
+        from core.mappings.models import Mapping
+        rows = 0
+        for model in [Concept, Mapping]:
+            queryset = model.objects.filter(parent__in=self.get_sources())
+            model.batch_index(queryset, model.get_search_document())
+            rows += queryset.count()
+        return rows
+
+    def expansion(self):
+        from core.collections.models import Expansion
+        rows = 0
+        for collection in self.get_collections():
+            expansion = Expansion.persist(
+                index=False, collection_version=collection, sync=True, created_by_id=collection.created_by_id,
+                updated_by_id=collection.created_by_id
+            )
+            rows += expansion.concepts.count() + expansion.mappings.count()
+        return rows
+
+    def search(self):
+        from core.concepts.documents import ConceptDocument
+        sources = [source.mnemonic.lower() for source in self.get_sources()]
+        for index in range(self.searches):
+            ConceptDocument.search().filter(
+                'term', owner=self.dataset.org.lower()
+            ).filter(
+                'terms', source=sources
+            ).query('match', name=f'Concept {index % max(self.dataset.concepts, 1)}').execute()
+        return self.searches
+
+    def run(self, names=None):
+        for name in names or self.names:
+            self.measure(name, getattr(self, name))
+        return self.report()
+
+    def report(self):
+        return dict(
+            datetime=datetime.utcnow().isoformat(),
+            machine_info=dict(node=platform.node(), python=platform.python_version(), cpu_count=os.cpu_count()),
+            dataset=dict(
+                sources=self.dataset.sources, concepts=self.dataset.concepts, mappings=self.dataset.mappings,
+                collections=self.dataset.collections, references=self.dataset.references, lines=self.dataset.total
+            ),
+            benchmarks=self.results
+        )
+
+    def cleanup(self):
+        from core.orgs.models import Organization
+        for org in Organization.objects.filter(mnemonic__in=[self.dataset.org, self.parallel_org]):
+            org.delete()
+
+    @staticmethod
+    def compare(report, previous):
+        """Change of rows/sec (%) of each benchmark present in both reports, negative is a regression."""
+        previous_results = {result['name']: result for result in previous.get('benchmarks', [])}
+        changes = {}
+        for result in report['benchmarks']:
+            before = get(previous_results, [result['name'], 'rows_per_sec'])
+            if before:
+                changes[result['name']] = round((result['rows_per_sec'] - before) * 100 / before, 2)
+        return changes
@@ -0,0 +1,70 @@
+"""
+Response cache generations.
+
+Cached responses are keyed under a repository and a repository version generation. Bumping a generation makes
+every key built with the previous one unreachable (they expire or get evicted), so invalidation never scans keys.
+"""
+import hashlib
+import json
+
+from django.core.cache import cache
+from pydash import compact
+
+from core.common.constants import HEAD, RESPONSE_CACHE_PREFIX
+
+
+def get_repo_cache_namespace(owner_uri, repo_type, mnemonic):
+    return f'{owner_uri}{repo_type}/{mnemonic}/'
+
+
+def get_repo_version_cache_namespace(repo_namespace, version=None):
+    return f'{repo_namespace}{version or HEAD}/'
+
+
+def get_repo_cache_namespace_from_uri(uri):
+    return '/' + '/'.join(compact(uri.split('/'))[:4]) + '/'
+
+
+def get_generation_key(namespace):
+    return f'{RESPONSE_CACHE_PREFIX}_generation:{namespace}'
+
+
+def get_generations(*namespaces):
+    keys = [get_generation_key(namespace) for namespace in namespaces]
+    generations = cache.get_many(keys)
+    return [generations.get(key) or 0 for key in keys]
+
+
+def bump_generation(namespace):
+    key = get_generation_key(namespace)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+
+
+def get_response_cache_key(version_namespace, *parts):
+    digest = hashlib.md5(json.dumps(parts, default=str).encode('utf-8')).hexdigest()  # nosec
+    return f'{RESPONSE_CACHE_PREFIX}:{version_namespace}{digest}'
+
+
+def invalidate_repo_version_cache(repo):
+    """Drops cached responses of this repository version, e.g. on HEAD content changes."""
+    if repo and repo.uri:
+        bump_generation(get_repo_version_cache_namespace(get_repo_cache_namespace_from_uri(repo.uri), repo.version))
+
+
+def invalidate_repo_cache(repo):
+    """Drops cached responses of every version of this repository, e.g. when its access changes."""
+    if repo and repo.uri:
+        bump_generation(get_repo_cache_namespace_from_uri(repo.uri))
+
+
+def get_expansion_cache_namespace(expansion):
+    return expansion.uri or f'/expansions/{expansion.id}/'
+
+
+def invalidate_expansion_cache(expansion):
+    """Drops what is cached from an expansion's concepts/mappings, e.g. the concept graph, once they change."""
+    if expansion and expansion.id:
+        bump_generation(get_expansion_cache_namespace(expansion))
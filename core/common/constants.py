@@ -68,6 +68,14 @@ LIST_DEFAULT_LIMIT = 25
 CSV_DEFAULT_LIMIT = 1000
 SEARCH_PARAM = 'q'
 INCLUDE_FACETS = 'HTTP_INCLUDEFACETS'
+# params that change concept/mapping list payloads, these can't be rendered from the payload stored in the index
+LIST_PAYLOAD_PARAMS = (
+    INCLUDE_MAPPINGS_PARAM, INCLUDE_INVERSE_MAPPINGS_PARAM, INCLUDE_EXTRAS_PARAM, INCLUDE_PARENT_CONCEPTS,
+    INCLUDE_CHILD_CONCEPTS, INCLUDE_HIERARCHY_PATH, INCLUDE_PARENT_CONCEPT_URLS, INCLUDE_CHILD_CONCEPT_URLS,
+    INCLUDE_SUMMARY, INCLUDE_VERBOSE_REFERENCES, MAPPING_LOOKUP_CONCEPTS, MAPPING_LOOKUP_FROM_CONCEPT,
+    MAPPING_LOOKUP_TO_CONCEPT, MAPPING_LOOKUP_SOURCES, MAPPING_LOOKUP_FROM_SOURCE, MAPPING_LOOKUP_TO_SOURCE,
+    'onlyParentLess', 'csv'
+)
 FACETS_ONLY = 'facetsOnly'
 HTTP_COMPRESS_HEADER = 'HTTP_COMPRESS'
 NOT_FOUND = 'Not found.'
@@ -80,6 +88,14 @@ PARENT_RESOURCE_CANNOT_BE_NONE = 'Parent resource cannot be None.'
 CREATOR_CANNOT_BE_NONE = 'Creator cannot be None.'
 CANNOT_DELETE_ONLY_VERSION = 'Cannot delete only version.'
 BULK_IMPORT_QUEUES_COUNT = 4
+EXPORT_BATCH_SIZE = 1000
+INDEX_BUFFER_KEY_PREFIX = 'index_buffer:'
+INDEX_BUFFER_DRAIN_SCHEDULED_KEY = 'index_buffer_drain_scheduled'
+BATCH_INDEX_CHECKPOINT_KEY_PREFIX = 'batch_index_checkpoint:'
+INDEX_REBUILD_KEY_PREFIX = 'index_rebuild:'
+EXPORT_SHARD_SIZE = 25000
+EXPORT_SHARDING_THRESHOLD = 100000
+EXPORT_STITCH_TASK_ID_PREFIX = 'export-stitch-shards-'
 MAX_PINS_ALLOWED = 4
 CONFIRM_EMAIL_ADDRESS_MAIL_SUBJECT = "Confirm E-mail Address"
 PASSWORD_RESET_MAIL_SUBJECT = "Password Reset E-mail"
@@ -89,10 +105,24 @@ REQUEST_USER_HEADER = 'X-OCL-REQUEST-USER'
 RESPONSE_TIME_HEADER = 'X-OCL-RESPONSE-TIME'
 REQUEST_URL_HEADER = 'X-OCL-REQUEST-URL'
 REQUEST_METHOD_HEADER = 'X-OCL-REQUEST-METHOD'
+PROFILE_HEADER = 'X-OCL-PROFILE'
+PROFILE_PARAM = 'profile'
 CREATE_PARENT_VERSION_QUERY_PARAM = 'createParentVersion'
 CURRENT_USER = 'CURRENT_USER'
 REQUEST_URL = 'REQUEST_URL'
 ES_REQUEST_TIMEOUT = 60  # seconds, default is 10
+SEARCH_CURSOR_PARAM = 'cursor'
+SEARCH_STREAM_PARAM = 'stream'
+SEARCH_PIT_KEEP_ALIVE = '5m'
+SEARCH_STREAM_BATCH_SIZE = 1000
+SEARCH_PKS_BATCH_SIZE = 10000  # ES max result window
+RESPONSE_CACHE_PREFIX = 'response_cache'
+# read relations that change without a new version or a cache invalidation, responses with them aren't cached
+RESPONSE_CACHE_UNCACHED_PARAMS = [
+    INCLUDE_PARENT_CONCEPTS, INCLUDE_CHILD_CONCEPTS, INCLUDE_HIERARCHY_PATH, INCLUDE_PARENT_CONCEPT_URLS,
+    INCLUDE_CHILD_CONCEPT_URLS, INCLUDE_INVERSE_MAPPINGS_PARAM, INCLUDE_VERBOSE_REFERENCES, INCLUDE_SOURCE_VERSIONS,
+    INCLUDE_COLLECTION_VERSIONS, INCLUDE_HIERARCHY_ROOT
+]
 ES_REQUEST_TIMEOUT_ASYNC = 60 * 5  # seconds, default is 10
 CASCADE_METHOD_PARAM = 'method'
 CASCADE_HIERARCHY_PARAM = 'cascadeHierarchy'
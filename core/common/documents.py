@@ -0,0 +1,185 @@
+from django.conf import settings
+from django.utils import timezone
+from elasticsearch.helpers import parallel_bulk, bulk
+
+from core.common.constants import INDEX_REBUILD_KEY_PREFIX
+from core.common.metrics import record_es_bulk_failures
+from core.common.services import RedisService
+from core.common.utils import keyset_batches
+
+
+class PrefetchedIndexingMixin:
+    """
+    Loads the instances to index with the model's index_prefetch_related, so prepare_* methods
+    read names, sources, expansions, etc. from memory instead of querying per instance.
+    `search_index --populate` walks the table in keyset batches, since iterator() ignores prefetches.
+    """
+    indexing_batch_size = 1000
+
+    def get_queryset(self):
+        return super().get_queryset().prefetch_related(*self.django.model.index_prefetch_related)
+
+    def get_indexing_queryset(self):
+        queryset = self.get_queryset()
+        for ids in keyset_batches(super().get_queryset(), 'id', self.indexing_batch_size):
+            yield from queryset.filter(id__in=ids).order_by('-id')
+
+
+class BlueGreenIndexRebuilder:
+    """
+    Rebuilds a document's index without taking search down. The document's index name is used as an alias:
+    a new versioned index (e.g. concepts_v20261018093000) is bulk loaded with refresh disabled and no replicas,
+    then the alias is atomically moved to it and the old index is removed in the same request.
+    Rows indexed while loading (recorded by record_saves, since M2M changes don't touch updated_at) are indexed
+    into the new index before and after the alias is moved, rows deleted while loading (recorded by record_delete)
+    are removed from it.
+    """
+    progress_every = 1000
+    batch_size = 1000
+
+    def __init__(self, document, progress=None):
+        self.document = document
+        self.progress = progress
+        self.alias = document._index._name  # pylint: disable=protected-access
+        self.index_name = f'{self.alias}_v{timezone.now().strftime("%Y%m%d%H%M%S")}'
+        self.connection = document._get_connection()  # pylint: disable=protected-access
+
+    @property
+    def live_settings(self):
+        return {
+            'number_of_replicas': get_number_of_replicas(self.document),
+            'refresh_interval': '1s',
+        }
+
+    @staticmethod
+    def get_rebuilding_key(alias):
+        return f'{INDEX_REBUILD_KEY_PREFIX}{alias}'
+
+    @classmethod
+    def get_deletes_key(cls, alias):
+        return f'{cls.get_rebuilding_key(alias)}:deletes'
+
+    @classmethod
+    def get_saves_key(cls, alias):
+        return f'{cls.get_rebuilding_key(alias)}:saves'
+
+    @staticmethod
+    def is_alias(document):
+        connection = document._get_connection()  # pylint: disable=protected-access
+        return connection.indices.exists_alias(name=document._index._name)  # pylint: disable=protected-access
+
+    @classmethod
+    def record_delete(cls, document, instance_id):
+        """Keeps the id of a row deleted while the document's index is being rebuilt."""
+        redis_service = RedisService()
+        alias = document._index._name  # pylint: disable=protected-access
+        if redis_service.exists(cls.get_rebuilding_key(alias)):
+            redis_service.add_to_set(cls.get_deletes_key(alias), instance_id)
+
+    @classmethod
+    def record_saves(cls, document, instance_ids):
+        """Keeps the ids of rows (re)indexed while the document's index is being rebuilt."""
+        redis_service = RedisService()
+        alias = document._index._name  # pylint: disable=protected-access
+        if instance_ids and redis_service.exists(cls.get_rebuilding_key(alias)):
+            redis_service.add_to_set(cls.get_saves_key(alias), *instance_ids)
+
+    def run(self):
+        started_at = timezone.now()
+        redis_service = RedisService()
+        redis_service.set(self.get_rebuilding_key(self.alias), self.index_name)
+        try:
+            self.create_index()
+            try:
+                self.load()
+                self.index_saved(redis_service)
+                self.connection.indices.put_settings(index=self.index_name, body={'index': self.live_settings})
+                self.connection.indices.refresh(index=self.index_name)
+                self.swap_alias()
+            except Exception:
+                self.connection.indices.delete(index=self.index_name, ignore=[404])
+                raise
+
+            self.catch_up(started_at)
+            self.index_saved(redis_service)  # saved between the first pass and the swap
+            self.remove_deleted(redis_service)
+        finally:
+            redis_service.delete(
+                self.get_rebuilding_key(self.alias), self.get_deletes_key(self.alias), self.get_saves_key(self.alias))
+
+        return self.index_name
+
+    def create_index(self):
+        index = self.document._index.clone(name=self.index_name)  # pylint: disable=protected-access
+        index.settings(number_of_replicas=0, refresh_interval='-1')
+        index.create(using=self.connection)
+
+    def get_actions(self, queryset=None):
+        document = self.document()
+        if queryset is None:
+            queryset = document.get_indexing_queryset()
+        actions = document._get_actions(queryset, 'index')  # pylint: disable=protected-access
+        for action in actions:
+            action['_index'] = self.index_name
+            yield action
+
+    def load(self):
+        total = self.document().get_queryset().count()
+        indexed = 0
+        self.report(indexed, total)
+        for success, info in parallel_bulk(
+                self.connection, self.get_actions(), chunk_size=settings.ES_BULK_CHUNK_SIZE,
+                thread_count=settings.ES_BULK_THREAD_COUNT, max_chunk_bytes=settings.ES_BULK_MAX_CHUNK_BYTES,
+                raise_on_error=False
+        ):
+            if not success:
+                record_es_bulk_failures(self.alias, 1)
+                raise Exception(f'Failed to index into {self.index_name}: {info}')
+            indexed += 1
+            if indexed % self.progress_every == 0:
+                self.report(indexed, total)
+        self.report(indexed, total)
+
+    def swap_alias(self):
+        actions = [{'add': {'index': self.index_name, 'alias': self.alias}}]
+        indices = self.connection.indices
+        if indices.exists_alias(name=self.alias):
+            actions += [{'remove_index': {'index': name}} for name in indices.get_alias(name=self.alias)]
+        elif indices.exists(index=self.alias):  # first run, a concrete index still owns the alias name
+            actions.append({'remove_index': {'index': self.alias}})
+        indices.update_aliases(body={'actions': actions})
+
+    def catch_up(self, started_at):
+        model = self.document.django.model
+        if not hasattr(model, 'updated_at'):
+            return
+        queryset = self.document().get_queryset().filter(updated_at__gte=started_at)
+        if queryset.exists():
+            self.document().update(queryset.order_by('-id'))
+
+    def index_saved(self, redis_service):
+        key = self.get_saves_key(self.alias)
+        ids = redis_service.pop_from_set(key, self.batch_size)
+        while ids:
+            queryset = self.document().get_queryset().filter(id__in=[int(_id) for _id in ids])
+            bulk(self.connection, self.get_actions(queryset), raise_on_error=False)
+            ids = redis_service.pop_from_set(key, self.batch_size)
+
+    def remove_deleted(self, redis_service):
+        key = self.get_deletes_key(self.alias)
+        ids = redis_service.pop_from_set(key, self.batch_size)
+        while ids:
+            bulk(
+                self.connection,
+                ({'_op_type': 'delete', '_index': self.index_name, '_id': int(_id)} for _id in ids),
+                raise_on_error=False
+            )
+            ids = redis_service.pop_from_set(key, self.batch_size)
+
+    def report(self, indexed, total):
+        if self.progress:
+            self.progress(dict(index=self.alias, new_index=self.index_name, indexed=indexed, total=total))
+
+
+def get_number_of_replicas(document):
+    return document._index._settings.get('number_of_replicas', 0)  # pylint: disable=protected-access
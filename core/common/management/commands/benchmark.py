@@ -0,0 +1,63 @@
+import json
+
+from django.core.management import BaseCommand, CommandError
+
+from core.common.benchmarks import SyntheticDataset, BenchmarkSuite
+
+
+class Command(BaseCommand):
+    help = 'benchmark import/export/index/expansion/search throughput on a synthetic dataset ' \
+           '(needs Postgres, ES, Redis and, for import_parallel, celery workers)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--org', default='BENCH', help='mnemonic of the (new) org owning the dataset')
+        parser.add_argument('--sources', type=int, default=1)
+        parser.add_argument('--concepts', type=int, default=1000, help='concepts per source')
+        parser.add_argument('--mappings', type=int, default=1000, help='mappings per source')
+        parser.add_argument('--collections', type=int, default=1)
+        parser.add_argument('--references', type=int, default=100, help='concept references per collection')
+        parser.add_argument('--benchmarks', nargs='+', choices=BenchmarkSuite.names, default=BenchmarkSuite.names)
+        parser.add_argument('--parallel', type=int, default=5, help='tasks per part of import_parallel')
+        parser.add_argument('--searches', type=int, default=100)
+        parser.add_argument('--username', default='ocladmin')
+        parser.add_argument('--output', help='write the JSON report to this file')
+        parser.add_argument('--compare', help='JSON report of a previous run to compare rows/sec with')
+        parser.add_argument(
+            '--max-regression', type=float, help='fail if rows/sec of a benchmark dropped more than this (%%)')
+        parser.add_argument('--keep', action='store_true', help='keep the dataset (org) after the run')
+
+    def handle(self, *args, **options):
+        dataset = SyntheticDataset(
+            options['org'], options['sources'], options['concepts'], options['mappings'], options['collections'],
+            options['references']
+        )
+        suite = BenchmarkSuite(dataset, options['username'], options['parallel'], options['searches'])
+        if suite.get_org():
+            raise CommandError(f"Org {options['org']} already exists, use another --org.")
+
+        try:
+            report = suite.run(options['benchmarks'])
+        finally:
+            if not options['keep']:
+                suite.cleanup()
+
+        for result in report['benchmarks']:
+            self.stdout.write(
+                f"{result['name']:<16} {result['rows']:>9d} rows {result['seconds']:>10.3f}s "
+                f"{result['rows_per_sec']:>12.2f} rows/sec {result['queries']:>9d} queries "
+                f"{result['peak_rss_kb']:>9d}KB peak RSS"
+            )
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(report, file, indent=2)
+
+        if options['compare']:
+            with open(options['compare'], 'r') as file:
+                changes = suite.compare(report, json.load(file))
+            for name, change in changes.items():
+                self.stdout.write(f'{name:<16} {change:+.2f}% rows/sec')
+            max_regression = options['max_regression']
+            regressions = [name for name, change in changes.items() if max_regression is not None and
+                           change < -max_regression]
+            if regressions:
+                raise CommandError(f"rows/sec regressed more than {max_regression}% in: {', '.join(regressions)}")
@@ -0,0 +1,11 @@
+from django.core.management import BaseCommand
+
+from core.concepts.models import ConceptHierarchyClosure
+
+
+class Command(BaseCommand):
+    help = 'rebuild the concept hierarchy closure (ancestors/descendants) from concept parents'
+
+    def handle(self, *args, **options):
+        ConceptHierarchyClosure.rebuild()
+        self.stdout.write(f'{ConceptHierarchyClosure.objects.count():d} hierarchy closure rows')
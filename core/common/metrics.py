@@ -0,0 +1,157 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+from core.common.services import RedisService
+
+logger = logging.getLogger('oclapi')
+
+METRICS_KEY = 'ocl_metrics'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+TASK_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600)
+TIMED_TASKS = ('handle_save', 'batch_index_resources')
+TIMED_TASK_PREFIXES = ('export_', )
+FAMILIES = {
+    'ocl_http_request_duration_seconds': ('histogram', 'API response time by view.'),
+    'ocl_http_db_queries_total': ('counter', 'SQL queries run by the requests of a view.'),
+    'ocl_http_es_requests_total': ('counter', 'ES requests made by the requests of a view.'),
+    'ocl_celery_task_duration_seconds': ('histogram', 'Runtime of the timed celery tasks.'),
+    'ocl_celery_task_failures_total': ('counter', 'Failed celery tasks.'),
+    'ocl_es_bulk_failures_total': ('counter', 'Documents ES bulk indexing failed for.'),
+    'ocl_celery_queue_length': ('gauge', 'Messages waiting in a celery queue.'),
+}
+
+
+def format_labels(labels):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return ','.join(f'{key}="{escape(value)}"' for key, value in sorted(labels.items()))
+
+
+def get_sample_key(name, labels):
+    return f'{name}{{{format_labels(labels)}}}' if labels else name
+
+
+class Metrics:
+    """
+    Counters and histograms summed in process (a dict under a lock, so recording stays cheap on the hot path) and
+    added to a redis hash at most every METRICS_FLUSH_INTERVAL seconds, so that /metrics of any API process shows
+    the totals of all the API processes and celery workers.
+    """
+    def __init__(self):
+        self.samples = defaultdict(float)
+        self.lock = threading.Lock()
+        self.flushed_at = time.time()
+
+    def inc(self, name, labels=None, value=1):
+        with self.lock:
+            self.samples[get_sample_key(name, labels)] += value
+        self.flush_if_due()
+
+    def observe(self, name, value, labels=None, buckets=LATENCY_BUCKETS):
+        labels = labels or {}
+        with self.lock:
+            for bucket in buckets:
+                if value <= bucket:
+                    self.samples[get_sample_key(f'{name}_bucket', {**labels, 'le': bucket})] += 1
+            self.samples[get_sample_key(f'{name}_bucket', {**labels, 'le': '+Inf'})] += 1
+            self.samples[get_sample_key(f'{name}_sum', labels)] += value
+            self.samples[get_sample_key(f'{name}_count', labels)] += 1
+        self.flush_if_due()
+
+    def flush_if_due(self):
+        if time.time() - self.flushed_at >= settings.METRICS_FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            samples = self.samples
+            self.samples = defaultdict(float)
+            self.flushed_at = time.time()
+        if not samples:
+            return
+        try:
+            pipeline = RedisService().conn.pipeline(transaction=False)
+            for key, value in samples.items():
+                pipeline.hincrbyfloat(METRICS_KEY, key, value)
+            pipeline.execute()
+        except Exception as ex:  # pylint: disable=broad-except
+            logger.warning('Could not flush metrics: %s', ex)
+            with self.lock:
+                for key, value in samples.items():
+                    self.samples[key] += value
+
+    def collect(self):
+        """Flushes this process and returns the summed samples of all the processes."""
+        self.flush()
+        return {
+            key.decode(): float(value) for key, value in RedisService().conn.hgetall(METRICS_KEY).items()
+        }
+
+    @staticmethod
+    def get_queue_lengths():
+        redis_service = RedisService()
+        return {
+            get_sample_key('ocl_celery_queue_length', dict(queue=queue)): redis_service.conn.llen(queue)
+            for queue in settings.METRICS_CELERY_QUEUES
+        }
+
+    @staticmethod
+    def get_family(key):
+        name = key.split('{', 1)[0]
+        for suffix in ['_bucket', '_sum', '_count']:
+            if name.endswith(suffix) and name[:-len(suffix)] in FAMILIES:
+                return name[:-len(suffix)]
+        return name
+
+    def render(self):
+        """Prometheus text exposition (0.0.4) of all the samples and the current celery queue lengths."""
+        families = defaultdict(list)
+        for key, value in {**self.collect(), **self.get_queue_lengths()}.items():
+            families[self.get_family(key)].append((key, value))
+
+        lines = []
+        for family in sorted(families):
+            _type, _help = FAMILIES.get(family, ('untyped', ''))
+            lines += [f'# HELP {family} {_help}', f'# TYPE {family} {_type}']
+            lines += [f'{key} {self.format_value(value)}' for key, value in sorted(families[family])]
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def format_value(value):
+        """Full precision, counters and sums keep growing and rate() needs every digit."""
+        value = float(value)
+        return str(int(value)) if value.is_integer() else repr(value)
+
+
+metrics = Metrics()
+
+
+def record_request(view, method, status, seconds, db_queries, es_requests):  # pylint: disable=too-many-arguments
+    labels = dict(view=view, method=method, status=f'{str(status)[0]}xx')
+    metrics.observe('ocl_http_request_duration_seconds', seconds, labels)
+    if db_queries:
+        metrics.inc('ocl_http_db_queries_total', dict(view=view), db_queries)
+    if es_requests:
+        metrics.inc('ocl_http_es_requests_total', dict(view=view), es_requests)
+
+
+def is_timed_task(task_name):
+    name = task_name.rsplit('.', 1)[-1]
+    return name in TIMED_TASKS or name.startswith(TIMED_TASK_PREFIXES)
+
+
+def record_task(task_name, seconds):
+    metrics.observe(
+        'ocl_celery_task_duration_seconds', seconds, dict(task=task_name.rsplit('.', 1)[-1]), TASK_BUCKETS)
+
+
+def record_task_failure(task_name):
+    metrics.inc('ocl_celery_task_failures_total', dict(task=task_name.rsplit('.', 1)[-1]))
+
+
+def record_es_bulk_failures(index, count):
+    metrics.inc('ocl_es_bulk_failures_total', dict(index=index), count)
@@ -3,7 +3,9 @@ from math import ceil
 from urllib import parse
 
 from django.conf import settings
+from django.core.cache import cache
 from django.core.paginator import Paginator
+from django.db import transaction
 from django.db.models import Q, F
 from django.http import HttpResponseForbidden, Http404
 from django.shortcuts import get_object_or_404
@@ -15,9 +17,12 @@ from rest_framework.generics import RetrieveUpdateDestroyAPIView
 from rest_framework.mixins import ListModelMixin, CreateModelMixin
 from rest_framework.response import Response
 
+from core.common.caching import get_repo_cache_namespace, get_repo_version_cache_namespace, get_generations, \
+    get_response_cache_key, invalidate_repo_version_cache
 from core.common.constants import HEAD, ACCESS_TYPE_NONE, INCLUDE_FACETS, \
     LIST_DEFAULT_LIMIT, HTTP_COMPRESS_HEADER, CSV_DEFAULT_LIMIT, FACETS_ONLY, NOT_FOUND, \
-    MUST_SPECIFY_EXTRA_PARAM_IN_BODY, INCLUDE_RETIRED_PARAM
+    MUST_SPECIFY_EXTRA_PARAM_IN_BODY, INCLUDE_RETIRED_PARAM, SEARCH_CURSOR_PARAM, LATEST, \
+    RESPONSE_CACHE_UNCACHED_PARAMS
 from core.common.permissions import HasPrivateAccess, HasOwnership, CanViewConceptDictionary, \
     CanViewConceptDictionaryVersion
 from .utils import write_csv_to_s3, get_csv_from_s3, get_query_params_from_url_string, compact_dict_by_values, \
@@ -27,10 +32,15 @@ logger = logging.getLogger('oclapi')
 
 
 class CustomPaginator:
-    def __init__(self, request, total_count, queryset, page_size, is_sliced=False):  # pylint: disable=too-many-arguments
+    def __init__(  # pylint: disable=too-many-arguments
+            self, request, total_count, queryset, page_size, is_sliced=False, is_cursor_paginated=False,
+            next_cursor=None
+    ):
         self.request = request
+        self.is_cursor_paginated = is_cursor_paginated
+        self.next_cursor = next_cursor
         self.queryset = queryset
-        self.total = total_count or self.queryset.count()
+        self.total = total_count or (len(queryset) if isinstance(queryset, list) else self.queryset.count())
         self.page_size = int(page_size)
         self.page_number = int(request.GET.get('page', '1') or '1')
         if not is_sliced:
@@ -39,7 +49,8 @@ class CustomPaginator:
             if top >= self.total:
                 top = self.total
             self.queryset = self.queryset[bottom:top]
-        self.queryset.count = None
+        if not isinstance(self.queryset, list):
+            self.queryset.count = None
         self.paginator = Paginator(self.queryset, self.page_size)
         self.page_object = self.paginator.get_page(self.page_number)
         self.page_count = ceil(int(self.total_count) / int(self.page_size))
@@ -72,6 +83,12 @@ class CustomPaginator:
         query_params['page'] = str(self.current_page_number)
         return self.__get_full_url() + '?' + query_params.urlencode()
 
+    def get_next_cursor_url(self):
+        query_params = self.__get_query_params()
+        query_params.pop('page', None)
+        query_params[SEARCH_CURSOR_PARAM] = self.next_cursor
+        return self.__get_full_url() + '?' + query_params.urlencode()
+
     def get_previous_page_url(self):
         query_params = self.__get_query_params()
         query_params['page'] = str(self.current_page_number - 1)
@@ -89,6 +106,10 @@ class CustomPaginator:
             num_found=self.total_count, num_returned=len(self.current_page_results),
             pages=self.page_count, page_number=self.page_number
         )
+        if self.is_cursor_paginated:
+            if self.next_cursor:
+                headers['next'] = self.get_next_cursor_url()
+            return headers
         if self.has_next():
             headers['next'] = self.get_next_page_url()
         if self.has_previous():
@@ -127,6 +148,9 @@ class ListWithHeadersMixin(ListModelMixin):
         if self.only_facets():
             return Response(dict(facets=dict(fields=self.get_facets())))
 
+        if self.should_stream_search_results():
+            return self.stream_search_results()
+
         if self.object_list is None:
             self.object_list = self.filter_queryset()
 
@@ -148,7 +172,8 @@ class ListWithHeadersMixin(ListModelMixin):
                 self.limit = LIST_DEFAULT_LIMIT
             paginator = CustomPaginator(
                 request=request, queryset=sorted_list, page_size=self.limit, total_count=self.total_count,
-                is_sliced=self.should_perform_es_search()
+                is_sliced=self.should_perform_es_search(), is_cursor_paginated=get(self, 'is_cursor_paginated'),
+                next_cursor=get(self, 'next_search_cursor')
             )
             headers = paginator.headers
             results = paginator.current_page_results
@@ -162,7 +187,11 @@ class ListWithHeadersMixin(ListModelMixin):
         return response
 
     def serialize_list(self, results, paginator=None):
-        result_dict = self.get_serializer(results, many=True).data
+        if get(self, 'is_es_native_results'):
+            from core.common.serializers import ESNativeListSerializer
+            result_dict = ESNativeListSerializer(results, many=True).data
+        else:
+            result_dict = self.get_serializer(results, many=True).data
         if self.should_include_facets():
             data = dict(results=result_dict, facets=dict(fields=self.get_facets()))
         elif hasattr(self.__class__, 'bundle_response'):
@@ -435,6 +464,12 @@ class SourceChildMixin:
     @property
     def version_url(self):
         if self.is_versioned_object:
+            if 'versions_set' in (getattr(self, '_prefetched_objects_cache', None) or {}):  # prefetched to index
+                latest_version = max(
+                    (version for version in self.versions_set.all() if version.is_active and version.is_latest_version),
+                    key=lambda version: version.created_at, default=None
+                )
+                return get(latest_version, 'uri')
             return self.get_latest_version().uri
         return self.uri
 
@@ -592,6 +627,76 @@ class SourceChildMixin:
     def collection_references(self, collection):
         return self.references.filter(collection=collection)
 
+    def soft_delete(self):
+        super().soft_delete()
+        self.invalidate_response_cache()
+
+    def invalidate_response_cache(self):
+        parent = self.parent
+        transaction.on_commit(lambda: invalidate_repo_version_cache(parent))
+
+
+class ResponseCacheMixin:
+    """
+    Caches GET responses of public released source versions, keyed by the view, path, sorted query params,
+    authorization and representation headers, under the source's and source version's cache generations.
+    HEAD isn't cached, its payloads also change with writes that don't go through the invalidation (hierarchy
+    tasks, mappings of other sources, collection membership), and neither are the params reading such relations.
+    A cache hit is served before authentication and permission checks, which is safe only because
+    private sources are never cached, access changes invalidate every version of the source and the
+    authorization header is part of the key.
+    """
+    response_cache_key = None
+    response_cache_source_filters = None
+
+    def get_response_cache_key(self, request, **kwargs):
+        if not settings.RESPONSE_CACHE_ENABLED or request.method != 'GET':
+            return None
+        if 'source' not in kwargs or 'collection' in kwargs or kwargs.get('user_is_self'):
+            return None
+        version = kwargs.get('version') or HEAD
+        if version in [HEAD, LATEST] or any(param in request.GET for param in RESPONSE_CACHE_UNCACHED_PARAMS):
+            return None
+        owner_uri = f"/orgs/{kwargs['org']}/" if 'org' in kwargs else f"/users/{kwargs.get('user')}/"
+
+        repo_namespace = get_repo_cache_namespace(owner_uri, 'sources', kwargs['source'])
+        version_namespace = get_repo_version_cache_namespace(repo_namespace, version)
+        owner_filters = dict(organization__mnemonic=kwargs['org']) if 'org' in kwargs else dict(
+            user__username=kwargs.get('user'))
+        self.response_cache_source_filters = dict(
+            mnemonic=kwargs['source'], version__in={HEAD, version}, **owner_filters)
+        return get_response_cache_key(
+            version_namespace,
+            request.path, sorted(request.GET.lists()), self.__class__.__name__,
+            [
+                request.META.get(header) for header in (
+                    'HTTP_AUTHORIZATION', 'HTTP_ACCEPT', INCLUDE_FACETS, HTTP_COMPRESS_HEADER)
+            ],
+            get_generations(repo_namespace, version_namespace)
+        )
+
+    def dispatch(self, request, *args, **kwargs):
+        self.response_cache_key = self.get_response_cache_key(request, **kwargs)
+        if self.response_cache_key:
+            response = cache.get(self.response_cache_key)
+            if response is not None:
+                return response
+
+        return super().dispatch(request, *args, **kwargs)
+
+    def is_response_cacheable(self):
+        from core.sources.models import Source
+        sources = Source.objects.filter(**self.response_cache_source_filters)
+        return len(sources) == 2 and all(source.public_can_view for source in sources)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        key = self.response_cache_key
+        if key and response.status_code == 200 and hasattr(response, 'add_post_render_callback') and \
+                not response.cookies and self.is_response_cacheable():
+            response.add_post_render_callback(lambda rendered: cache.set(key, rendered, None))
+        return response
+
 
 class ConceptContainerExportMixin:
     permission_classes = (CanViewConceptDictionaryVersion, )
@@ -699,7 +804,8 @@ class ConceptContainerProcessingMixin:
 
         if is_debug:
             return Response(dict(is_processing=version.is_processing,
-                                 process_ids=version._background_process_ids))  # pylint: disable=protected-access
+                                 process_ids=version._background_process_ids,  # pylint: disable=protected-access
+                                 progress=version.processing_progress))
 
         logger.debug('Processing flag requested for %s version %s', self.resource, version)
 
@@ -758,3 +864,41 @@ class ConceptContainerExtraRetrieveUpdateDestroyView(RetrieveUpdateDestroyAPIVie
             return Response(status=status.HTTP_204_NO_CONTENT)
 
         return Response(dict(detail=NOT_FOUND), status=status.HTTP_404_NOT_FOUND)
+
+
+class BatchValidateCodeMixin:
+    """
+    POST of a Parameters with `coding` parameters (and the `url` of the ValueSet for a ValueSet) validates all the
+    codings at once through the terminology indexes of the released versions. The response has a `validation`
+    parameter per coding, in order, with its coding, result and display/inactive or message as parts.
+    """
+    is_value_set = False
+
+    def get_permissions(self):
+        if self.request.method == 'POST':
+            return []  # access to each source/collection version is checked by TerminologyService
+        return super().get_permissions()
+
+    def post(self, request, *args, **kwargs):  # pylint: disable=unused-argument
+        from core.common.terminology import TerminologyService
+        from core.parameters.serializers import ParametersSerializer
+        serializer = ParametersSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        parameters = serializer.validated_data.get('parameter', [])
+        codings = [parameter['valueCoding'] for parameter in parameters if parameter['name'] == 'coding' and
+                   parameter.get('valueCoding')]
+        url = next((parameter.get('valueUri') or parameter.get('valueUrl') or parameter.get('valueString')
+                    for parameter in parameters if parameter['name'] == 'url'), None)
+        if not codings or (self.is_value_set and not url):
+            return Response(
+                dict(detail='coding parameters' + (' and url' if self.is_value_set else '') + ' are required.'),
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(codings) > settings.TERMINOLOGY_BATCH_MAX_CODINGS:
+            return Response(
+                dict(detail=f'At most {settings.TERMINOLOGY_BATCH_MAX_CODINGS} codings can be validated at once.'),
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        validations = TerminologyService(request).validate_codings(codings, url if self.is_value_set else None)
+        return Response(ParametersSerializer({'parameter': validations}).data)
@@ -11,22 +11,27 @@ from django.utils import timezone
 from django.utils.functional import cached_property
 from django_elasticsearch_dsl.registries import registry
 from django_elasticsearch_dsl.signals import RealTimeSignalProcessor
+from elasticsearch.helpers import BulkIndexError
 from pydash import get
 
+from core.common.documents import BlueGreenIndexRebuilder
+from core.common.metrics import record_es_bulk_failures
+from core.common.services import RedisService
 from core.common.tasks import update_collection_active_concepts_count, update_collection_active_mappings_count, \
     delete_s3_objects
 from core.common.utils import reverse_resource, reverse_resource_version, parse_updated_since_param, drop_version, \
     to_parent_uri, is_canonical_uri, get_export_service
-from core.common.utils import to_owner_uri
+from core.common.utils import to_owner_uri, keyset_batches
 from core.settings import DEFAULT_LOCALE
 from .constants import (
     ACCESS_TYPE_CHOICES, DEFAULT_ACCESS_TYPE, NAMESPACE_REGEX,
     ACCESS_TYPE_VIEW, ACCESS_TYPE_EDIT, SUPER_ADMIN_USER_ID,
     HEAD, PERSIST_NEW_ERROR_MESSAGE, SOURCE_PARENT_CANNOT_BE_NONE, PARENT_RESOURCE_CANNOT_BE_NONE,
-    CREATOR_CANNOT_BE_NONE, CANNOT_DELETE_ONLY_VERSION, CUSTOM_VALIDATION_SCHEMA_OPENMRS)
+    CREATOR_CANNOT_BE_NONE, CANNOT_DELETE_ONLY_VERSION, CUSTOM_VALIDATION_SCHEMA_OPENMRS,
+    BATCH_INDEX_CHECKPOINT_KEY_PREFIX, EXPORT_STITCH_TASK_ID_PREFIX)
 from .fields import URIField
 from .tasks import handle_save, handle_m2m_changed, seed_children_to_new_version, update_validation_schema, \
-    update_source_active_concepts_count, update_source_active_mappings_count
+    update_source_active_concepts_count, update_source_active_mappings_count, buffer_for_indexing
 
 
 class BaseModel(models.Model):
@@ -68,6 +73,9 @@ class BaseModel(models.Model):
     extras = models.JSONField(null=True, blank=True, default=dict)
     uri = models.TextField(null=True, blank=True, db_index=True)
     _index = True
+    # indexed in bulk through the Redis index buffer instead of a handle_save task per save
+    index_buffered = False
+    index_prefetch_related = []
 
     @property
     def model_name(self):
@@ -79,7 +87,22 @@ class BaseModel(models.Model):
 
     def index(self):
         if not get(settings, 'TEST_MODE', False):
-            handle_save.delay(self.app_name, self.model_name, self.id)
+            if self.should_buffer_index:
+                buffer_for_indexing(self.app_name, self.model_name, self.id)
+            else:
+                handle_save.delay(self.app_name, self.model_name, self.id)
+
+    @property
+    def should_buffer_index(self):
+        return self.index_buffered and get(settings, 'ES_BUFFERED_INDEXING', False)
+
+    @classmethod
+    def index_ids(cls, ids):
+        """Indexes the given ids with a single ES bulk request"""
+        document = cls.get_search_document()
+        queryset = cls.objects.filter(id__in=ids).prefetch_related(*cls.index_prefetch_related)
+        document().update(queryset, chunk_size=max(len(ids), 1))
+        BlueGreenIndexRebuilder.record_saves(document, ids)
 
     @property
     def should_index(self):
@@ -172,15 +195,37 @@ class BaseModel(models.Model):
         return criteria
 
     @staticmethod
-    def batch_index(queryset, document):
-        count = queryset.count()
-        batch_size = 1000
-        offset = 0
-        limit = batch_size
-        while offset < count:
-            document().update(queryset.order_by('-id')[offset:limit], parallel=True)
-            offset = limit
-            limit += batch_size
+    def batch_index(queryset, document, checkpoint_key=None):
+        """
+        Indexes the queryset in keyset batches (id < last indexed id) through ES parallel_bulk.
+        With a checkpoint_key the last indexed id is kept in Redis after every batch, so calling it again
+        with the same key after a crash continues where it stopped. The checkpoint is cleared once done.
+        """
+        redis_service = None
+        if checkpoint_key:
+            checkpoint_key = BATCH_INDEX_CHECKPOINT_KEY_PREFIX + checkpoint_key
+            redis_service = RedisService()
+            if redis_service.exists(checkpoint_key):
+                queryset = queryset.filter(id__lt=redis_service.get_int(checkpoint_key))
+
+        model = queryset.model
+        prefetch_related = getattr(model, 'index_prefetch_related', [])
+        for ids in keyset_batches(queryset, 'id', settings.ES_BATCH_INDEX_SIZE):
+            try:
+                document().update(
+                    model.objects.filter(id__in=ids).order_by('-id').prefetch_related(*prefetch_related),
+                    parallel=True, chunk_size=settings.ES_BULK_CHUNK_SIZE,
+                    thread_count=settings.ES_BULK_THREAD_COUNT, max_chunk_bytes=settings.ES_BULK_MAX_CHUNK_BYTES
+                )
+            except BulkIndexError as ex:
+                record_es_bulk_failures(document._index._name, len(ex.errors))  # pylint: disable=protected-access
+                raise
+            BlueGreenIndexRebuilder.record_saves(document, ids)
+            if redis_service:
+                redis_service.set(checkpoint_key, ids[-1])
+
+        if redis_service:
+            redis_service.delete(checkpoint_key)
 
     @staticmethod
     def batch_delete(queryset):
@@ -730,6 +775,15 @@ class ConceptContainerModel(VersionedModel):
 
         return False
 
+    @property
+    def processing_progress(self):
+        progress = {}
+        for process_id in self._background_process_ids or []:
+            res = AsyncResult(process_id)
+            if res.state == 'PROGRESS':
+                progress[process_id] = res.info
+        return progress
+
     def clear_processing(self):
         self._background_process_ids = []
         self.save(update_fields=['_background_process_ids'])
@@ -740,6 +794,8 @@ class ConceptContainerModel(VersionedModel):
 
         if is_processing:
             for process_id in self._background_process_ids:
+                if process_id.startswith(EXPORT_STITCH_TASK_ID_PREFIX):  # pending until all the shards are exported
+                    return True
                 res = AsyncResult(process_id)
                 task_name = res.name
                 if task_name and task_name.startswith('core.common.tasks.export_'):
@@ -836,16 +892,33 @@ class ConceptContainerModel(VersionedModel):
 
 
 class CelerySignalProcessor(RealTimeSignalProcessor):
+    @staticmethod
+    def record_save(instance):
+        for document in registry.get_documents([instance.__class__]):
+            BlueGreenIndexRebuilder.record_saves(document, [instance.id])
+
     def handle_save(self, sender, instance, **kwargs):
         if settings.ES_SYNC and instance.__class__ in registry.get_models() and instance.should_index:
+            self.record_save(instance)
             if get(settings, 'TEST_MODE', False):
                 handle_save(instance.app_name, instance.model_name, instance.id)
+            elif instance.should_buffer_index:
+                buffer_for_indexing(instance.app_name, instance.model_name, instance.id)
             else:
                 handle_save.delay(instance.app_name, instance.model_name, instance.id)
 
+    def handle_delete(self, sender, instance, **kwargs):
+        super().handle_delete(sender, instance, **kwargs)
+        if settings.ES_SYNC and instance.__class__ in registry.get_models():
+            for document in registry.get_documents([instance.__class__]):
+                BlueGreenIndexRebuilder.record_delete(document, instance.id)
+
     def handle_m2m_changed(self, sender, instance, action, **kwargs):
         if settings.ES_SYNC and instance.__class__ in registry.get_models() and instance.should_index:
+            self.record_save(instance)
             if get(settings, 'TEST_MODE', False):
                 handle_m2m_changed(instance.app_name, instance.model_name, instance.id, action)
+            elif instance.should_buffer_index and action in ('post_add', 'post_remove', 'post_clear'):
+                buffer_for_indexing(instance.app_name, instance.model_name, instance.id)
             else:
                 handle_m2m_changed.delay(instance.app_name, instance.model_name, instance.id, action)
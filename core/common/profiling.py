@@ -0,0 +1,176 @@
+import json
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.db import connections
+
+from core.common.constants import PROFILE_HEADER
+
+_current_profile = ContextVar('request_profile', default=None)
+_installed = False
+
+SQL_IN_LIST_REGEX = re.compile(r'\((?:%s, )+%s\)')
+SQL_NUMBER_REGEX = re.compile(r'\b\d+\b')
+SQL_STRING_REGEX = re.compile(r"'(?:[^']|'')*'")
+
+
+def get_sql_shape(sql):
+    """SQL with its literals and IN lists collapsed, so that the same query with other values counts as one."""
+    sql = SQL_STRING_REGEX.sub("'?'", sql)
+    sql = SQL_NUMBER_REGEX.sub('?', sql)
+    return SQL_IN_LIST_REGEX.sub('(%s, ...)', sql)
+
+
+class RequestProfile:
+    """
+    Counts and timings of the SQL queries, ES requests, Redis calls and serialization of a request.
+    Without detailed, SQL shapes and ES took are not kept.
+    """
+    def __init__(self, detailed=True):
+        self.detailed = detailed
+        self.start_time = time.time()
+        self.elapsed_seconds = 0
+        self.sql_count = 0
+        self.sql_time = 0
+        self.sql_shapes = Counter()
+        self.sql_shapes_time = Counter()
+        self.es_count = 0
+        self.es_took = 0
+        self.es_time = 0
+        self.redis_count = 0
+        self.serializer_time = 0
+        self.serializing = False
+
+    def sql_wrapper(self, execute, sql, params, many, context):  # pylint: disable=too-many-arguments
+        start_time = time.time()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.time() - start_time
+            self.sql_count += 1
+            self.sql_time += duration
+            if self.detailed:
+                shape = get_sql_shape(sql)
+                self.sql_shapes[shape] += 1
+                self.sql_shapes_time[shape] += duration
+
+    def record_es(self, duration, response):
+        self.es_count += 1
+        self.es_time += duration
+        if not self.detailed:  # parsing the response for took isn't free
+            return
+        try:
+            self.es_took += json.loads(response).get('took', 0)
+        except Exception:  # pylint: disable=broad-except
+            pass
+
+    def record_redis(self):
+        self.redis_count += 1
+
+    @contextmanager
+    def serialization(self):
+        if self.serializing:  # nested serializer, counted by the outermost
+            yield
+            return
+        self.serializing = True
+        start_time = time.time()
+        try:
+            yield
+        finally:
+            self.serializer_time += time.time() - start_time
+            self.serializing = False
+
+    def get_top_sql(self, count=5):
+        """The most repeated SQL shapes (executed more than once), with their count and total seconds."""
+        return [
+            dict(sql=shape, count=shape_count, seconds=round(self.sql_shapes_time[shape], 4))
+            for shape, shape_count in self.sql_shapes.most_common(count) if shape_count > 1
+        ]
+
+    def to_dict(self):
+        return dict(
+            elapsed_seconds=round(self.elapsed_seconds, 4), sql_count=self.sql_count,
+            sql_seconds=round(self.sql_time, 4), sql_top=self.get_top_sql(), es_count=self.es_count,
+            es_took_ms=self.es_took, es_seconds=round(self.es_time, 4), redis_count=self.redis_count,
+            serializer_seconds=round(self.serializer_time, 4)
+        )
+
+    def to_headers(self):
+        return {
+            f'{PROFILE_HEADER}-SQL-COUNT': self.sql_count,
+            f'{PROFILE_HEADER}-SQL-TIME': round(self.sql_time, 4),
+            f'{PROFILE_HEADER}-SQL-TOP': json.dumps([
+                dict(sql=sql['sql'][:200], count=sql['count'], seconds=sql['seconds']) for sql in self.get_top_sql()
+            ]),
+            f'{PROFILE_HEADER}-ES-COUNT': self.es_count,
+            f'{PROFILE_HEADER}-ES-TOOK': self.es_took,
+            f'{PROFILE_HEADER}-ES-TIME': round(self.es_time, 4),
+            f'{PROFILE_HEADER}-REDIS-COUNT': self.redis_count,
+            f'{PROFILE_HEADER}-SERIALIZER-TIME': round(self.serializer_time, 4),
+        }
+
+
+def get_current_profile():
+    return _current_profile.get()
+
+
+@contextmanager
+def profile_request(detailed=True):
+    """Profiles everything run in the block (on this thread/context), yields the RequestProfile."""
+    profile = RequestProfile(detailed)
+    token = _current_profile.set(profile)
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(profile.sql_wrapper))
+            yield profile
+    finally:
+        profile.elapsed_seconds = time.time() - profile.start_time
+        _current_profile.reset(token)
+
+
+def install_profiling():
+    """
+    Hooks ES (successful requests), Redis (commands) and DRF serializers (.data) to report to the current profile.
+    Done once per process, the hooks do nothing unless a request is being profiled.
+    """
+    global _installed  # pylint: disable=global-statement
+    if _installed:
+        return
+    _installed = True
+
+    from elasticsearch.connection.base import Connection
+    from redis import Redis
+    from rest_framework.serializers import BaseSerializer
+
+    log_request_success = Connection.log_request_success
+    execute_command = Redis.execute_command
+    data = BaseSerializer.data
+
+    def profiled_log_request_success(  # pylint: disable=too-many-arguments
+            self, method, full_url, path, body, status_code, response, duration
+    ):
+        profile = get_current_profile()
+        if profile:
+            profile.record_es(duration, response)
+        return log_request_success(self, method, full_url, path, body, status_code, response, duration)
+
+    def profiled_execute_command(self, *args, **options):
+        profile = get_current_profile()
+        if profile:
+            profile.record_redis()
+        return execute_command(self, *args, **options)
+
+    def profiled_data(self):
+        profile = get_current_profile()
+        if not profile:
+            return data.fget(self)
+        with profile.serialization():
+            return data.fget(self)
+
+    Connection.log_request_success = profiled_log_request_success
+    Redis.execute_command = profiled_execute_command
+    BaseSerializer.data = property(profiled_data)
@@ -17,6 +17,13 @@ class TaskSerializer(Serializer):  # pylint: disable=abstract-method
     pass
 
 
+class ESNativeListSerializer(Serializer):  # pylint: disable=abstract-method
+    """Renders search hits from the list payload stored in the index, without touching the database."""
+
+    def to_representation(self, instance):
+        return instance.list_payload.to_dict()
+
+
 class ReadSerializerMixin:
     """ Mixin for serializer which does not update or create resources. """
 
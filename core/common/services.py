@@ -1,4 +1,5 @@
 import base64
+import io
 import json
 
 import boto3
@@ -27,7 +28,22 @@ class S3:
         """Uploads file object"""
         read_directive = 'rb' if binary else 'r'
         file_path = file_path if file_path else key
-        return cls._upload(key, open(file_path, read_directive).read(), headers, metadata)
+        with open(file_path, read_directive) as file:
+            return cls._upload(key, file, headers, metadata)
+
+    @classmethod
+    def multipart_writer(cls, key, metadata=None):
+        """Returns a writable (non-seekable) stream that uploads to key in parts while being written"""
+        return S3MultipartWriter(cls._conn(), settings.AWS_STORAGE_BUCKET_NAME, key, metadata)
+
+    @classmethod
+    def read_stream(cls, key, chunk_size=1024 * 1024, start=0, end=None):
+        """Yields the object content (or its [start, end) byte range) in chunks without loading it in memory"""
+        kwargs = {}
+        if start or end is not None:
+            kwargs['Range'] = f'bytes={start}-{"" if end is None else end - 1}'
+        response = cls._conn().get_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=key, **kwargs)
+        yield from response['Body'].iter_chunks(chunk_size)
 
     @classmethod
     def upload_base64(  # pylint: disable=too-many-arguments,inconsistent-return-statements
@@ -181,6 +197,64 @@ class S3:
         return cls._session().resource('s3')
 
 
+class S3MultipartWriter(io.RawIOBase):
+    """
+    File-like writer backed by an S3 multipart upload. Buffers at most one part in memory,
+    completes the upload on close and aborts it if closed after a failure.
+    """
+    PART_SIZE = 8 * 1024 * 1024  # S3 minimum is 5MB for all but the last part
+
+    def __init__(self, client, bucket, key, metadata=None):
+        super().__init__()
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.buffer = bytearray()
+        self.parts = []
+        self.upload_id = self.client.create_multipart_upload(
+            Bucket=bucket, Key=key, **(metadata or {}))['UploadId']
+
+    def writable(self):
+        return True
+
+    def write(self, data):  # pylint: disable=arguments-renamed
+        self.buffer.extend(data)
+        while len(self.buffer) >= self.PART_SIZE:
+            self._upload_part(bytes(self.buffer[:self.PART_SIZE]))
+            del self.buffer[:self.PART_SIZE]
+        return len(data)
+
+    def _upload_part(self, body):
+        part_number = len(self.parts) + 1
+        response = self.client.upload_part(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id, PartNumber=part_number, Body=body)
+        self.parts.append(dict(ETag=response['ETag'], PartNumber=part_number))
+
+    def abort(self):
+        if self.upload_id:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+            self.upload_id = None
+        super().close()
+
+    def close(self):
+        if self.closed:
+            return
+        if self.upload_id:
+            if self.buffer or not self.parts:
+                self._upload_part(bytes(self.buffer))
+                self.buffer = bytearray()
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self.upload_id, MultipartUpload=dict(Parts=self.parts))
+            self.upload_id = None
+        super().close()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type:
+            self.abort()
+        else:
+            self.close()
+
+
 class RedisService:  # pragma: no cover
     def __init__(self):
         self.conn = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB)
@@ -215,6 +289,24 @@ class RedisService:  # pragma: no cover
     def get_int(self, key):
         return int(self.conn.get(key).decode('utf-8'))
 
+    def delete(self, *keys):
+        return self.conn.delete(*keys)
+
+    def set_if_not_exists(self, key, val, ttl=None):
+        return self.conn.set(key, val, nx=True, ex=ttl)
+
+    def add_to_set(self, key, *values):
+        return self.conn.sadd(key, *values)
+
+    def pop_from_set(self, key, count):
+        return self.conn.spop(key, count)
+
+    def push_to_list(self, key, *values):
+        return self.conn.rpush(key, *values)
+
+    def pop_from_list(self, key, timeout):
+        return self.conn.blpop(key, timeout=timeout)
+
 
 class PostgresQL:
     @staticmethod
@@ -239,6 +331,14 @@ class PostgresQL:
             cursor.execute(f"SELECT nextval('{seq_name}');")
             return cursor.fetchone()[0]
 
+    @staticmethod
+    def next_ids(table, count):
+        """Reserves count ids from the table's id sequence, e.g. to bulk insert rows referring to each other."""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT nextval(pg_get_serial_sequence('{table}', 'id')) FROM generate_series(1, {int(count)});")
+            return [row[0] for row in cursor.fetchall()]
+
     @staticmethod
     def last_value(seq_name):
         with connection.cursor() as cursor:
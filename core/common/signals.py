@@ -1,6 +1,13 @@
-from django.db.models.signals import pre_save, post_save
+import time
+
+from celery.signals import task_prerun, task_postrun, task_failure, worker_process_shutdown
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, m2m_changed
 from django.dispatch import receiver
 
+from core.collections.models import Expansion
+from core.common.caching import invalidate_expansion_cache
+from core.common.metrics import is_timed_task, record_task, record_task_failure, metrics
 from core.common.models import BaseModel
 from core.orgs.models import Organization
 from core.users.models import UserProfile
@@ -29,3 +36,38 @@ def propagate_owner_status(sender, instance=None, created=False, **kwargs):  # p
         if updated_collections:
             from core.collections.documents import CollectionDocument
             instance.batch_index(instance.collection_set, CollectionDocument)
+
+
+@receiver(m2m_changed, sender=Expansion.concepts.through)
+@receiver(m2m_changed, sender=Expansion.mappings.through)
+def invalidate_expansion_members_cache(instance=None, action=None, **kwargs):
+    if not kwargs.get('reverse') and instance and action in ['post_add', 'post_remove', 'post_clear']:
+        transaction.on_commit(lambda: invalidate_expansion_cache(instance))
+
+
+_task_start_times = {}
+
+
+@task_prerun.connect
+def start_task_timer(task_id=None, task=None, **kwargs):  # pylint: disable=unused-argument
+    if task and is_timed_task(task.name):
+        _task_start_times[task_id] = time.time()
+
+
+@task_postrun.connect
+def record_task_runtime(task_id=None, task=None, **kwargs):  # pylint: disable=unused-argument
+    start_time = _task_start_times.pop(task_id, None)
+    if task and start_time:
+        record_task(task.name, time.time() - start_time)
+    metrics.flush_if_due()
+
+
+@task_failure.connect
+def record_failed_task(sender=None, **kwargs):  # pylint: disable=unused-argument
+    if sender:
+        record_task_failure(sender.name)
+
+
+@worker_process_shutdown.connect
+def flush_metrics(**kwargs):  # pylint: disable=unused-argument
+    metrics.flush()
@@ -20,6 +20,14 @@ compress_header = openapi.Parameter(
 # QUERY PARAMS
 q_param = openapi.Parameter('q', openapi.IN_QUERY, description="search text", type=openapi.TYPE_STRING)
 page_param = openapi.Parameter('page', openapi.IN_QUERY, description="page number", type=openapi.TYPE_INTEGER)
+cursor_param = openapi.Parameter(
+    'cursor', openapi.IN_QUERY, description="true to start cursor pagination, then the cursor from the next header",
+    type=openapi.TYPE_STRING
+)
+stream_param = openapi.Parameter(
+    'stream', openapi.IN_QUERY, description="Stream all search results as NDJSON", type=openapi.TYPE_BOOLEAN,
+    default=False
+)
 exact_match_param = openapi.Parameter(
     'exact_match', openapi.IN_QUERY, description="on | off (no wildcards)", type=openapi.TYPE_STRING, default='off'
 )
@@ -99,6 +107,11 @@ file_url_param = openapi.Parameter(
 apps_param = openapi.Parameter(
     'apps', openapi.IN_FORM, description="App Names (comma separated)", type=openapi.TYPE_STRING
 )
+zero_downtime_param = openapi.Parameter(
+    'zero_downtime', openapi.IN_FORM,
+    description="Build new indexes and swap aliases instead of dropping the existing ones", type=openapi.TYPE_BOOLEAN,
+    default=False
+)
 ids_param = openapi.Parameter(
     'ids', openapi.IN_FORM, description="Resource Ids", type=openapi.TYPE_STRING
 )
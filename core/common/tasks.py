@@ -1,6 +1,8 @@
+import uuid
 from json import JSONDecodeError
 
 from billiard.exceptions import WorkerLostError
+from celery import chord
 from celery.utils.log import get_task_logger
 from celery_once import QueueOnce
 from django.apps import apps
@@ -13,12 +15,26 @@ from django_elasticsearch_dsl.registries import registry
 from pydash import get
 
 from core.celery import app
-from core.common.constants import CONFIRM_EMAIL_ADDRESS_MAIL_SUBJECT, PASSWORD_RESET_MAIL_SUBJECT
-from core.common.utils import write_export_file, web_url, get_resource_class_from_resource_name, get_export_service
+from core.common.constants import CONFIRM_EMAIL_ADDRESS_MAIL_SUBJECT, PASSWORD_RESET_MAIL_SUBJECT, \
+    EXPORT_SHARDING_THRESHOLD, INDEX_BUFFER_KEY_PREFIX, INDEX_BUFFER_DRAIN_SCHEDULED_KEY, EXPORT_STITCH_TASK_ID_PREFIX
+from core.common.documents import BlueGreenIndexRebuilder
+from core.common.services import RedisService
+from core.common.utils import write_export_file, web_url, get_resource_class_from_resource_name, get_export_service, \
+    get_export_shards, write_export_shard, stitch_export_shards, get_export_shards_path, get_import_lock_content
 
 logger = get_task_logger(__name__)
 
 
+class ImportQueueOnce(QueueOnce):  # pylint: disable=abstract-method
+    """QueueOnce locking imports of stored files on the content hash instead of the file reference."""
+
+    def get_key(self, args=None, kwargs=None):
+        return super().get_key(
+            [get_import_lock_content(arg) for arg in args or []],
+            {name: get_import_lock_content(value) for name, value in (kwargs or {}).items()}
+        )
+
+
 @app.task(base=QueueOnce)
 def delete_organization(org_id):
     from core.orgs.models import Organization
@@ -82,8 +98,86 @@ def delete_collection(collection_id):
         return ex
 
 
+def __task_progress_reporter(task):
+    """
+    Progress (exports, index rebuilds) is published as the task's PROGRESS meta, so it can be looked up
+    via the task id, e.g. the ids in a version's processing flag.
+    """
+    if not task.request.id:
+        return None
+
+    def report(meta):
+        task.update_state(state='PROGRESS', meta=meta)
+
+    return report
+
+
+def __should_shard_export(version, sharded):
+    if sharded is not None:
+        return sharded
+    return (version.active_concepts or 0) + (version.active_mappings or 0) > EXPORT_SHARDING_THRESHOLD
+
+
+def __queue_sharded_export(version, resource_type, resource_serializer_type):
+    """
+    Serializes id-range shards in parallel (concurrent queue) and stitches them into the export once all are done.
+    The stitching task is added to the version's processing flag, its id prefix marks the version as exporting
+    while it waits for the shards. If a shard or the stitching fails, export_shards_failed cleans up.
+    """
+    shards = get_export_shards(version, resource_type)
+    logger.info('Exporting %s version %s in %d shards...', resource_type, version.version, len(shards))
+    stitch_task_id = f'{EXPORT_STITCH_TASK_ID_PREFIX}{uuid.uuid4()}'
+    stitch = export_stitch_shards.s(version.id, resource_type, resource_serializer_type).set(task_id=stitch_task_id)
+    stitch.link_error(export_shards_failed.si(version.id, resource_type, stitch_task_id))
+    result = chord(
+        export_shard.s(version.id, resource_type, *shard).set(queue='concurrent') for shard in shards
+    )(stitch)
+    version.add_processing(result.id)
+
+
+@app.task(
+    autoretry_for=(WorkerLostError, ), retry_kwargs={'max_retries': 2, 'countdown': 2}, acks_late=True,
+    reject_on_worker_lost=True
+)
+def export_shard(version_id, resource_type, child, min_id, max_id):  # pylint: disable=too-many-arguments
+    version = get_resource_class_from_resource_name(resource_type).objects.filter(id=version_id).first()
+    logger.info('Serializing %s %s-%s of %s version %s...', child, min_id, max_id, resource_type, version_id)
+    return write_export_shard(version, resource_type, child, min_id, max_id, logger)
+
+
+@app.task(bind=True)
+def export_stitch_shards(self, shards, version_id, resource_type, resource_serializer_type):  # pylint: disable=too-many-arguments
+    version = get_resource_class_from_resource_name(resource_type).objects.filter(id=version_id).select_related(
+        'organization', 'user'
+    ).first()
+
+    if not version:  # pragma: no cover
+        logger.info('Not found %s version %s', resource_type, version_id)
+        return
+
+    try:
+        stitch_export_shards(version, resource_type, resource_serializer_type, shards, logger)
+        logger.info('Export complete!')
+    finally:
+        version.remove_processing(self.request.id)
+
+
+@app.task
+def export_shards_failed(version_id, resource_type, stitch_task_id):
+    """Error callback of a sharded export, removes the uploaded shards and the export from the processing flag."""
+    version = get_resource_class_from_resource_name(resource_type).objects.filter(id=version_id).first()
+
+    if not version:  # pragma: no cover
+        logger.info('Not found %s version %s', resource_type, version_id)
+        return
+
+    logger.info('Sharded export of %s version %s failed, removing its shards...', resource_type, version.version)
+    get_export_service().delete_objects(get_export_shards_path(version))
+    version.remove_processing(stitch_task_id)
+
+
 @app.task(base=QueueOnce, bind=True)
-def export_source(self, version_id):
+def export_source(self, version_id, sharded=None):
     from core.sources.models import Source
     logger.info('Finding source version...')
 
@@ -98,14 +192,20 @@ def export_source(self, version_id):
     version.add_processing(self.request.id)
     try:
         logger.info('Found source version %s.  Beginning export...', version.version)
-        write_export_file(version, 'source', 'core.sources.serializers.SourceVersionExportSerializer', logger)
+        if __should_shard_export(version, sharded):
+            __queue_sharded_export(version, 'source', 'core.sources.serializers.SourceVersionExportSerializer')
+            return
+        write_export_file(
+            version, 'source', 'core.sources.serializers.SourceVersionExportSerializer', logger,
+            __task_progress_reporter(self)
+        )
         logger.info('Export complete!')
     finally:
         version.remove_processing(self.request.id)
 
 
 @app.task(base=QueueOnce, bind=True)
-def export_collection(self, version_id):
+def export_collection(self, version_id, sharded=None):
     from core.collections.models import Collection
     logger.info('Finding collection version...')
 
@@ -123,8 +223,13 @@ def export_collection(self, version_id):
         version.expansion.wait_until_processed()
     try:
         logger.info('Found collection version %s.  Beginning export...', version.version)
+        if __should_shard_export(version, sharded):
+            __queue_sharded_export(
+                version, 'collection', 'core.collections.serializers.CollectionVersionExportSerializer')
+            return
         write_export_file(
-            version, 'collection', 'core.collections.serializers.CollectionVersionExportSerializer', logger
+            version, 'collection', 'core.collections.serializers.CollectionVersionExportSerializer', logger,
+            __task_progress_reporter(self)
         )
         logger.info('Export complete!')
     finally:
@@ -196,6 +301,44 @@ def handle_m2m_changed(app_name, model_name, instance_id, action):
             __handle_pre_delete(instance)
 
 
+def buffer_for_indexing(app_name, model_name, instance_id):
+    """
+    Collects the instance id in a Redis set (which de-duplicates repeated saves) and schedules a single
+    drain_index_buffer unless one is already waiting to start.
+    """
+    redis_service = RedisService()
+    redis_service.add_to_set(f'{INDEX_BUFFER_KEY_PREFIX}{app_name}.{model_name}', instance_id)
+    schedule_index_buffer_drain(redis_service, settings.ES_INDEX_BUFFER_DELAY)
+
+
+def schedule_index_buffer_drain(redis_service, countdown):
+    if redis_service.set_if_not_exists(INDEX_BUFFER_DRAIN_SCHEDULED_KEY, 1, ttl=max(60, 2 * countdown)):
+        drain_index_buffer.apply_async(countdown=countdown)
+
+
+@app.task(ignore_result=True, acks_late=True, reject_on_worker_lost=True)
+def drain_index_buffer():
+    redis_service = RedisService()
+    # cleared before draining, so saves buffered from now on schedule the next drain
+    redis_service.delete(INDEX_BUFFER_DRAIN_SCHEDULED_KEY)
+
+    for key in redis_service.keys(f'{INDEX_BUFFER_KEY_PREFIX}*'):
+        key = key.decode() if isinstance(key, bytes) else key
+        app_name, model_name = key.replace(INDEX_BUFFER_KEY_PREFIX, '').split('.')
+        model = apps.get_model(app_name, model_name)
+        ids = redis_service.pop_from_set(key, settings.ES_INDEX_BUFFER_BATCH_SIZE)
+        while ids:
+            try:
+                model.index_ids([int(_id) for _id in ids])
+            except Exception:
+                # kept for the next drain, scheduled here since no other save may come to schedule it
+                redis_service.add_to_set(key, *ids)
+                schedule_index_buffer_drain(redis_service, settings.ES_INDEX_BUFFER_RETRY_DELAY)
+                raise
+            logger.info('Indexed %d %s', len(ids), model_name)
+            ids = redis_service.pop_from_set(key, settings.ES_INDEX_BUFFER_BATCH_SIZE)
+
+
 @app.task(ignore_result=True)
 def handle_pre_delete(app_name, model_name, instance_id):
     __handle_pre_delete(apps.get_model(app_name, model_name).objects.filter(id=instance_id).first())
@@ -206,9 +349,43 @@ def populate_indexes(app_names=None):  # app_names has to be an iterable of stri
     __run_search_index_command('--populate', app_names)
 
 
-@app.task(base=QueueOnce)
-def rebuild_indexes(app_names=None):  # app_names has to be an iterable of strings
-    __run_search_index_command('--rebuild', app_names)
+@app.task(base=QueueOnce, bind=True)
+def rebuild_indexes(self, app_names=None, zero_downtime=False):  # app_names has to be an iterable of strings
+    """
+    Drops and rebuilds the indexes, or with zero_downtime rebuilds them into new indexes behind aliases.
+    An index that is already an alias (rebuilt with zero_downtime before) is always rebuilt that way,
+    search_index --rebuild can't delete or create an index through an alias.
+    """
+    documents = __get_documents(app_names)
+    if not zero_downtime:
+        aliased = [document for document in documents if BlueGreenIndexRebuilder.is_alias(document)]
+        if not aliased:
+            __run_search_index_command('--rebuild', app_names)
+            return None
+        others = [document for document in documents if document not in aliased]
+        if others:
+            labels = [document.django.model._meta.label for document in others]  # pylint: disable=protected-access
+            __run_search_index_command('--rebuild', labels)
+        documents = aliased
+
+    progress = __task_progress_reporter(self)
+    indexes = []
+    for document in documents:
+        logger.info('Rebuilding %s into a new index...', document._index._name)  # pylint: disable=protected-access
+        indexes.append(BlueGreenIndexRebuilder(document, progress).run())
+    logger.info('Rebuilt indexes %s', indexes)
+    return indexes
+
+
+def __get_documents(app_names=None):
+    documents = registry.get_documents()
+    if not app_names:
+        return documents
+    return [
+        document for document in documents if
+        document.django.model._meta.app_label in app_names or  # pylint: disable=protected-access
+        document.django.model._meta.label in app_names  # pylint: disable=protected-access
+    ]
 
 
 def __run_search_index_command(command, app_names=None):
@@ -221,31 +398,39 @@ def __run_search_index_command(command, app_names=None):
         call_command('search_index', command, '-f', '--parallel')
 
 
-@app.task(base=QueueOnce)
+@app.task(base=ImportQueueOnce)
 def bulk_import(to_import, username, update_if_exists):
     from core.importers.models import BulkImport
     return BulkImport(content=to_import, username=username, update_if_exists=update_if_exists).run()
 
 
-@app.task(base=QueueOnce, bind=True)
+@app.task(base=ImportQueueOnce, bind=True)
 def bulk_import_parallel_inline(self, to_import, username, update_if_exists, threads=5):
-    from core.importers.models import BulkImportParallelRunner
+    from core.importers.models import BulkImportParallelRunner, ImportFile
     try:
-        importer = BulkImportParallelRunner(
-            content=to_import, username=username, update_if_exists=update_if_exists,
-            parallel=threads, self_task_id=self.request.id
-        )
-    except JSONDecodeError as ex:
-        return dict(error=f"Invalid JSON ({ex.msg})")
-    except ValidationError as ex:
-        return dict(error=f"Invalid Input ({ex.message})")
-    return importer.run()
+        try:
+            importer = BulkImportParallelRunner(
+                content=to_import, username=username, update_if_exists=update_if_exists,
+                parallel=threads, self_task_id=self.request.id
+            )
+        except JSONDecodeError as ex:
+            return dict(error=f"Invalid JSON ({ex.msg})")
+        except ValidationError as ex:
+            return dict(error=f"Invalid Input ({ex.message})")
+        return importer.run()
+    finally:
+        if ImportFile.is_reference(to_import):
+            ImportFile.from_reference(to_import).remove()
 
 
-@app.task(base=QueueOnce)
+@app.task(base=ImportQueueOnce)
 def bulk_import_inline(to_import, username, update_if_exists):
-    from core.importers.models import BulkImportInline
-    return BulkImportInline(content=to_import, username=username, update_if_exists=update_if_exists).run()
+    from core.importers.models import BulkImportInline, ImportFile
+    try:
+        return BulkImportInline(content=to_import, username=username, update_if_exists=update_if_exists).run()
+    finally:
+        if ImportFile.is_reference(to_import):
+            ImportFile.from_reference(to_import).remove()
 
 
 @app.task(bind=True)
@@ -257,6 +442,12 @@ def bulk_import_parts_inline(self, input_list, username, update_if_exists):
     ).run()
 
 
+@app.task
+def bulk_import_part_done(_, key, index):
+    """Chord callback of a bulk import part, wakes up the runner waiting on the key."""
+    RedisService().push_to_list(key, index)
+
+
 @app.task
 def send_user_verification_email(user_id):
     from core.users.models import UserProfile
@@ -330,6 +521,10 @@ def seed_children_to_new_version(self, resource, obj_id, export=True, sync=False
             elif autoexpand:
                 instance.cascade_children_to_expansion(index=index, sync=sync)
 
+            if settings.TERMINOLOGY_INDEX_ENABLED and instance.canonical_url:
+                from core.common.terminology import get_terminology_index
+                get_terminology_index(instance)  # warms the $validate-code/$lookup index of the new version
+
             if export:
                 export_task.delay(obj_id)
                 if autoexpand:
@@ -377,8 +572,9 @@ def process_hierarchy_for_new_concept(concept_id, initial_version_id, parent_con
       Executed when a new concept is created with parent_concept_urls and does following:
       1. Associates parent concepts to the concept and concept latest (initial) version
       2. Creates new versions for parent concept (if asked)
+      3. Refreshes the hierarchy closure of the concept
     """
-    from core.concepts.models import Concept
+    from core.concepts.models import Concept, ConceptHierarchyClosure
     concept = Concept.objects.filter(id=concept_id).first()
 
     initial_version = None
@@ -393,6 +589,8 @@ def process_hierarchy_for_new_concept(concept_id, initial_version_id, parent_con
         initial_version._parent_concepts = parent_concepts  # pylint: disable=protected-access
         initial_version.set_parent_concepts_from_uris(create_parent_version=False)
 
+    ConceptHierarchyClosure.refresh([concept.versioned_object_id])
+
 
 @app.task(
     ignore_result=True, autoretry_for=(Exception, WorkerLostError, ), retry_kwargs={'max_retries': 2, 'countdown': 2},
@@ -405,8 +603,9 @@ def process_hierarchy_for_concept_version(
       1. Associates parent concepts to the latest concept version.
       2. Creates new versions for removed parent concepts from previous versions.
       3. Creates new versions for parent concept (if asked)
+      4. Refreshes the hierarchy closure of the concept and its descendants
     """
-    from core.concepts.models import Concept
+    from core.concepts.models import Concept, ConceptHierarchyClosure
     latest_version = Concept.objects.filter(id=latest_version_id).first()
 
     prev_version = None
@@ -427,6 +626,8 @@ def process_hierarchy_for_concept_version(
         ]
         latest_version.create_new_versions_for_removed_parents(removed_parent_urls)
 
+    ConceptHierarchyClosure.refresh([latest_version.versioned_object_id])
+
 
 @app.task(
     ignore_result=True, autoretry_for=(Exception, WorkerLostError, ), retry_kwargs={'max_retries': 2, 'countdown': 2},
@@ -550,10 +751,23 @@ def index_expansion_mappings(expansion_id):
         expansion.batch_index(expansion.mappings, MappingDocument)
 
 
+@app.task(
+    ignore_result=True, autoretry_for=(Exception, WorkerLostError, ), retry_kwargs={'max_retries': 2, 'countdown': 2},
+    acks_late=True, reject_on_worker_lost=True
+)
+def index_concept_mappings(concept_id):
+    from core.concepts.models import Concept
+    concept = Concept.objects.filter(id=concept_id).first()
+    if concept:
+        from core.mappings.documents import MappingDocument
+        concept.batch_index(concept.get_all_bidirectional_mappings(), MappingDocument)
+
+
 @app.task
 def make_hierarchy(concept_map):  # pragma: no cover
-    from core.concepts.models import Concept
+    from core.concepts.models import Concept, ConceptHierarchyClosure
 
+    child_ids = set()
     for parent_concept_uri, child_concept_urls in concept_map.items():
         parent_concept = Concept.objects.filter(uri=parent_concept_uri).first()
         if parent_concept:
@@ -561,6 +775,7 @@ def make_hierarchy(concept_map):  # pragma: no cover
             if parent_latest:
                 for child_concept in Concept.objects.filter(uri__in=child_concept_urls):
                     child_concept.parent_concepts.add(parent_latest)
+                    child_ids.add(child_concept.versioned_object_id)
                     child_latest = child_concept.get_latest_version()
                     if child_latest:
                         child_latest.parent_concepts.add(parent_latest)
@@ -572,6 +787,8 @@ def make_hierarchy(concept_map):  # pragma: no cover
         else:
             logger.info('Could not find parent %s', parent_concept_uri)
 
+    ConceptHierarchyClosure.refresh(child_ids)
+
 
 @app.task(
     ignore_result=True, autoretry_for=(Exception, WorkerLostError, ), retry_kwargs={'max_retries': 2, 'countdown': 2},
@@ -582,7 +799,7 @@ def index_source_concepts(source_id):
     source = Source.objects.filter(id=source_id).first()
     if source:
         from core.concepts.documents import ConceptDocument
-        source.batch_index(source.concepts, ConceptDocument)
+        source.batch_index(source.concepts, ConceptDocument, checkpoint_key=f'{source.uri}concepts')
 
 
 @app.task(
@@ -594,7 +811,7 @@ def index_source_mappings(source_id):
     source = Source.objects.filter(id=source_id).first()
     if source:
         from core.mappings.documents import MappingDocument
-        source.batch_index(source.mappings, MappingDocument)
+        source.batch_index(source.mappings, MappingDocument, checkpoint_key=f'{source.uri}mappings')
 
 
 @app.task
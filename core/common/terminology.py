@@ -0,0 +1,174 @@
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from pydash import get
+
+from core.common.caching import get_generations, get_repo_cache_namespace_from_uri, get_repo_version_cache_namespace
+from core.common.constants import HEAD
+from core.common.permissions import CanViewConceptDictionary
+
+TERMINOLOGY_INDEX_CACHE_PREFIX = 'terminology_index'
+INVALID_CODE_MESSAGE = 'The code is incorrect.'
+LOCAL_TERMINOLOGY_INDEXES = OrderedDict()
+RESOLVED_REPO_VERSIONS = {}
+
+
+class TerminologyIndex:
+    """
+    Codes of a (not HEAD) repo version. A source version maps code to (concept ids, name, display name, retired),
+    name/display name/retired of its latest concept version, a collection version maps `system|code` (canonical
+    url of the concept's source) to the ids of the concept versions it references.
+    """
+    def __init__(self, entries):
+        self.entries = entries
+
+    def get(self, code):
+        return self.entries.get(code)
+
+    @classmethod
+    def build(cls, repo_version):
+        from core.concepts.models import Concept, LocalizedText
+        if repo_version.__class__.__name__ == 'Collection':
+            entries = {}
+            for concept_id, code, system in Concept.objects.filter(
+                    references__collection=repo_version, parent__canonical_url__isnull=False
+            ).values_list('id', 'mnemonic', 'parent__canonical_url').distinct():
+                key = f'{system}|{code}'
+                entries[key] = (*entries.get(key, ()), concept_id)
+            return cls(entries)
+
+        concepts = list(Concept.objects.filter(sources=repo_version).values_list('id', 'mnemonic', 'name', 'retired'))
+        names = LocalizedText.get_preferred_names([concept[0] for concept in concepts])
+        entries = {}
+        for concept_id, code, name, retired in sorted(concepts):
+            preferred_name = names.get(concept_id)
+            entries[code] = (
+                (*get(entries, [code, 0], ()), concept_id), name, preferred_name.name if preferred_name else None,
+                retired
+            )
+        return cls(entries)
+
+
+def get_terminology_index(repo_version):
+    """Returns the cached index of a repo version, building and caching it on a miss."""
+    namespace = get_repo_cache_namespace_from_uri(repo_version.uri)
+    generations = get_generations(namespace, get_repo_version_cache_namespace(namespace, repo_version.version))
+    key = f"{TERMINOLOGY_INDEX_CACHE_PREFIX}:{repo_version.__class__.__name__}:{repo_version.id}:{generations}"
+    index = LOCAL_TERMINOLOGY_INDEXES.get(key)
+    if index is None:
+        index = cache.get(key)
+        if index is None:
+            index = TerminologyIndex.build(repo_version)
+            cache.set(key, index, settings.TERMINOLOGY_INDEX_CACHE_TTL)
+        LOCAL_TERMINOLOGY_INDEXES[key] = index
+        while len(LOCAL_TERMINOLOGY_INDEXES) > settings.TERMINOLOGY_INDEX_LOCAL_CACHE_SIZE:
+            LOCAL_TERMINOLOGY_INDEXES.popitem(last=False)
+    else:
+        LOCAL_TERMINOLOGY_INDEXES.move_to_end(key)
+    return index
+
+
+def resolve_repo_versions(model, canonical_url, version=None):
+    """
+    The given (or else the latest) not HEAD versions of the sources/collections with the canonical url.
+    Kept in process for TERMINOLOGY_RESOLVE_TTL seconds, so a new latest version or an access change is seen
+    after that at most.
+    """
+    key = (model.__name__, canonical_url, version)
+    resolved_at, repo_versions = RESOLVED_REPO_VERSIONS.get(key, (0, None))
+    if time.time() - resolved_at > settings.TERMINOLOGY_RESOLVE_TTL:
+        queryset = model.objects.filter(canonical_url=canonical_url).exclude(version=HEAD)
+        queryset = queryset.filter(version=version) if version else queryset.filter(is_latest_version=True)
+        repo_versions = list(queryset.order_by('id'))
+        if len(RESOLVED_REPO_VERSIONS) >= settings.TERMINOLOGY_RESOLVE_CACHE_SIZE:
+            RESOLVED_REPO_VERSIONS.clear()
+        RESOLVED_REPO_VERSIONS[key] = (time.time(), repo_versions)
+    return repo_versions
+
+
+class TerminologyService:
+    """
+    $lookup and $validate-code of codes in released CodeSystems (source versions) and ValueSets (references of
+    collection versions) through their terminology indexes, without building concept querysets.
+    Repo versions and indexes are kept for the life of the service, so a batch resolves each system/version once.
+    """
+    def __init__(self, request):
+        self.request = request
+        self.repo_versions = {}
+        self.indexes = {}
+
+    def can_view(self, repo_version):
+        return CanViewConceptDictionary().has_object_permission(self.request, None, repo_version)
+
+    def get_repo_version(self, model, canonical_url, version=None):
+        """The first of the resolved repo versions the user can view, or None."""
+        key = (model.__name__, canonical_url, version)
+        if key not in self.repo_versions:
+            self.repo_versions[key] = next(
+                (repo_version for repo_version in resolve_repo_versions(model, canonical_url, version)
+                 if self.can_view(repo_version)), None)
+        return self.repo_versions[key]
+
+    def get_index(self, repo_version):
+        key = (repo_version.__class__.__name__, repo_version.id)
+        if key not in self.indexes:
+            self.indexes[key] = get_terminology_index(repo_version)
+        return self.indexes[key]
+
+    def lookup(self, system, code, version=None):
+        """Returns the source version and the (concept ids, name, display name, retired) of the code, or Nones."""
+        from core.sources.models import Source
+        source = self.get_repo_version(Source, system, version)
+        if not source:
+            return None, None
+        return source, self.get_index(source).get(code)
+
+    @staticmethod
+    def get_validation(entry, display=None):
+        if not entry or (display and display not in entry[1:3]):
+            return dict(result=False, message=INVALID_CODE_MESSAGE)
+        _, name, display_name, retired = entry
+        return dict(result=True, display=name or display_name, inactive=bool(retired))
+
+    def validate_code(self, system, code, version=None, display=None):
+        return self.get_validation(self.lookup(system, code, version)[1], display)
+
+    def validate_value_set_code(  # pylint: disable=too-many-arguments
+            self, url, system, code, system_version=None, display=None
+    ):
+        from core.collections.models import Collection
+        collection = self.get_repo_version(Collection, url)
+        entry = None
+        if collection:
+            entry = self.lookup(system, code, system_version)[1]
+            if entry and not set(entry[0]) & set(self.get_index(collection).get(f'{system}|{code}') or ()):
+                entry = None
+        return self.get_validation(entry, display)
+
+    def validate_codings(self, codings, url=None):
+        """Validates codings in a CodeSystem or, with url, a ValueSet. One `validation` parameter per coding."""
+        results = []
+        for coding in codings:
+            system, code, version, display = coding['system'], coding['code'], coding.get('version'), coding.get(
+                'display')
+            if url:
+                validation = self.validate_value_set_code(url, system, code, version, display)
+            else:
+                validation = self.validate_code(system, code, version, display)
+            results.append({'name': 'validation', 'part': get_validation_parameters(validation, coding)})
+        return results
+
+
+def get_validation_parameters(validation, coding=None):
+    """Parameters of a validation, with the validated coding for a part of a batch $validate-code."""
+    parameters = [{'name': 'coding', 'valueCoding': coding}] if coding else []
+    parameters.append({'name': 'result', 'valueBoolean': validation['result']})
+    if 'message' in validation:
+        parameters.append({'name': 'message', 'valueString': validation['message']})
+    elif coding:
+        if validation['display']:
+            parameters.append({'name': 'display', 'valueString': validation['display']})
+        parameters.append({'name': 'inactive', 'valueBoolean': validation['inactive']})
+    return parameters
@@ -1,30 +1,44 @@
 import base64
+import io
+import json
 import os
 import uuid
-from unittest.mock import patch, Mock, mock_open
+import zipfile
+from unittest.mock import patch, Mock, mock_open, MagicMock, PropertyMock
 
 import boto3
 from botocore.exceptions import ClientError
 from colour_runner.django_runner import ColourRunnerMixin
 from django.conf import settings
+from django.core.cache import cache
 from django.core.files.base import ContentFile, File
 from django.core.management import call_command
-from django.test import TestCase
+from django.http import QueryDict
+from django.test import TestCase, override_settings
 from django.test.runner import DiscoverRunner
+from elasticsearch_dsl.utils import AttrDict
 from moto import mock_s3
 from requests.auth import HTTPBasicAuth
 from rest_framework.test import APITestCase
 
 from core.collections.models import CollectionReference
-from core.common.constants import HEAD
-from core.common.tasks import delete_s3_objects, bulk_import_parallel_inline
+from core.common.benchmarks import SyntheticDataset, BenchmarkSuite
+from core.common.caching import (
+    get_repo_cache_namespace_from_uri, get_repo_version_cache_namespace, get_repo_cache_namespace, bump_generation,
+    get_generations, invalidate_repo_version_cache)
+from core.common.constants import HEAD, INCLUDE_FACETS, ACCESS_TYPE_VIEW, ACCESS_TYPE_NONE
+from core.common.documents import BlueGreenIndexRebuilder
+from core.common.exceptions import Http400
+from core.common.metrics import Metrics, get_sample_key, is_timed_task, metrics
+from core.common.profiling import get_sql_shape, get_current_profile, profile_request
+from core.common.tasks import delete_s3_objects, bulk_import_parallel_inline, buffer_for_indexing, drain_index_buffer
 from core.common.utils import (
     compact_dict_by_values, to_snake_case, flower_get, task_exists, parse_bulk_import_task_id,
     to_camel_case,
     drop_version, is_versioned_uri, separate_version, to_parent_uri, jsonify_safe, es_get,
     get_resource_class_from_resource_name, flatten_dict, is_csv_file, is_url_encoded_string, to_parent_uri_from_kwargs,
     set_current_user, get_current_user, set_request_url, get_request_url, nested_dict_values, chunks, api_get,
-    split_list_by_condition)
+    split_list_by_condition, keyset_batches, chunks_from_iterator, encode_search_cursor, decode_search_cursor)
 from core.concepts.models import Concept
 from core.orgs.models import Organization
 from core.sources.models import Source
@@ -41,6 +55,8 @@ class SetupTestEnvironment:
     settings.TEST_MODE = True
     settings.ELASTICSEARCH_DSL_AUTOSYNC = True
     settings.ES_SYNC = True
+    settings.RESPONSE_CACHE_ENABLED = False
+    settings.TERMINOLOGY_RESOLVE_TTL = 0
 
 
 class BaseTestCase(SetupTestEnvironment):
@@ -258,9 +274,36 @@ class S3Test(TestCase):
             file_path = "path/to/file.ext"
             res = S3.upload_file(key=file_path, headers={'header1': 'val1'})
             self.assertEqual(res, 200)
-            S3._upload.assert_called_once_with(file_path, 'file-content', {'header1': 'val1'}, None)  # pylint: disable=protected-access
+            S3._upload.assert_called_once_with(file_path, mock_file.return_value, {'header1': 'val1'}, None)  # pylint: disable=protected-access
             mock_file.assert_called_once_with(file_path, 'r')
 
+    @mock_s3
+    def test_multipart_writer_and_read_stream(self):
+        _conn = boto3.resource('s3', region_name='us-east-1')
+        _conn.create_bucket(Bucket='oclapi2-dev')
+
+        with S3.multipart_writer('some/path') as writer:
+            writer.PART_SIZE = 5 * 1024 * 1024
+            writer.write(b'a' * 6 * 1024 * 1024)
+            writer.write(b'b')
+
+        self.assertEqual(len(writer.parts), 2)
+        content = _conn.Object('oclapi2-dev', 'some/path').get()['Body'].read()
+        self.assertEqual(content, b'a' * 6 * 1024 * 1024 + b'b')
+        self.assertEqual(b''.join(S3.read_stream('some/path')), content)
+
+    @mock_s3
+    def test_multipart_writer_abort(self):
+        _conn = boto3.resource('s3', region_name='us-east-1')
+        _conn.create_bucket(Bucket='oclapi2-dev')
+
+        with self.assertRaises(ValueError):
+            with S3.multipart_writer('some/path') as writer:
+                writer.write(b'content')
+                raise ValueError()
+
+        self.assertFalse(S3.exists('some/path'))
+
     @patch('core.common.services.S3._upload')
     def test_upload_base64(self, s3_upload_mock):
         file_content = base64.b64encode(b'file-content')
@@ -724,6 +767,13 @@ class UtilsTest(OCLTestCase):
         file_mock.name = 'unknown_file.csv'
         self.assertTrue(is_csv_file(file=file_mock))
 
+    def test_encode_decode_search_cursor(self):
+        cursor = encode_search_cursor('pit-id', [1.5, 'foo', 10])
+
+        self.assertEqual(decode_search_cursor(cursor), dict(pit='pit-id', search_after=[1.5, 'foo', 10]))
+        self.assertIsNone(decode_search_cursor('foobar'))
+        self.assertIsNone(decode_search_cursor(encode_search_cursor('pit-id', None)))
+
     def test_is_url_encoded_string(self):
         self.assertTrue(is_url_encoded_string('foo'))
         self.assertFalse(is_url_encoded_string('foo/bar'))
@@ -788,6 +838,103 @@ class UtilsTest(OCLTestCase):
         self.assertEqual(list(chunks([1, 2, 3, 4], 7)), [[1, 2, 3, 4]])
         self.assertEqual(list(chunks([1, 2, 3, 4], 4)), [[1, 2, 3, 4]])
 
+    def test_chunks_from_iterator(self):
+        self.assertEqual(list(chunks_from_iterator(iter([]), 1000)), [])
+        self.assertEqual(list(chunks_from_iterator(iter([1, 2, 3, 4]), 3)), [[1, 2, 3], [4]])
+        self.assertEqual(list(chunks_from_iterator(iter([1, 2, 3, 4]), 2)), [[1, 2], [3, 4]])
+        self.assertEqual(list(chunks_from_iterator(iter([1, 2, 3, 4]), 7)), [[1, 2, 3, 4]])
+
+    def test_keyset_batches(self):
+        from core.concepts.tests.factories import ConceptFactory
+        ConceptFactory()
+        ConceptFactory()
+        ConceptFactory()
+        concept_ids = sorted(Concept.objects.values_list('id', flat=True), reverse=True)
+
+        self.assertEqual(
+            list(keyset_batches(Concept.objects.all(), 'id', 2)), list(chunks(concept_ids, 2))
+        )
+        self.assertEqual(
+            list(keyset_batches(Concept.objects.all(), 'id', 2, False)), list(chunks(sorted(concept_ids), 2))
+        )
+        self.assertEqual(list(keyset_batches(Concept.objects.none(), 'id', 2)), [])
+
+    @patch('core.common.utils.EXPORT_BATCH_SIZE', 2)
+    def test_write_export_zip(self):
+        from core.common.utils import write_export_zip
+        from core.concepts.tests.factories import ConceptFactory
+        from core.mappings.tests.factories import MappingFactory
+        from core.sources.tests.factories import OrganizationSourceFactory
+        source = OrganizationSourceFactory()
+        concepts = [ConceptFactory(parent=source) for _ in range(3)]
+        mapping = MappingFactory(from_concept=concepts[0], to_concept=concepts[1], parent=source)
+        source_v1 = OrganizationSourceFactory(mnemonic=source.mnemonic, organization=source.organization, version='v1')
+        for concept in concepts:
+            concept.sources.add(source_v1)
+        mapping.sources.add(source_v1)
+        progress = Mock()
+
+        file = io.BytesIO()
+        write_export_zip(
+            file, source_v1, 'source', 'core.sources.serializers.SourceVersionExportSerializer', Mock(), progress)
+
+        exported_data = json.loads(zipfile.ZipFile(file).read('export.json').decode('utf-8'))
+        self.assertEqual(exported_data['id'], 'v1')
+        self.assertEqual(
+            [concept['id'] for concept in exported_data['concepts']],
+            [concept.mnemonic for concept in reversed(concepts)]
+        )
+        self.assertEqual([mapping['id'] for mapping in exported_data['mappings']], [mapping.mnemonic])
+        self.assertEqual(progress.call_args[0][0]['total'], 4)
+
+    @mock_s3
+    def test_export_shards(self):  # pylint: disable=too-many-locals
+        from core.common.utils import get_export_shards, write_export_shard, stitch_export_shards
+        from core.concepts.tests.factories import ConceptFactory
+        from core.mappings.tests.factories import MappingFactory
+        from core.sources.tests.factories import OrganizationSourceFactory
+        _conn = boto3.resource('s3', region_name='us-east-1')
+        _conn.create_bucket(Bucket=settings.AWS_STORAGE_BUCKET_NAME)
+        source = OrganizationSourceFactory()
+        concept1, concept2, concept3 = [ConceptFactory(parent=source) for _ in range(3)]
+        mapping = MappingFactory(from_concept=concept1, to_concept=concept2, parent=source)
+        source_v1 = OrganizationSourceFactory(mnemonic=source.mnemonic, organization=source.organization, version='v1')
+        for concept in [concept1, concept2, concept3]:
+            concept.sources.add(source_v1)
+        mapping.sources.add(source_v1)
+
+        shards = get_export_shards(source_v1, 'source', 2)
+
+        self.assertEqual(
+            shards,
+            [('concepts', concept2.id, concept3.id), ('concepts', concept1.id, concept1.id),
+             ('mappings', mapping.id, mapping.id)]
+        )
+
+        empty_shard = write_export_shard(source_v1, 'source', 'mappings', 0, 0, Mock())
+        self.assertTrue(empty_shard['empty'])
+        self.assertFalse(S3.exists(empty_shard['key']))
+
+        written_shards = [write_export_shard(source_v1, 'source', *shard, Mock()) for shard in shards]
+
+        self.assertEqual([shard['count'] for shard in written_shards], [2, 1, 1])
+        self.assertTrue(all(S3.exists(shard['key']) for shard in written_shards))
+
+        stitch_export_shards(
+            source_v1, 'source', 'core.sources.serializers.SourceVersionExportSerializer',
+            [*written_shards, empty_shard], Mock()
+        )
+
+        content = _conn.Object(settings.AWS_STORAGE_BUCKET_NAME, source_v1.export_path).get()['Body'].read()
+        exported_data = json.loads(zipfile.ZipFile(io.BytesIO(content)).read('export.json').decode('utf-8'))
+        self.assertEqual(exported_data['id'], 'v1')
+        self.assertEqual(
+            [concept['id'] for concept in exported_data['concepts']],
+            [concept3.mnemonic, concept2.mnemonic, concept1.mnemonic]
+        )
+        self.assertEqual([mapping['id'] for mapping in exported_data['mappings']], [mapping.mnemonic])
+        self.assertFalse(any(S3.exists(shard['key']) for shard in written_shards))
+
     def test_split_list_by_condition(self):
         even, odd = split_list_by_condition([2, 3, 4, 5, 6, 7], lambda x: x % 2 == 0)
         self.assertEqual(even, [2, 4, 6])
@@ -817,6 +964,42 @@ class BaseModelTest(OCLTestCase):
         self.assertEqual(Concept().app_name, 'concepts')
         self.assertEqual(Source().app_name, 'sources')
 
+    @override_settings(ES_BATCH_INDEX_SIZE=2)
+    @patch('core.common.models.RedisService')
+    def test_batch_index_resumes_from_checkpoint(self, redis_service_mock):
+        from core.common.models import BaseModel
+        from core.concepts.tests.factories import ConceptFactory
+        checkpoints = {}
+        redis_service_mock.return_value = Mock(
+            exists=Mock(side_effect=lambda key: key in checkpoints),
+            get_int=Mock(side_effect=lambda key: int(checkpoints[key])),
+            set=Mock(side_effect=checkpoints.__setitem__),
+            delete=Mock(side_effect=checkpoints.pop)
+        )
+        for _ in range(5):
+            ConceptFactory()
+        concept_ids = sorted(Concept.objects.values_list('id', flat=True), reverse=True)
+        indexed_batches = []
+
+        def update(queryset, **kwargs):  # pylint: disable=unused-argument
+            ids = list(queryset.values_list('id', flat=True))
+            if len(indexed_batches) == 1 and not checkpoints.get('interrupted'):
+                checkpoints['interrupted'] = True
+                raise ValueError('worker lost')
+            indexed_batches.append(ids)
+        document_mock = Mock(return_value=Mock(update=Mock(side_effect=update)))
+
+        with self.assertRaises(ValueError):
+            BaseModel.batch_index(Concept.objects.all(), document_mock, 'concepts')
+
+        self.assertEqual(indexed_batches, [concept_ids[:2]])
+        self.assertEqual(checkpoints['batch_index_checkpoint:concepts'], concept_ids[1])
+
+        BaseModel.batch_index(Concept.objects.all(), document_mock, 'concepts')
+
+        self.assertEqual(indexed_batches, [concept_ids[:2], concept_ids[2:4], concept_ids[4:]])
+        self.assertNotIn('batch_index_checkpoint:concepts', checkpoints)
+
 
 class TaskTest(OCLTestCase):
     @patch('core.common.tasks.get_export_service')
@@ -826,6 +1009,120 @@ class TaskTest(OCLTestCase):
         delete_s3_objects('/some/path')
         s3_mock.delete_objects.assert_called_once_with('/some/path')
 
+    @patch('core.common.models.AsyncResult.failed', Mock(return_value=False))
+    @patch('core.common.models.AsyncResult.successful', Mock(return_value=False))
+    @patch('core.common.tasks.chord')
+    def test_export_source_sharded(self, chord_mock):
+        from core.common.tasks import export_source
+        from core.concepts.tests.factories import ConceptFactory
+        from core.sources.tests.factories import OrganizationSourceFactory
+        chord_mock.return_value.return_value = Mock(id='export-stitch-shards-123')
+        source = OrganizationSourceFactory()
+        concept = ConceptFactory(parent=source)
+        source_v1 = OrganizationSourceFactory(mnemonic=source.mnemonic, organization=source.organization, version='v1')
+        concept.sources.add(source_v1)
+
+        export_source(source_v1.id, True)  # pylint: disable=no-value-for-parameter
+
+        self.assertEqual(len(list(chord_mock.call_args[0][0])), 1)
+        stitch = chord_mock.return_value.call_args[0][0]
+        self.assertEqual(stitch.task, 'core.common.tasks.export_stitch_shards')
+        self.assertTrue(stitch.id.startswith('export-stitch-shards-'))
+        errback = stitch.options['link_error'][0]
+        self.assertEqual(errback['task'], 'core.common.tasks.export_shards_failed')
+        self.assertTrue(errback['immutable'])
+        self.assertEqual(errback['args'], (source_v1.id, 'source', stitch.id))
+        source_v1.refresh_from_db()
+        self.assertEqual(source_v1._background_process_ids, ['export-stitch-shards-123'])  # pylint: disable=protected-access
+        self.assertTrue(source_v1.is_exporting)
+
+    @patch('core.common.tasks.BlueGreenIndexRebuilder')
+    @patch('core.common.tasks.call_command')
+    def test_rebuild_indexes_with_aliases(self, call_command_mock, rebuilder_mock):
+        from core.common.tasks import rebuild_indexes
+        from core.concepts.documents import ConceptDocument
+        rebuilder_mock.is_alias = Mock(side_effect=lambda document: document == ConceptDocument)
+        rebuilder_mock.return_value.run = Mock(return_value='concepts_v20261018093000')
+
+        self.assertEqual(rebuild_indexes(['concepts', 'mappings']), ['concepts_v20261018093000'])
+
+        call_command_mock.assert_called_once_with(
+            'search_index', '--rebuild', '-f', '--models', 'mappings.Mapping', '--parallel')
+        rebuilder_mock.assert_called_once_with(ConceptDocument, None)
+
+        rebuilder_mock.is_alias = Mock(return_value=False)
+        call_command_mock.reset_mock()
+
+        self.assertIsNone(rebuild_indexes(['concepts']))
+
+        call_command_mock.assert_called_once_with(
+            'search_index', '--rebuild', '-f', '--models', 'concepts', '--parallel')
+
+    @patch('core.common.tasks.get_export_service')
+    def test_export_shards_failed(self, export_service_mock):
+        from core.common.tasks import export_shards_failed
+        from core.sources.tests.factories import OrganizationSourceFactory
+        s3_mock = Mock(delete_objects=Mock())
+        export_service_mock.return_value = s3_mock
+        source_v1 = OrganizationSourceFactory(version='v1')
+        source_v1.add_processing('export-stitch-shards-123')
+
+        export_shards_failed(source_v1.id, 'source', 'export-stitch-shards-123')
+
+        s3_mock.delete_objects.assert_called_once_with(
+            f'export_shards/{source_v1.parent_resource}/{source_v1.mnemonic}_v1/')
+        source_v1.refresh_from_db()
+        self.assertEqual(source_v1._background_process_ids, [])  # pylint: disable=protected-access
+
+    @patch('core.common.tasks.drain_index_buffer')
+    @patch('core.common.tasks.RedisService')
+    def test_buffer_for_indexing(self, redis_service_mock, drain_index_buffer_mock):
+        redis_instance_mock = Mock(set_if_not_exists=Mock(side_effect=[True, False]))
+        redis_service_mock.return_value = redis_instance_mock
+
+        buffer_for_indexing('concepts', 'Concept', 1)
+        buffer_for_indexing('concepts', 'Concept', 2)
+
+        redis_instance_mock.add_to_set.assert_any_call('index_buffer:concepts.Concept', 1)
+        redis_instance_mock.add_to_set.assert_any_call('index_buffer:concepts.Concept', 2)
+        drain_index_buffer_mock.apply_async.assert_called_once_with(countdown=settings.ES_INDEX_BUFFER_DELAY)
+
+    @patch('core.concepts.models.Concept.index_ids')
+    @patch('core.common.tasks.RedisService')
+    def test_drain_index_buffer(self, redis_service_mock, index_ids_mock):
+        redis_instance_mock = Mock(
+            keys=Mock(return_value=[b'index_buffer:concepts.Concept']),
+            pop_from_set=Mock(side_effect=[[b'1', b'2'], [b'3'], []])
+        )
+        redis_service_mock.return_value = redis_instance_mock
+
+        drain_index_buffer()
+
+        redis_instance_mock.delete.assert_called_once_with('index_buffer_drain_scheduled')
+        self.assertEqual(index_ids_mock.call_count, 2)
+        index_ids_mock.assert_any_call([1, 2])
+        index_ids_mock.assert_any_call([3])
+
+    @patch('core.common.tasks.drain_index_buffer.apply_async')
+    @patch('core.concepts.models.Concept.index_ids')
+    @patch('core.common.tasks.RedisService')
+    def test_drain_index_buffer_failure_reschedules(self, redis_service_mock, index_ids_mock, apply_async_mock):
+        redis_instance_mock = Mock(
+            keys=Mock(return_value=[b'index_buffer:concepts.Concept']),
+            pop_from_set=Mock(side_effect=[[b'1', b'2'], []]),
+            set_if_not_exists=Mock(return_value=True)
+        )
+        redis_service_mock.return_value = redis_instance_mock
+        index_ids_mock.side_effect = Exception('ES down')
+
+        with self.assertRaises(Exception):
+            drain_index_buffer()
+
+        redis_instance_mock.add_to_set.assert_called_once_with('index_buffer:concepts.Concept', b'1', b'2')
+        redis_instance_mock.set_if_not_exists.assert_called_once_with(
+            'index_buffer_drain_scheduled', 1, ttl=max(60, 2 * settings.ES_INDEX_BUFFER_RETRY_DELAY))
+        apply_async_mock.assert_called_once_with(countdown=settings.ES_INDEX_BUFFER_RETRY_DELAY)
+
     @patch('core.importers.models.BulkImportParallelRunner.run')
     def test_bulk_import_parallel_inline_invalid_json(self, import_run_mock):
         content = open(os.path.join(os.path.dirname(__file__), '..', 'samples/invalid_import_json.json'), 'r').read()
@@ -922,3 +1219,627 @@ class PostgresQLTest(OCLTestCase):
 
         db_connection_mock.cursor.assert_called_once()
         cursor_context_mock.execute.assert_called_once_with("SELECT last_value from foobar_seq;")
+
+
+class BlueGreenIndexRebuilderTest(OCLTestCase):
+    @staticmethod
+    def get_rebuilder(connection):
+        document = Mock(_index=Mock(_name='concepts'), _get_connection=Mock(return_value=connection))
+        rebuilder = BlueGreenIndexRebuilder(document)
+        rebuilder.index_name = 'concepts_v20261018093000'
+        return rebuilder
+
+    def test_swap_alias_first_run(self):
+        connection = Mock()
+        connection.indices.exists_alias = Mock(return_value=False)
+        connection.indices.exists = Mock(return_value=True)
+
+        self.get_rebuilder(connection).swap_alias()
+
+        connection.indices.update_aliases.assert_called_once_with(body={'actions': [
+            {'add': {'index': 'concepts_v20261018093000', 'alias': 'concepts'}},
+            {'remove_index': {'index': 'concepts'}},
+        ]})
+
+    def test_swap_alias(self):
+        connection = Mock()
+        connection.indices.exists_alias = Mock(return_value=True)
+        connection.indices.get_alias = Mock(return_value={'concepts_v20261001000000': {'aliases': {'concepts': {}}}})
+
+        self.get_rebuilder(connection).swap_alias()
+
+        connection.indices.update_aliases.assert_called_once_with(body={'actions': [
+            {'add': {'index': 'concepts_v20261018093000', 'alias': 'concepts'}},
+            {'remove_index': {'index': 'concepts_v20261001000000'}},
+        ]})
+        connection.indices.exists.assert_not_called()
+
+    @patch('core.common.documents.RedisService')
+    @patch('core.common.documents.parallel_bulk')
+    def test_run_deletes_new_index_on_failure(self, parallel_bulk_mock, redis_service_mock):
+        parallel_bulk_mock.return_value = iter([(True, {}), (False, {'error': 'boom'})])
+        connection = Mock()
+        rebuilder = self.get_rebuilder(connection)
+        rebuilder.create_index = Mock()
+        rebuilder.document.return_value.get_queryset.return_value.count.return_value = 2
+        progress = Mock()
+        rebuilder.progress = progress
+
+        with self.assertRaises(Exception):
+            rebuilder.run()
+
+        rebuilder.create_index.assert_called_once()
+        connection.indices.update_aliases.assert_not_called()
+        connection.indices.delete.assert_called_once_with(index='concepts_v20261018093000', ignore=[404])
+        progress.assert_called_once_with(
+            dict(index='concepts', new_index='concepts_v20261018093000', indexed=0, total=2))
+        redis_service_mock.return_value.set.assert_called_once_with(
+            'index_rebuild:concepts', 'concepts_v20261018093000')
+        redis_service_mock.return_value.delete.assert_called_once_with(
+            'index_rebuild:concepts', 'index_rebuild:concepts:deletes', 'index_rebuild:concepts:saves')
+
+    @patch('core.common.documents.RedisService')
+    def test_record_delete(self, redis_service_mock):
+        redis_service_mock.return_value.exists = Mock(side_effect=[False, True])
+        document = Mock(_index=Mock(_name='concepts'))
+
+        BlueGreenIndexRebuilder.record_delete(document, 1)
+        redis_service_mock.return_value.add_to_set.assert_not_called()
+
+        BlueGreenIndexRebuilder.record_delete(document, 2)
+        redis_service_mock.return_value.exists.assert_called_with('index_rebuild:concepts')
+        redis_service_mock.return_value.add_to_set.assert_called_once_with('index_rebuild:concepts:deletes', 2)
+
+    @patch('core.common.documents.RedisService')
+    def test_record_saves(self, redis_service_mock):
+        redis_service_mock.return_value.exists = Mock(side_effect=[False, True])
+        document = Mock(_index=Mock(_name='concepts'))
+
+        BlueGreenIndexRebuilder.record_saves(document, [1])
+        redis_service_mock.return_value.add_to_set.assert_not_called()
+
+        BlueGreenIndexRebuilder.record_saves(document, [2, 3])
+        redis_service_mock.return_value.exists.assert_called_with('index_rebuild:concepts')
+        redis_service_mock.return_value.add_to_set.assert_called_once_with('index_rebuild:concepts:saves', 2, 3)
+
+    @patch('core.common.documents.bulk')
+    def test_index_saved(self, bulk_mock):
+        indexed = []
+        bulk_mock.side_effect = lambda connection, actions, **kwargs: indexed.append(list(actions))
+        rebuilder = self.get_rebuilder(Mock())
+        document = rebuilder.document.return_value
+        get_actions = Mock(side_effect=lambda queryset, action: iter([{'_id': 1}]))
+        document._get_actions = get_actions  # pylint: disable=protected-access
+        redis_service = Mock(pop_from_set=Mock(side_effect=[[b'1', b'2'], [b'3'], []]))
+
+        rebuilder.index_saved(redis_service)
+
+        redis_service.pop_from_set.assert_called_with('index_rebuild:concepts:saves', 1000)
+        document.get_queryset.return_value.filter.assert_any_call(id__in=[1, 2])
+        document.get_queryset.return_value.filter.assert_any_call(id__in=[3])
+        self.assertEqual(
+            indexed, [[{'_id': 1, '_index': 'concepts_v20261018093000'}]] * 2)
+
+    @patch('core.common.documents.bulk')
+    def test_remove_deleted(self, bulk_mock):
+        deleted = []
+        bulk_mock.side_effect = lambda connection, actions, **kwargs: deleted.append(list(actions))
+        rebuilder = self.get_rebuilder(Mock())
+        redis_service = Mock(pop_from_set=Mock(side_effect=[[b'1', b'2'], [b'3'], []]))
+
+        rebuilder.remove_deleted(redis_service)
+
+        redis_service.pop_from_set.assert_called_with('index_rebuild:concepts:deletes', 1000)
+        self.assertEqual(
+            deleted,
+            [
+                [{'_op_type': 'delete', '_index': 'concepts_v20261018093000', '_id': 1},
+                 {'_op_type': 'delete', '_index': 'concepts_v20261018093000', '_id': 2}],
+                [{'_op_type': 'delete', '_index': 'concepts_v20261018093000', '_id': 3}],
+            ]
+        )
+
+
+class BaseAPIViewTest(OCLTestCase):
+    @staticmethod
+    def get_view(query_params, include_facets=False):
+        from core.concepts.views import ConceptListView
+        view = ConceptListView()
+        view.request = Mock(
+            query_params=QueryDict(query_params), GET={}, META={INCLUDE_FACETS: 'true'} if include_facets else {},
+            method='GET', instance=None
+        )
+        view.kwargs = {}
+        view.limit = 2
+        return view
+
+    def test_aggregate_facets(self):
+        from core.concepts.documents import ConceptDocument
+        view = self.get_view('conceptClass=Diagnosis&datatype=N/A', True)
+
+        aggs = view.aggregate_facets(ConceptDocument.search()).to_dict()['aggs']
+
+        # match_all & criterion is the criterion itself
+        self.assertEqual(aggs['_filter_conceptClass']['filter'], {'match': {'datatype': 'N/A'}})
+        self.assertEqual(aggs['_filter_conceptClass']['aggs']['conceptClass']['terms']['field'], 'concept_class')
+        self.assertEqual(aggs['_filter_datatype']['filter'], {'match': {'concept_class': 'Diagnosis'}})
+        self.assertCountEqual(
+            aggs['_filter_locale']['filter']['bool']['must'],
+            [{'match': {'datatype': 'N/A'}}, {'match': {'concept_class': 'Diagnosis'}}]
+        )
+
+    def test_search_results_facets_follow_result_filters(self):
+        view = self.get_view('q=foo&conceptClass=Diagnosis&extras.exact.foo=bar', True)
+        view.request.user = Mock(is_staff=True, is_authenticated=False)
+
+        search = view._BaseAPIView__search_results  # pylint: disable=protected-access
+        search_dict = view.aggregate_facets(search).to_dict()
+
+        # facet selections only filter the hits, other filters also narrow the facet counts
+        self.assertEqual(search_dict['post_filter'], {'match': {'concept_class': 'Diagnosis'}})
+        must = search_dict['query']['bool']['must']
+        self.assertIn({'match': {'extras.foo': 'bar'}}, must)
+        self.assertIn({'match': {'retired': False}}, must)
+        self.assertNotIn({'match': {'concept_class': 'Diagnosis'}}, must)
+        aggs = search_dict['aggs']
+        self.assertEqual(aggs['_filter_conceptClass']['filter'], {'match_all': {}})
+        self.assertEqual(aggs['_filter_datatype']['filter'], {'match': {'concept_class': 'Diagnosis'}})
+
+    @patch('core.common.views.BaseAPIView._BaseAPIView__search_results', new_callable=PropertyMock)
+    def test_get_search_results_qs(self, search_results_mock):
+        from core.concepts.tests.factories import ConceptFactory
+        concept1 = ConceptFactory()
+        concept2 = ConceptFactory()
+        hits = MagicMock(total=Mock(value=5))
+        hits.__iter__.return_value = iter([Mock(meta=Mock(id=str(concept2.id))), Mock(meta=Mock(id=str(concept1.id)))])
+        search_mock = MagicMock()
+        paged_search_mock = search_mock.params.return_value.extra.return_value.source.return_value.__getitem__
+        paged_search_mock.return_value.execute.return_value = Mock(hits=hits)
+        search_results_mock.return_value = search_mock
+        view = self.get_view('q=foo')
+
+        queryset = view.get_search_results_qs()
+
+        self.assertEqual(list(queryset), [concept2, concept1])
+        self.assertEqual(view.total_count, 5)
+        self.assertIsNone(view.es_facets)
+        search_mock.params.return_value.extra.assert_called_once_with(track_total_hits=True)
+        search_mock.params.return_value.extra.return_value.source.assert_called_once_with(excludes=['*'])
+        paged_search_mock.assert_called_once_with(slice(0, 2, None))
+        paged_search_mock.return_value.execute.assert_called_once()
+
+    @override_settings(ES_NATIVE_LIST_RESULTS=True)
+    def test_should_render_from_es_source(self):
+        self.assertTrue(self.get_view('q=foo').should_render_from_es_source())
+        self.assertTrue(self.get_view('q=foo&includeRetired=true').should_render_from_es_source())
+        self.assertFalse(self.get_view('q=foo&verbose=true').should_render_from_es_source())
+        self.assertFalse(self.get_view('q=foo&brief=true').should_render_from_es_source())
+        self.assertFalse(self.get_view('q=foo&includeMappings=true').should_render_from_es_source())
+        self.assertFalse(self.get_view('q=foo&csv=true').should_render_from_es_source())
+
+        with override_settings(ES_NATIVE_LIST_RESULTS=False):
+            self.assertFalse(self.get_view('q=foo').should_render_from_es_source())
+
+    @override_settings(ES_NATIVE_LIST_RESULTS=True)
+    @patch('core.common.views.BaseAPIView._BaseAPIView__search_results', new_callable=PropertyMock)
+    def test_get_search_results_qs_from_es_source(self, search_results_mock):
+        hit1 = AttrDict(dict(list_payload=dict(id='c1', display_name='Concept 1')))
+        hit2 = AttrDict(dict(list_payload=dict(id='c2', display_name='Concept 2')))
+        hits = MagicMock(total=Mock(value=2))
+        hits.__iter__.side_effect = lambda: iter([hit1, hit2])
+        search_mock = MagicMock()
+        paged_search_mock = search_mock.params.return_value.extra.return_value.source.return_value.__getitem__
+        paged_search_mock.return_value.execute.return_value = Mock(hits=hits)
+        search_results_mock.return_value = search_mock
+        view = self.get_view('q=foo')
+
+        results = view.get_search_results_qs()
+
+        self.assertEqual(results, [hit1, hit2])
+        self.assertTrue(view.is_es_native_results)
+        search_mock.params.return_value.extra.return_value.source.assert_called_once_with(includes=['list_payload'])
+        self.assertEqual(
+            view.serialize_list(results),
+            [dict(id='c1', display_name='Concept 1'), dict(id='c2', display_name='Concept 2')]
+        )
+
+    @override_settings(ES_NATIVE_LIST_RESULTS=True)
+    @patch('core.common.views.BaseAPIView._BaseAPIView__search_results', new_callable=PropertyMock)
+    def test_get_search_results_qs_from_es_source_without_payload(self, search_results_mock):
+        from core.concepts.tests.factories import ConceptFactory
+        concept = ConceptFactory()
+        hit = MagicMock(meta=Mock(id=str(concept.id)), list_payload=None)
+        hits = MagicMock(total=Mock(value=1))
+        hits.__iter__.side_effect = lambda: iter([hit])
+        search_mock = MagicMock()
+        paged_search_mock = search_mock.params.return_value.extra.return_value.source.return_value.__getitem__
+        paged_search_mock.return_value.execute.return_value = Mock(hits=hits)
+        search_results_mock.return_value = search_mock
+        view = self.get_view('q=foo')
+
+        self.assertEqual(list(view.get_search_results_qs()), [concept])
+        self.assertFalse(view.is_es_native_results)
+
+    @patch('core.common.views.BaseAPIView.open_point_in_time', Mock(return_value='pit-1'))
+    @patch('core.common.views.BaseAPIView._BaseAPIView__search_results', new_callable=PropertyMock)
+    def test_get_search_results_qs_with_cursor(self, search_results_mock):
+        from core.concepts.tests.factories import ConceptFactory
+        concept1 = ConceptFactory()
+        concept2 = ConceptFactory()
+        hits = MagicMock(total=Mock(value=5))
+        hits.__len__.return_value = 2
+        hits.__getitem__.return_value = Mock(meta=Mock(sort=[1.5, 20]))
+        hits.__iter__.side_effect = lambda: iter(
+            [Mock(meta=Mock(id=str(concept1.id))), Mock(meta=Mock(id=str(concept2.id)))])
+        search_mock = MagicMock()
+        search_results_mock.return_value = search_mock
+        pit_search_mock = search_mock.params.return_value.source.return_value.extra.return_value.index.return_value
+        pit_search_mock.extra.return_value.extra.return_value.execute.return_value = Mock(hits=hits, pit_id='pit-2')
+        view = self.get_view('q=foo&cursor=true')
+
+        self.assertEqual(list(view.get_search_results_qs()), [concept1, concept2])
+        self.assertEqual(view.total_count, 5)
+        self.assertTrue(view.is_cursor_paginated)
+        self.assertEqual(decode_search_cursor(view.next_search_cursor), dict(pit='pit-2', search_after=[1.5, 20]))
+        pit_search_mock.extra.assert_called_once_with(pit=dict(id='pit-1', keep_alive='5m'))
+        pit_search_mock.extra.return_value.extra.assert_called_once_with(size=2)
+
+    @patch('core.common.views.BaseAPIView.close_point_in_time')
+    @patch('core.common.views.BaseAPIView._BaseAPIView__search_results', new_callable=PropertyMock)
+    def test_get_search_results_qs_with_cursor_last_page(self, search_results_mock, close_point_in_time_mock):
+        from core.concepts.tests.factories import ConceptFactory
+        concept = ConceptFactory()
+        hits = MagicMock(total=Mock(value=3))
+        hits.__len__.return_value = 1
+        hits.__iter__.side_effect = lambda: iter([Mock(meta=Mock(id=str(concept.id)))])
+        search_mock = MagicMock()
+        search_results_mock.return_value = search_mock
+        pit_search_mock = search_mock.params.return_value.source.return_value.extra.return_value.index.return_value
+        pit_search_mock.extra.return_value.extra.return_value.extra.return_value.execute.return_value = Mock(
+            hits=hits, pit_id='pit-3')
+        view = self.get_view(f"q=foo&cursor={encode_search_cursor('pit-2', [1.5, 20])}")
+
+        self.assertEqual(list(view.get_search_results_qs()), [concept])
+        self.assertTrue(view.is_cursor_paginated)
+        self.assertIsNone(view.next_search_cursor)
+        pit_search_mock.extra.assert_called_once_with(pit=dict(id='pit-2', keep_alive='5m'))
+        pit_search_mock.extra.return_value.extra.assert_called_once_with(search_after=[1.5, 20])
+        close_point_in_time_mock.assert_called_once_with('pit-3')
+
+    def test_get_search_cursor(self):
+        cursor = encode_search_cursor('pit-id', [1.5, 20])
+        self.assertEqual(
+            self.get_view(f'q=foo&cursor={cursor}').get_search_cursor(), dict(pit='pit-id', search_after=[1.5, 20]))
+        self.assertIsNone(self.get_view('q=foo').get_search_cursor())
+        with self.assertRaises(Http400):
+            self.get_view('q=foo&cursor=foobar').get_search_cursor()
+
+    @patch('core.common.views.BaseAPIView.close_point_in_time')
+    @patch('core.common.views.BaseAPIView.open_point_in_time', Mock(return_value='pit-1'))
+    def test_iterate_search_hits(self, close_point_in_time_mock):
+        batch1 = [Mock(meta=Mock(sort=[2, 1])), Mock(meta=Mock(sort=[1, 2]))]
+        batch2 = [Mock(meta=Mock(sort=[0, 3]))]
+        search_mock = MagicMock()
+        search_mock.index.return_value.extra.return_value.extra.return_value.execute.return_value = MagicMock(
+            hits=batch1, pit_id='pit-2')
+        search_mock.index.return_value.extra.return_value.extra.return_value.extra.return_value.execute.return_value = \
+            MagicMock(hits=batch2, pit_id='pit-3')
+        view = self.get_view('q=foo&stream=true')
+
+        self.assertEqual(list(view.iterate_search_hits(search_mock, 2)), [batch1, batch2])
+        search_mock.index.return_value.extra.return_value.extra.assert_any_call(search_after=[1, 2])
+        close_point_in_time_mock.assert_called_once_with('pit-2')
+
+
+class ResponseCacheTest(OCLAPITestCase):
+    def setUp(self):
+        super().setUp()
+        from core.sources.tests.factories import OrganizationSourceFactory
+        from core.concepts.tests.factories import ConceptFactory
+        cache.clear()
+        self.source = OrganizationSourceFactory(public_access=ACCESS_TYPE_VIEW)
+        self.concept = ConceptFactory(parent=self.source, mnemonic='c1')
+        self.source_v1 = OrganizationSourceFactory(
+            version='v1', mnemonic=self.source.mnemonic, organization=self.source.organization,
+            public_access=ACCESS_TYPE_VIEW
+        )
+        self.source_v1.concepts.add(self.concept.get_latest_version())
+        self.url = self.source_v1.uri + 'concepts/c1/'
+
+    def test_get_repo_cache_namespace_from_uri(self):
+        self.assertEqual(
+            get_repo_cache_namespace_from_uri('/orgs/MyOrg/sources/MySource/v1/concepts/c1/'),
+            '/orgs/MyOrg/sources/MySource/'
+        )
+        self.assertEqual(
+            get_repo_version_cache_namespace(get_repo_cache_namespace('/orgs/MyOrg/', 'sources', 'MySource')),
+            '/orgs/MyOrg/sources/MySource/HEAD/'
+        )
+
+    def test_bump_generation(self):
+        self.assertEqual(get_generations('/orgs/MyOrg/sources/MySource/'), [0])
+
+        bump_generation('/orgs/MyOrg/sources/MySource/')
+        bump_generation('/orgs/MyOrg/sources/MySource/')
+
+        self.assertEqual(get_generations('/orgs/MyOrg/sources/MySource/', '/orgs/MyOrg/sources/Foo/'), [2, 0])
+
+    @override_settings(RESPONSE_CACHE_ENABLED=True)
+    def test_get_released_version_concept_is_cached(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['id'], 'c1')
+
+        with self.assertNumQueries(0):
+            cached_response = self.client.get(self.url)
+
+        self.assertEqual(cached_response.status_code, 200)
+        self.assertEqual(cached_response.content, response.content)
+
+    @override_settings(RESPONSE_CACHE_ENABLED=True)
+    def test_get_head_and_live_relations_are_not_cached(self):
+        from core.common.tasks import make_hierarchy
+        from core.concepts.tests.factories import ConceptFactory
+        urls = [self.concept.uri + '?includeParentConceptURLs=true', self.url + '?includeParentConceptURLs=true']
+        for url in urls:
+            self.assertEqual(self.client.get(url).data['parent_concept_urls'], [])
+
+        parent = ConceptFactory(parent=self.source, mnemonic='parent')
+        make_hierarchy({parent.uri: [self.concept.uri]})
+
+        for url in urls:
+            self.assertEqual(self.client.get(url).data['parent_concept_urls'], [parent.uri])
+
+    @override_settings(RESPONSE_CACHE_ENABLED=True)
+    def test_get_is_cached_per_authorization(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+        response = self.client.get(self.url, HTTP_AUTHORIZATION='Token foobar')
+
+        self.assertEqual(response.status_code, 401)
+
+    @override_settings(RESPONSE_CACHE_ENABLED=True)
+    def test_get_after_invalidation_is_not_served_from_cache(self):
+        self.client.get(self.url)
+
+        invalidate_repo_version_cache(self.source_v1)
+        self.source_v1.concepts.remove(self.concept.get_latest_version())
+
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    @override_settings(RESPONSE_CACHE_ENABLED=True)
+    def test_get_private_source_is_not_cached(self):
+        Source.objects.filter(mnemonic=self.source.mnemonic).update(public_access=ACCESS_TYPE_NONE)
+        user = UserProfileFactory(organizations=[self.source.organization])
+
+        response = self.client.get(self.url, HTTP_AUTHORIZATION='Token ' + user.get_token())
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    @override_settings(RESPONSE_CACHE_ENABLED=True)
+    def test_get_access_change_invalidates_all_versions(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+        self.source.public_access = ACCESS_TYPE_NONE
+        self.source.save()
+        Source.objects.filter(id=self.source_v1.id).update(public_access=ACCESS_TYPE_NONE)
+
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+
+class BenchmarkTest(OCLTestCase):
+    def test_synthetic_dataset(self):
+        dataset = SyntheticDataset('BENCH', sources=2, concepts=3, mappings=4, collections=1, references=5)
+        lines = list(dataset.lines())
+
+        self.assertEqual(dataset.total, len(lines))
+        self.assertEqual(
+            [line['type'] for line in lines],
+            ['Organization', 'Source', *['Concept'] * 3, *['Mapping'] * 4, 'Source', *['Concept'] * 3,
+             *['Mapping'] * 4, 'Collection', 'Reference']
+        )
+        self.assertEqual(lines[5], {**lines[5], 'from_concept_url': '/orgs/BENCH/sources/S0/concepts/C0/',
+                                    'to_concept_url': '/orgs/BENCH/sources/S0/concepts/C1/', 'source': 'S0'})
+        self.assertEqual(lines[-1]['data']['expressions'], [
+            '/orgs/BENCH/sources/S0/concepts/C0/', '/orgs/BENCH/sources/S1/concepts/C0/',
+            '/orgs/BENCH/sources/S0/concepts/C1/', '/orgs/BENCH/sources/S1/concepts/C1/',
+            '/orgs/BENCH/sources/S0/concepts/C2/'
+        ])
+        self.assertEqual(len(dataset.to_json().splitlines()), len(lines))
+        self.assertEqual(dataset.copy('BENCH-P').concept_url('S0', 1), '/orgs/BENCH-P/sources/S0/concepts/C1/')
+
+    def test_measure_and_compare(self):
+        suite = BenchmarkSuite(SyntheticDataset('BENCH', concepts=1))
+
+        def run():
+            Organization.objects.count()
+            return 10
+
+        result = suite.measure('foo', run)
+
+        self.assertEqual(result['name'], 'foo')
+        self.assertEqual(result['rows'], 10)
+        self.assertEqual(result['queries'], 1)
+        self.assertTrue(result['peak_rss_kb'] > 0)
+        report = suite.report()
+        self.assertEqual(report['benchmarks'], [result])
+        self.assertEqual(report['dataset']['lines'], 1 + 1 + 1 + 1000 + 1 + 1)
+        self.assertEqual(
+            suite.compare(
+                dict(benchmarks=[dict(name='foo', rows_per_sec=50), dict(name='bar', rows_per_sec=10)]),
+                dict(benchmarks=[dict(name='foo', rows_per_sec=100), dict(name='baz', rows_per_sec=10)])
+            ),
+            dict(foo=-50)
+        )
+
+
+class ProfilingTest(OCLAPITestCase):
+    def test_get_sql_shape(self):
+        self.assertEqual(
+            get_sql_shape(
+                "SELECT * FROM concepts WHERE id IN (%s, %s, %s) AND mnemonic = 'foo' AND parent_id = 12 LIMIT 10"),
+            "SELECT * FROM concepts WHERE id IN (%s, ...) AND mnemonic = '?' AND parent_id = ? LIMIT ?"
+        )
+        self.assertEqual(get_sql_shape('SELECT 1 FROM orgs WHERE id = %s'), 'SELECT ? FROM orgs WHERE id = %s')
+
+    def test_profile_request(self):
+        self.assertIsNone(get_current_profile())
+
+        with profile_request() as profile:
+            self.assertEqual(get_current_profile(), profile)
+            Organization.objects.filter(id=1).exists()
+            Organization.objects.filter(id=2).exists()
+            UserProfile.objects.count()
+
+        self.assertIsNone(get_current_profile())
+        self.assertEqual(profile.sql_count, 3)
+        self.assertTrue(profile.sql_time > 0)
+        self.assertEqual(len(profile.get_top_sql()), 1)
+        self.assertEqual(profile.get_top_sql()[0]['count'], 2)
+        self.assertIn('orgs', profile.get_top_sql()[0]['sql'])
+
+        profile.record_es(0.5, '{"took": 7, "hits": {}}')
+        profile.record_es(0.25, 'not json')
+        with profile.serialization():
+            with profile.serialization():
+                pass
+        self.assertEqual(profile.to_dict()['es_count'], 2)
+        self.assertEqual(profile.to_dict()['es_took_ms'], 7)
+        self.assertEqual(profile.to_dict()['es_seconds'], 0.75)
+        self.assertEqual(profile.to_headers()['X-OCL-PROFILE-SQL-COUNT'], 3)
+        self.assertFalse(profile.serializing)
+
+    def test_profiling_headers(self):
+        admin = UserProfile.objects.get(username='ocladmin')
+        user = UserProfileFactory()
+
+        response = self.client.get('/orgs/', HTTP_AUTHORIZATION='Token ' + admin.get_token())
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('X-OCL-PROFILE-SQL-COUNT'))
+
+        response = self.client.get(
+            '/orgs/', HTTP_AUTHORIZATION='Token ' + admin.get_token(), HTTP_X_OCL_PROFILE='true')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(int(response['X-OCL-PROFILE-SQL-COUNT']) > 0)
+        self.assertTrue(float(response['X-OCL-PROFILE-SERIALIZER-TIME']) > 0)
+        self.assertTrue(response.has_header('X-OCL-PROFILE-ES-COUNT'))
+
+        response = self.client.get('/orgs/?profile=true', HTTP_AUTHORIZATION='Token ' + admin.get_token())
+        self.assertTrue(response.has_header('X-OCL-PROFILE-SQL-COUNT'))
+
+        response = self.client.get('/orgs/?profile=true', HTTP_AUTHORIZATION='Token ' + user.get_token())
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('X-OCL-PROFILE-SQL-COUNT'))
+
+
+class MetricsTest(OCLAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.metrics = Metrics()
+
+    def test_inc_and_observe(self):
+        self.metrics.inc('ocl_es_bulk_failures_total', dict(index='concepts'), 2)
+        self.metrics.inc('ocl_es_bulk_failures_total', dict(index='concepts'))
+        self.metrics.observe('ocl_celery_task_duration_seconds', 0.7, dict(task='handle_save'), (0.5, 1, 5))
+
+        self.assertEqual(
+            dict(self.metrics.samples),
+            {
+                'ocl_es_bulk_failures_total{index="concepts"}': 3,
+                'ocl_celery_task_duration_seconds_bucket{le="1",task="handle_save"}': 1,
+                'ocl_celery_task_duration_seconds_bucket{le="5",task="handle_save"}': 1,
+                'ocl_celery_task_duration_seconds_bucket{le="+Inf",task="handle_save"}': 1,
+                'ocl_celery_task_duration_seconds_sum{task="handle_save"}': 0.7,
+                'ocl_celery_task_duration_seconds_count{task="handle_save"}': 1,
+            }
+        )
+        self.assertEqual(get_sample_key('foo', dict(view='a"b')), 'foo{view="a\\"b"}')
+
+    @patch('core.common.metrics.RedisService')
+    def test_flush_and_render(self, redis_service_mock):
+        conn = Mock(
+            hgetall=Mock(return_value={
+                b'ocl_http_request_duration_seconds_count{method="GET",status="2xx",view="FooView"}': b'4',
+                b'ocl_http_db_queries_total{view="FooView"}': b'12',
+            }),
+            llen=Mock(return_value=3)
+        )
+        redis_service_mock.return_value = Mock(conn=conn)
+        self.metrics.inc('ocl_http_db_queries_total', dict(view='FooView'), 2)
+
+        with override_settings(METRICS_CELERY_QUEUES=['default']):
+            text = self.metrics.render()
+
+        conn.pipeline.return_value.hincrbyfloat.assert_called_once_with(
+            'ocl_metrics', 'ocl_http_db_queries_total{view="FooView"}', 2)
+        conn.pipeline.return_value.execute.assert_called_once()
+        self.assertEqual(dict(self.metrics.samples), {})
+        self.assertEqual(
+            text,
+            '# HELP ocl_celery_queue_length Messages waiting in a celery queue.\n'
+            '# TYPE ocl_celery_queue_length gauge\n'
+            'ocl_celery_queue_length{queue="default"} 3\n'
+            '# HELP ocl_http_db_queries_total SQL queries run by the requests of a view.\n'
+            '# TYPE ocl_http_db_queries_total counter\n'
+            'ocl_http_db_queries_total{view="FooView"} 12\n'
+            '# HELP ocl_http_request_duration_seconds API response time by view.\n'
+            '# TYPE ocl_http_request_duration_seconds histogram\n'
+            'ocl_http_request_duration_seconds_count{method="GET",status="2xx",view="FooView"} 4\n'
+        )
+
+    @patch('core.common.metrics.RedisService')
+    def test_flush_failure_keeps_samples(self, redis_service_mock):
+        redis_service_mock.side_effect = Exception('down')
+        self.metrics.inc('ocl_http_db_queries_total', dict(view='FooView'), 2)
+
+        self.metrics.flush()
+
+        self.assertEqual(dict(self.metrics.samples), {'ocl_http_db_queries_total{view="FooView"}': 2})
+
+    def test_is_timed_task(self):
+        self.assertTrue(is_timed_task('core.common.tasks.handle_save'))
+        self.assertTrue(is_timed_task('core.common.tasks.export_source'))
+        self.assertTrue(is_timed_task('core.common.tasks.batch_index_resources'))
+        self.assertFalse(is_timed_task('core.common.tasks.bulk_import_inline'))
+
+    @override_settings(METRICS_FLUSH_INTERVAL=3600)
+    def test_request_metrics(self):
+        metrics.samples.clear()
+
+        self.assertEqual(self.client.get('/orgs/').status_code, 200)
+
+        key = 'ocl_http_request_duration_seconds_count{method="GET",status="2xx",view="OrganizationListView"}'
+        self.assertEqual(metrics.samples[key], 1)
+        self.assertTrue(metrics.samples['ocl_http_db_queries_total{view="OrganizationListView"}'] > 0)
+
+    @override_settings(METRICS_ACCESS_TOKEN='secret')
+    @patch('core.common.metrics.metrics.render', Mock(return_value='foo 1\n'))
+    def test_metrics_view(self):
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+
+        response = self.client.get('/metrics/?token=secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'foo 1\n')
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+
+    @patch('core.common.metrics.metrics.render', Mock(return_value='foo 1\n'))
+    def test_metrics_view_without_token_is_staff_only(self):
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+        self.assertEqual(self.client.get('/metrics/?token=').status_code, 403)
+
+        user = UserProfileFactory()
+        self.assertEqual(
+            self.client.get('/metrics/', HTTP_AUTHORIZATION='Token ' + user.get_token()).status_code, 403)
+
+        user.is_staff = True
+        user.save()
+        response = self.client.get('/metrics/', HTTP_AUTHORIZATION='Token ' + user.get_token())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'foo 1\n')
+
+    def test_format_value(self):
+        self.assertEqual(Metrics.format_value(3), '3')
+        self.assertEqual(Metrics.format_value(1234567.0), '1234567')
+        self.assertEqual(Metrics.format_value(1234567.125), '1234567.125')
+        self.assertEqual(Metrics.format_value(0.1), '0.1')
@@ -1,11 +1,13 @@
 # pylint: disable=cyclic-import # only occurring in dev env
 
+import base64
 import json
 import mimetypes
 import os
 import random
 import shutil
 import tempfile
+import time
 import uuid
 import zipfile
 from collections import OrderedDict
@@ -25,7 +27,7 @@ from requests.auth import HTTPBasicAuth
 from rest_framework.utils import encoders
 
 from core.common.constants import UPDATED_SINCE_PARAM, BULK_IMPORT_QUEUES_COUNT, CURRENT_USER, REQUEST_URL, \
-    TEMP_PREFIX
+    TEMP_PREFIX, EXPORT_BATCH_SIZE, EXPORT_SHARD_SIZE, SEARCH_PIT_KEEP_ALIVE, SEARCH_PKS_BATCH_SIZE
 from core.settings import EXPORT_SERVICE
 
 
@@ -188,36 +190,31 @@ def get_class(kls):
     return _module
 
 
-def write_export_file(
-        version, resource_type, resource_serializer_type, logger
-):  # pylint: disable=too-many-statements,too-many-locals,too-many-branches
-    from core.concepts.models import Concept
-    from core.mappings.models import Mapping
-    cwd = cd_temp()
-    logger.info(f'Writing export file to tmp directory: {cwd}')
-
-    logger.info(f'Found {resource_type} version {version.version}.  Looking up resource...')
-    logger.info(f'Found {resource_type} {version.mnemonic}.  Serializing attributes...')
+EXPORT_CHILD_SERIALIZERS = dict(
+    concepts='core.concepts.serializers.ConceptVersionExportSerializer',
+    mappings='core.mappings.serializers.MappingDetailSerializer',
+    references='core.collections.serializers.CollectionReferenceSerializer',
+)
+EXPORT_CHILD_KEYS = dict(concepts='concept_id', mappings='mapping_id')
 
-    resource_serializer = get_class(resource_serializer_type)(version)
-    data = resource_serializer.data
-    resource_string = json.dumps(data, cls=encoders.JSONEncoder)
-    logger.info('Done serializing attributes.')
 
-    batch_size = 100
-    is_collection = resource_type == 'collection'
-
-    concepts_qs = Concept.objects.none()
-    mappings_qs = Mapping.objects.none()
+def get_export_through_queryset(version, child, is_collection):
+    from core.concepts.models import Concept
+    from core.mappings.models import Mapping
+    model = Concept if child == 'concepts' else Mapping
 
     if is_collection:
+        through = model.expansion_set.through.objects
         if version.expansion_uri:
-            concepts_qs = Concept.expansion_set.through.objects.filter(expansion_id=version.expansion.id)
-            mappings_qs = Mapping.expansion_set.through.objects.filter(expansion_id=version.expansion.id)
-    else:
-        concepts_qs = Concept.sources.through.objects.filter(source_id=version.id)
-        mappings_qs = Mapping.sources.through.objects.filter(source_id=version.id)
+            return through.filter(expansion_id=version.expansion.id)
+        return through.none()
+
+    return model.sources.through.objects.filter(source_id=version.id)
 
+
+def get_export_child_queryset(version, child, ids, is_collection):
+    from core.concepts.models import Concept
+    from core.mappings.models import Mapping
     filters = {}
 
     if not is_collection:
@@ -225,106 +222,72 @@ def write_export_file(
         if version.is_head:
             filters['is_latest_version'] = True
 
-    with open('export.json', 'w') as out:
-        out.write(f'{resource_string[:-1]}, "concepts": [')
-
-    resource_name = resource_type.title()
-
-    if concepts_qs.exists():
-        logger.info(f'{resource_name} has concepts. Getting them in batches of {batch_size:d}...')
-        concept_serializer_class = get_class('core.concepts.serializers.ConceptVersionExportSerializer')
-        start = 0
-        end = batch_size
-        batch_queryset = concepts_qs.order_by('-concept_id')[start:end]
-
-        while batch_queryset.exists():
-            logger.info(f'Serializing concepts {start + 1:d} - {end:d}...')
-            queryset = Concept.objects.filter(
-                id__in=batch_queryset.values_list('concept_id')).filter(**filters).order_by('-id')
-            if queryset.exists():
-                if start > 0:
-                    with open('export.json', 'a') as out:
-                        out.write(', ')
-                concept_versions = queryset.prefetch_related('names', 'descriptions')
-                data = concept_serializer_class(concept_versions, many=True).data
-                concept_string = json.dumps(data, cls=encoders.JSONEncoder)
-                concept_string = concept_string[1:-1]
-
-                with open('export.json', 'a') as out:
-                    out.write(concept_string)
-
-            start += batch_size
-            end += batch_size
-            batch_queryset = concepts_qs.order_by('-concept_id')[start:end]
-
-        logger.info('Done serializing concepts.')
-    else:
-        logger.info(f'{resource_name} has no concepts to serialize.')
+    if child == 'concepts':
+        return Concept.objects.filter(id__in=ids, **filters).order_by('-id').prefetch_related('names', 'descriptions')
 
-    if is_collection:
-        references_qs = version.references
-        total_references = references_qs.count()
-
-        with open('export.json', 'a') as out:
-            out.write('], "references": [')
-        if total_references:
-            logger.info(
-                f'{resource_name} has {total_references:d} references. Getting them in batches of {batch_size:d}...'
-            )
-            reference_serializer_class = get_class('core.collections.serializers.CollectionReferenceSerializer')
-            for start in range(0, total_references, batch_size):
-                end = min(start + batch_size, total_references)
-                logger.info(f'Serializing references {start + 1:d} - {end:d}...')
-                references = references_qs.order_by('-id').filter()[start:end]
-                reference_serializer = reference_serializer_class(references, many=True)
-                reference_string = json.dumps(reference_serializer.data, cls=encoders.JSONEncoder)
-                reference_string = reference_string[1:-1]
-                with open('export.json', 'a') as out:
-                    out.write(reference_string)
-                    if end != total_references:
-                        out.write(', ')
-            logger.info('Done serializing references.')
-        else:
-            logger.info(f'{resource_name} has no references to serialize.')
-
-    with open('export.json', 'a') as out:
-        out.write('], "mappings": [')
-
-    if mappings_qs.exists():
-        logger.info(f'{resource_name} has mappings. Getting them in batches of {batch_size:d}...')
-        mapping_serializer_class = get_class('core.mappings.serializers.MappingDetailSerializer')
-        start = 0
-        end = batch_size
-        batch_queryset = mappings_qs.order_by('-mapping_id')[start:end]
-
-        while batch_queryset.exists():
-            logger.info(f'Serializing mappings {start + 1:d} - {start + batch_size:d}...')
-            queryset = Mapping.objects.filter(
-                id__in=batch_queryset.values_list('mapping_id')).filter(**filters).order_by('-id')
-            if queryset.exists():
-                if start > 0:
-                    with open('export.json', 'a') as out:
-                        out.write(', ')
-
-                data = mapping_serializer_class(queryset, many=True).data
-                mapping_string = json.dumps(data, cls=encoders.JSONEncoder)
-                mapping_string = mapping_string[1:-1]
-                with open('export.json', 'a') as out:
-                    out.write(mapping_string)
-
-            start += batch_size
-            end += batch_size
-            batch_queryset = mappings_qs.order_by('-mapping_id')[start:end]
-
-        logger.info('Done serializing mappings.')
-    else:
-        logger.info(f'{resource_name} has no mappings to serialize.')
+    return Mapping.objects.filter(id__in=ids, **filters).order_by('-id')
+
+
+def write_export_batches(out, batches, to_queryset, child, tracker=None, is_first=True):  # pylint: disable=too-many-arguments
+    """
+    Serializes each batch and writes it to out (binary) as comma separated JSON array items.
+    Returns is_first for whoever continues writing the same array.
+    """
+    serializer_class = get_class(EXPORT_CHILD_SERIALIZERS[child])
+    for batch in batches:
+        data = serializer_class(to_queryset(batch), many=True).data
+        if data:
+            if not is_first:
+                out.write(b', ')
+            out.write(json.dumps(data, cls=encoders.JSONEncoder)[1:-1].encode('utf-8'))
+            is_first = False
+        if tracker:
+            tracker.update(child, len(data))
+    return is_first
+
+
+def write_export_json(out, version, resource_type, resource_serializer_type, write_children, logger):  # pylint: disable=too-many-arguments
+    """
+    Writes the export.json document to out (binary).
+    Concept/mapping array items are written by write_children(out, child).
+    """
+    logger.info(f'Found {resource_type} version {version.version}.  Looking up resource...')
+    logger.info(f'Found {resource_type} {version.mnemonic}.  Serializing attributes...')
+
+    resource_serializer = get_class(resource_serializer_type)(version)
+    resource_string = json.dumps(resource_serializer.data, cls=encoders.JSONEncoder)
+    logger.info('Done serializing attributes.')
+
+    out.write(f'{resource_string[:-1]}, "concepts": ['.encode('utf-8'))
+    write_children(out, 'concepts')
+
+    if resource_type == 'collection':
+        out.write(b'], "references": [')
+        logger.info('Serializing references...')
+        write_export_batches(
+            out, chunks_from_iterator(
+                version.references.order_by('-id').iterator(chunk_size=EXPORT_BATCH_SIZE), EXPORT_BATCH_SIZE),
+            lambda references: references, 'references'
+        )
+        logger.info('Done serializing references.')
 
-    with open('export.json', 'a') as out:
-        out.write(']}')
+    out.write(b'], "mappings": [')
+    write_children(out, 'mappings')
+    out.write(b']}')
 
-    with zipfile.ZipFile('export.zip', 'w', zipfile.ZIP_DEFLATED) as _zip:
-        _zip.write('export.json')
+
+def write_export_file(
+        version, resource_type, resource_serializer_type, logger, progress=None
+):  # pylint: disable=too-many-arguments
+    """
+    Streams the version export into export.zip (export.json entry) without holding it in memory.
+    Concepts/mappings are walked by keyset on the through table (no OFFSET) and references via a server-side cursor.
+    `progress`, if given, is called with a dict of counts and rows/sec after every batch.
+    """
+    cwd = cd_temp()
+    logger.info(f'Writing export file to tmp directory: {cwd}')
+
+    write_export_zip('export.zip', version, resource_type, resource_serializer_type, logger, progress)
 
     file_path = os.path.abspath('export.zip')
     logger.info(file_path)
@@ -351,6 +314,144 @@ def write_export_file(
     os.chdir(cwd)
 
 
+def write_export_zip(
+        file, version, resource_type, resource_serializer_type, logger, progress=None
+):  # pylint: disable=too-many-arguments
+    """
+    Writes the version export as the export.json entry of a zip to file (a path or a binary file object).
+    Concepts/mappings are walked by keyset on the through table (no OFFSET) and serialized a batch at a time.
+    """
+    is_collection = resource_type == 'collection'
+    tracker = ExportProgress(progress, logger)
+
+    def write_children(out, child):
+        logger.info(f'Serializing {child} in batches of {EXPORT_BATCH_SIZE:d}...')
+        write_export_batches(
+            out,
+            keyset_batches(
+                get_export_through_queryset(version, child, is_collection), EXPORT_CHILD_KEYS[child], EXPORT_BATCH_SIZE
+            ),
+            lambda ids: get_export_child_queryset(version, child, ids, is_collection),
+            child, tracker
+        )
+        logger.info(f'Done serializing {child}.')
+
+    with zipfile.ZipFile(file, 'w', zipfile.ZIP_DEFLATED) as _zip:
+        with _zip.open('export.json', 'w', force_zip64=True) as out:
+            write_export_json(out, version, resource_type, resource_serializer_type, write_children, logger)
+
+
+def get_export_shards(version, resource_type, shard_size=EXPORT_SHARD_SIZE):
+    """
+    Splits the version's concepts and mappings into contiguous id ranges of at most shard_size rows.
+    Returns (child, min_id, max_id) tuples in export order.
+    """
+    is_collection = resource_type == 'collection'
+    shards = []
+    for child in ['concepts', 'mappings']:
+        for ids in keyset_batches(
+                get_export_through_queryset(version, child, is_collection), EXPORT_CHILD_KEYS[child], shard_size
+        ):
+            shards.append((child, ids[-1], ids[0]))
+    return shards
+
+
+def get_export_shards_path(version):
+    return f"export_shards/{version.parent_resource}/{version.mnemonic}_{version.version}/"
+
+
+def get_export_shard_key(version, child, min_id, max_id):
+    return f"{get_export_shards_path(version)}{child}_{min_id}_{max_id}.json"
+
+
+def write_export_shard(version, resource_type, child, min_id, max_id, logger):  # pylint: disable=too-many-arguments
+    """
+    Serializes one id range of the version's concepts/mappings as JSON array items (no brackets)
+    and uploads it to the export service. Returns the shard description used for stitching.
+    """
+    is_collection = resource_type == 'collection'
+    key = EXPORT_CHILD_KEYS[child]
+    through_queryset = get_export_through_queryset(version, child, is_collection).filter(
+        **{f'{key}__gte': min_id, f'{key}__lte': max_id})
+    tracker = ExportProgress(None, logger)
+
+    with tempfile.NamedTemporaryFile(suffix='.json') as out:
+        is_empty = write_export_batches(
+            out, keyset_batches(through_queryset, key, EXPORT_BATCH_SIZE),
+            lambda ids: get_export_child_queryset(version, child, ids, is_collection),
+            child, tracker
+        )
+        out.flush()
+        shard_key = get_export_shard_key(version, child, min_id, max_id)
+        if not is_empty:
+            get_export_service().upload_file(key=shard_key, file_path=out.name, binary=True)
+
+    return dict(child=child, key=shard_key, empty=is_empty, count=tracker.total)
+
+
+def stitch_export_shards(version, resource_type, resource_serializer_type, shards, logger):  # pylint: disable=too-many-arguments
+    """
+    Builds export.zip from the uploaded shards, streaming it to the export service as a multipart upload,
+    so neither the shards nor the zip are ever fully held in memory. Removes the shards afterwards.
+    """
+    export_service = get_export_service()
+
+    def write_children(out, child):
+        is_first = True
+        for shard in shards:
+            if shard['child'] == child and not shard['empty']:
+                if not is_first:
+                    out.write(b', ')
+                for chunk in export_service.read_stream(shard['key']):
+                    out.write(chunk)
+                is_first = False
+
+    if version.is_head:
+        export_service.delete_objects(version.generic_export_path(suffix=None))
+
+    s3_key = version.export_path
+    logger.info(f'Stitching {len(shards):d} shards into {s3_key}...')
+    with export_service.multipart_writer(s3_key, metadata=dict(ContentType='application/zip')) as writer:
+        with zipfile.ZipFile(writer, 'w', zipfile.ZIP_DEFLATED) as _zip:
+            with _zip.open('export.json', 'w', force_zip64=True) as out:
+                write_export_json(out, version, resource_type, resource_serializer_type, write_children, logger)
+    logger.info(f'Uploaded to {export_service.url_for(s3_key)}.')
+
+    for shard in shards:
+        if not shard['empty']:
+            export_service.remove(shard['key'])
+
+
+class ExportProgress:
+    """
+    Keeps running counts of exported rows and reports them (with rows/sec) to the given callback.
+    """
+    def __init__(self, callback=None, logger=None):
+        self.callback = callback
+        self.logger = logger
+        self.started_at = time.time()
+        self.counts = {}
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+    @property
+    def rows_per_sec(self):
+        elapsed = time.time() - self.started_at
+        return round(self.total / elapsed, 2) if elapsed > 0 else 0
+
+    def to_dict(self):
+        return dict(**self.counts, total=self.total, rows_per_sec=self.rows_per_sec)
+
+    def update(self, name, count):
+        self.counts[name] = self.counts.get(name, 0) + count
+        if self.logger:
+            self.logger.info(f'Exported {self.counts[name]:d} {name} ({self.rows_per_sec} rows/sec)')
+        if self.callback:
+            self.callback(self.to_dict())
+
+
 def get_api_base_url():
     return settings.API_BASE_URL
 
@@ -610,7 +711,10 @@ def flatten_dict(dikt, parent_key='', sep='__'):
 
 def get_bulk_import_celery_once_lock_key(async_result):
     result_args = async_result.args
-    args = [('to_import', result_args[0]), ('username', result_args[1]), ('update_if_exists', result_args[2])]
+    args = [
+        ('to_import', get_import_lock_content(result_args[0])), ('username', result_args[1]),
+        ('update_if_exists', result_args[2])
+    ]
 
     if async_result.name == 'core.common.tasks.bulk_import_parallel_inline':
         args.append(('threads', result_args[3]))
@@ -618,6 +722,13 @@ def get_bulk_import_celery_once_lock_key(async_result):
     return get_celery_once_lock_key(async_result.name, args)
 
 
+def get_import_lock_content(to_import):
+    """Stored import files are locked on their content hash, their reference gets a new storage key every time."""
+    if isinstance(to_import, dict) and to_import.get('digest'):
+        return to_import['digest']
+    return to_import
+
+
 def get_celery_once_lock_key(name, args):
     return queue_once_key(name, OrderedDict(args), None)
 
@@ -652,6 +763,18 @@ def is_url_encoded_string(string, lower=True):
     return string == encoded_string
 
 
+def encode_search_cursor(pit, search_after):
+    return base64.urlsafe_b64encode(json.dumps(dict(pit=pit, search_after=search_after)).encode()).decode()
+
+
+def decode_search_cursor(cursor):
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return dict(pit=data['pit'], search_after=list(data['search_after']))
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
 def decode_string(string, plus=True):
     return parse.unquote_plus(string) if plus else parse.unquote(string)
 
@@ -819,6 +942,63 @@ def es_to_pks(search):
     return pks
 
 
+def es_to_pks_streamed(document, search, batch_size=SEARCH_PKS_BATCH_SIZE):
+    """
+    All the pks matching the search, walking a point in time with search_after: one ES request per batch_size hits
+    (es_to_pks makes one per 25) and no 10k result window.
+    """
+    connection = document._get_connection()  # pylint: disable=protected-access
+    pit_id = connection.open_point_in_time(
+        index=document._index._name, keep_alive=SEARCH_PIT_KEEP_ALIVE  # pylint: disable=protected-access
+    )['id']
+    search = search.index().source(excludes=['*']).sort('_shard_doc').extra(size=batch_size, track_total_hits=False)
+    search_after = None
+    pks = []
+    try:
+        while True:
+            page = search.extra(pit=dict(id=pit_id, keep_alive=SEARCH_PIT_KEEP_ALIVE))
+            if search_after:
+                page = page.extra(search_after=search_after)
+            response = page.execute()
+            hits = list(response.hits)
+            pks += [hit.meta.id for hit in hits]
+            if len(hits) < batch_size:
+                break
+            pit_id = getattr(response, 'pit_id', None) or pit_id
+            search_after = list(hits[-1].meta.sort)
+    finally:
+        connection.close_point_in_time(body=dict(id=pit_id), ignore=[404])
+    return pks
+
+
+def keyset_batches(queryset, key, batch_size=1000, descending=True):
+    """
+    Yields lists of `key` values in batches, paginating on the last seen key instead of OFFSET,
+    so every batch is a single indexed range scan regardless of how deep it is.
+    `key` must be unique within the queryset.
+    """
+    lookup = f'{key}__lt' if descending else f'{key}__gt'
+    queryset = queryset.prefetch_related(None).order_by(f'-{key}' if descending else key).values_list(key, flat=True)
+    batch = list(queryset[:batch_size])
+    while batch:
+        yield batch
+        if len(batch) < batch_size:
+            break
+        batch = list(queryset.filter(**{lookup: batch[-1]})[:batch_size])
+
+
+def chunks_from_iterator(iterator, size):
+    """Yield successive n-sized lists from an iterator without materializing it."""
+    chunk = []
+    for item in iterator:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
 def batch_qs(qs, batch_size=1000):
     """
     Returns a sub-queryset for each batch in the given queryset.
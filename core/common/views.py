@@ -1,4 +1,5 @@
 import base64
+import json
 import urllib.parse
 from email.mime.image import MIMEImage
 
@@ -6,7 +7,8 @@ import markdown
 import requests
 from django.conf import settings
 from django.core.mail import EmailMessage
-from django.http import Http404, HttpResponse
+from django.db.models import Case, When, IntegerField
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
@@ -17,17 +19,19 @@ from rest_framework import response, generics, status
 from rest_framework.generics import ListAPIView, RetrieveUpdateDestroyAPIView
 from rest_framework.permissions import AllowAny, IsAdminUser
 from rest_framework.response import Response
+from rest_framework.utils import encoders
 from rest_framework.views import APIView
 
 from core import __version__
 from core.common.constants import SEARCH_PARAM, LIST_DEFAULT_LIMIT, CSV_DEFAULT_LIMIT, \
     LIMIT_PARAM, NOT_FOUND, MUST_SPECIFY_EXTRA_PARAM_IN_BODY, INCLUDE_RETIRED_PARAM, VERBOSE_PARAM, HEAD, LATEST, \
-    BRIEF_PARAM, ES_REQUEST_TIMEOUT, INCLUDE_INACTIVE, FHIR_LIMIT_PARAM
+    BRIEF_PARAM, ES_REQUEST_TIMEOUT, INCLUDE_INACTIVE, FHIR_LIMIT_PARAM, LIST_PAYLOAD_PARAMS, SEARCH_CURSOR_PARAM, \
+    SEARCH_STREAM_PARAM, SEARCH_PIT_KEEP_ALIVE, SEARCH_STREAM_BATCH_SIZE
 from core.common.exceptions import Http400
 from core.common.mixins import PathWalkerMixin, ListWithHeadersMixin
 from core.common.serializers import RootSerializer
 from core.common.utils import compact_dict_by_values, to_snake_case, to_camel_case, parse_updated_since_param, \
-    is_url_encoded_string
+    is_url_encoded_string, encode_search_cursor, decode_search_cursor
 from core.concepts.permissions import CanViewParentDictionary, CanEditParentDictionary
 from core.orgs.constants import ORG_OBJECT_TYPE
 from core.users.constants import USER_OBJECT_TYPE
@@ -52,6 +56,11 @@ class BaseAPIView(generics.GenericAPIView, PathWalkerMixin):
     exact_match = 'exact_match'
     facet_class = None
     total_count = 0
+    es_facets = None
+    es_native_list_serializer_class = None
+    is_es_native_results = False
+    is_cursor_paginated = False
+    next_search_cursor = None
 
     def has_no_kwargs(self):
         return len(self.kwargs.values()) == 0
@@ -241,9 +250,7 @@ class BaseAPIView(generics.GenericAPIView, PathWalkerMixin):
 
         return criterion
 
-    def get_faceted_criterion(self):
-        filters = self.get_faceted_filters()
-
+    def get_faceted_criteria(self):
         def get_query(attr, val):
             not_query = val.startswith('!')
             vals = val.replace('!', '', 1).split(',')
@@ -259,14 +266,19 @@ class BaseAPIView(generics.GenericAPIView, PathWalkerMixin):
 
             return criteria
 
-        if filters:
-            first_filter = filters.popitem()
-            criterion = get_query(first_filter[0], first_filter[1])
-            for field, value in filters.items():
-                criterion &= get_query(field, value)
+        return {field: get_query(field, value) for field, value in self.get_faceted_filters().items()}
+
+    def get_faceted_criterion(self):
+        criteria = list(self.get_faceted_criteria().values())
+        if criteria:
+            criterion = criteria.pop()
+            for _criterion in criteria:
+                criterion &= _criterion
 
             return criterion
 
+        return None
+
     def get_faceted_filters(self, split=False):
         faceted_filters = {}
         faceted_fields = self.get_faceted_fields()
@@ -356,6 +368,9 @@ class BaseAPIView(generics.GenericAPIView, PathWalkerMixin):
         return filters
 
     def get_facets(self):
+        if self.es_facets is not None:
+            return self.es_facets
+
         facets = {}
 
         if self.facet_class:
@@ -499,7 +514,11 @@ class BaseAPIView(generics.GenericAPIView, PathWalkerMixin):
             extras_fields_exists = self.get_extras_fields_exists_from_query_params()
 
             if faceted_criterion:
-                results = results.query(faceted_criterion)
+                if self.should_aggregate_facets():
+                    # only the facet selections are post filters, see aggregate_facets
+                    results = results.post_filter(faceted_criterion)
+                else:
+                    results = results.query(faceted_criterion)
 
             if self.is_exact_match_on():
                 results = results.query(self.get_exact_search_criterion())
@@ -591,30 +610,201 @@ class BaseAPIView(generics.GenericAPIView, PathWalkerMixin):
 
         return criterion
 
-    def get_search_results_qs(self):
-        search_results = self.__search_results
-        search_results = search_results.params(request_timeout=ES_REQUEST_TIMEOUT)
-        try:
-            self.total_count = search_results.count()
-        except TransportError as ex:
-            raise Http400(detail='Data too large.') from ex
+    def should_aggregate_facets(self):
+        return bool(self.facet_class) and self.should_include_facets() and not self.is_user_document()
+
+    def aggregate_facets(self, search):
+        """
+        Facets are aggregated on the search's own query, so unlike the separate facet_class search they used to
+        come from, their counts also follow the extras, updated since, retired, privacy and owner filters of the
+        results. As before, each facet's buckets apply the selections of the other facets, not its own.
+        """
+        criteria = self.get_faceted_criteria()
+        for name, facet in self.facet_class.facets.items():
+            field = facet._params['field']  # pylint: disable=protected-access
+            agg_filter = Q('match_all')
+            for _field, criterion in criteria.items():
+                if _field != field:
+                    agg_filter &= criterion
+            search.aggs.bucket(f'_filter_{name}', 'filter', filter=agg_filter).bucket(name, facet.get_aggregation())
+
+        return search
+
+    def get_facets_from_response(self, search_response):
+        filter_values = self.get_faceted_filters(True)
+        facets = {}
+        for name, facet in self.facet_class.facets.items():
+            field = facet._params['field']  # pylint: disable=protected-access
+            data = getattr(getattr(search_response.aggregations, f'_filter_{name}'), name)
+            facets[name] = facet.get_values(data, filter_values.get(field, ()))
+
+        return facets
+
+    def get_queryset_from_hits(self, hits):
+        pks = [hit.meta.id for hit in hits]
+        queryset = self.document_model.django.model.objects.filter(pk__in=pks)
+        if pks:
+            queryset = queryset.order_by(
+                Case(*[When(pk=pk, then=position) for position, pk in enumerate(pks)], output_field=IntegerField())
+            )
+
+        return queryset
+
+    def should_render_from_es_source(self):
+        if not settings.ES_NATIVE_LIST_RESULTS or not self.es_native_list_serializer_class:
+            return False
+        request = self.request
+        if request.method != 'GET' or get(request, 'instance'):
+            return False
+        if any(param in request.query_params for param in LIST_PAYLOAD_PARAMS):
+            return False
+
+        return self.get_serializer_class() == self.es_native_list_serializer_class
+
+    @staticmethod
+    def have_list_payloads(hits):
+        # documents indexed before list_payload existed, or while ES_NATIVE_LIST_RESULTS was off,
+        # are served from Postgres
+        return all(getattr(hit, 'list_payload', None) for hit in hits)
+
+    def get_es_search(self, should_render_from_source=False):
+        search = self.__search_results.params(request_timeout=ES_REQUEST_TIMEOUT)
+        if should_render_from_source:
+            return search.source(includes=['list_payload'])
+        return search.source(excludes=['*'])
+
+    def open_point_in_time(self):
+        connection = self.document_model._get_connection()  # pylint: disable=protected-access
+        return connection.open_point_in_time(
+            index=self.document_model._index._name, keep_alive=SEARCH_PIT_KEEP_ALIVE  # pylint: disable=protected-access
+        )['id']
+
+    def close_point_in_time(self, pit_id):
+        connection = self.document_model._get_connection()  # pylint: disable=protected-access
+        connection.close_point_in_time(body=dict(id=pit_id), ignore=[404])
+
+    @staticmethod
+    def apply_search_cursor(search, cursor):
+        search = search.index().extra(pit=dict(id=cursor['pit'], keep_alive=SEARCH_PIT_KEEP_ALIVE))
+        if cursor['search_after']:
+            search = search.extra(search_after=cursor['search_after'])
+        return search
+
+    @staticmethod
+    def get_next_search_cursor(search_response, cursor):
+        return dict(
+            pit=getattr(search_response, 'pit_id', None) or cursor['pit'],
+            search_after=list(search_response.hits[-1].meta.sort)
+        )
 
+    def get_search_cursor(self):
+        cursor = self.request.query_params.get(SEARCH_CURSOR_PARAM, None)
+        if cursor is None:
+            return None
+        if cursor in ['', 'true', True]:
+            return dict(pit=self.open_point_in_time(), search_after=None)
+
+        cursor = decode_search_cursor(cursor)
+        if not cursor:
+            raise Http400(detail='Invalid cursor.')
+        return cursor
+
+    def get_search_results_qs(self):
+        """
+        Runs one _search for the page: exact total via track_total_hits and, if requested, the facet
+        aggregations in the same request. Only ids are fetched from ES and rows come from Postgres, unless
+        the list can be rendered from the list payload stored in the index (ES_NATIVE_LIST_RESULTS).
+        With `cursor`, pages are walked with search_after in a point in time instead of from/size,
+        so there is no 10k result window.
+        """
         self.limit = int(self.limit)
 
         self.limit = self.limit or LIST_DEFAULT_LIMIT
         page = max(int(self.request.GET.get('page') or '1'), 1)
         start = (page - 1) * self.limit
         end = start + self.limit
+
+        should_render_from_source = self.should_render_from_es_source()
+        search_results = self.get_es_search(should_render_from_source).extra(track_total_hits=True)
+        cursor = self.get_search_cursor()
+        if cursor is None:
+            search_results = search_results[start:end]
+        else:
+            search_results = self.apply_search_cursor(search_results, cursor).extra(size=self.limit)
+        should_aggregate_facets = self.should_aggregate_facets()
+        if should_aggregate_facets:
+            search_results = self.aggregate_facets(search_results)
         try:
-            return search_results[start:end].to_queryset()
+            search_response = search_results.execute()
         except RequestError as ex:  # pragma: no cover
             if get(ex, 'info.error.caused_by.reason', '').startswith('Result window is too large'):
-                raise Http400(detail='Only 10000 results are available. Please apply additional filters'
-                                     ' or fine tune your query to get more accurate results.') from ex
+                raise Http400(detail='Only 10000 results are available. Please use the cursor param, apply '
+                                     'additional filters or fine tune your query to get more accurate results.') from ex
             raise ex
         except TransportError as ex:  # pragma: no cover
             raise Http400(detail='Data too large.') from ex
 
+        self.total_count = search_response.hits.total.value
+        if should_aggregate_facets:
+            self.es_facets = self.get_facets_from_response(search_response)
+        if cursor is not None:
+            self.is_cursor_paginated = True
+            if len(search_response.hits) == self.limit:
+                self.next_search_cursor = encode_search_cursor(
+                    **self.get_next_search_cursor(search_response, cursor))
+            else:  # last page, the point in time isn't needed anymore
+                self.close_point_in_time(getattr(search_response, 'pit_id', None) or cursor['pit'])
+
+        hits = search_response.hits
+        if should_render_from_source and self.have_list_payloads(hits):
+            self.is_es_native_results = True
+            return list(hits)
+
+        return self.get_queryset_from_hits(hits)
+
+    def should_stream_search_results(self):
+        return self.is_searchable and self.request.query_params.get(SEARCH_STREAM_PARAM, None) in ['true', True]
+
+    def iterate_search_hits(self, search, batch_size=SEARCH_STREAM_BATCH_SIZE):
+        cursor = dict(pit=self.open_point_in_time(), search_after=None)
+        try:
+            while True:
+                search_response = self.apply_search_cursor(search, cursor).extra(
+                    size=batch_size, track_total_hits=False).execute()
+                hits = list(search_response.hits)
+                if hits:
+                    yield hits
+                if len(hits) < batch_size:
+                    break
+                cursor = self.get_next_search_cursor(search_response, cursor)
+        finally:
+            self.close_point_in_time(cursor['pit'])
+
+    def get_search_results_ndjson(self, search, should_render_from_source):
+        from core.common.serializers import ESNativeListSerializer
+        serializer_class = self.get_serializer_class()
+        for hits in self.iterate_search_hits(search):
+            if should_render_from_source and self.have_list_payloads(hits):
+                data = ESNativeListSerializer(hits, many=True).data
+            else:
+                data = serializer_class(
+                    self.get_queryset_from_hits(hits), many=True, context=self.get_serializer_context()).data
+            for item in data:
+                yield json.dumps(item, cls=encoders.JSONEncoder) + '\n'
+
+    def stream_search_results(self):
+        """
+        Streams every matching result as NDJSON, walking a point in time with search_after in batches,
+        for exports which are beyond the 10k result window.
+        """
+        if not self.should_perform_es_search():
+            raise Http400(detail='Streaming needs a search query, facet or extras filter.')
+        should_render_from_source = self.should_render_from_es_source()
+        return StreamingHttpResponse(
+            self.get_search_results_ndjson(self.get_es_search(should_render_from_source), should_render_from_source),
+            content_type='application/x-ndjson'
+        )
+
     def should_perform_es_search(self):
         return bool(self.get_search_string()) or self.has_searchable_extras_fields() or bool(self.get_faceted_filters())
 
@@ -750,6 +940,20 @@ class APIVersionView(APIView):  # pragma: no cover
         return Response(__version__)
 
 
+class MetricsView(APIView):
+    """Prometheus scrape endpoint for staff users, or for ?token=<METRICS_ACCESS_TOKEN> when it is set."""
+    permission_classes = (AllowAny,)
+    swagger_schema = None
+
+    @staticmethod
+    def get(request):
+        from core.common.metrics import metrics
+        token = settings.METRICS_ACCESS_TOKEN
+        if not request.user.is_staff and not (token and request.query_params.get('token') == token):
+            return Response(status=status.HTTP_403_FORBIDDEN)
+        return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 class ChangeLogView(APIView):  # pragma: no cover
     permission_classes = (AllowAny, )
     swagger_schema = None
@@ -0,0 +1,373 @@
+from array import array
+from collections import OrderedDict, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import F, Q
+
+from core.common.caching import get_generations, get_repo_cache_namespace_from_uri, get_repo_version_cache_namespace, \
+    get_expansion_cache_namespace
+
+CONCEPT_GRAPH_CACHE_PREFIX = 'concept_graph'
+LOCAL_CONCEPT_GRAPHS = OrderedDict()
+
+
+def q_matches(criteria, values):
+    """Evaluates a Q of plain/`__in` lookups (e.g. map_types criteria) against a dict of field values."""
+    results = []
+    for child in criteria.children:
+        if isinstance(child, Q):
+            results.append(q_matches(child, values))
+            continue
+        lookup, value = child
+        if lookup.endswith('__in'):
+            results.append(values[lookup[:-4]] in value)
+        elif lookup in values:
+            results.append(values[lookup] == value)
+        else:
+            raise ValueError(f'Unsupported lookup {lookup}')
+    result = all(results) if criteria.connector == Q.AND else any(results)
+    return not result if criteria.negated else result
+
+
+class ConceptGraph:
+    """
+    Adjacency lists of a released repo version: member concepts and mappings as int arrays, hierarchy as
+    versioned object id pairs. Only the arrays are pickled into the cache, the lookup dicts are rebuilt on load.
+    """
+    def __init__(self, concepts, hierarchy, mappings):
+        concept_ids, concept_versioned_object_ids, concepts_retired = zip(*concepts) if concepts else ([], [], [])
+        self.concept_ids = array('q', concept_ids)
+        self.concept_versioned_object_ids = array('q', concept_versioned_object_ids)
+        self.concepts_retired = array('b', concepts_retired)
+        parent_ids, child_ids = zip(*hierarchy) if hierarchy else ([], [])
+        self.parent_ids = array('q', parent_ids)
+        self.child_ids = array('q', child_ids)
+        mapping_ids, from_ids, to_ids, map_types, mappings_retired = zip(*mappings) if mappings else (
+            [], [], [], [], [])
+        self.map_types = sorted(set(map_types), key=str)
+        map_type_indexes = {map_type: index for index, map_type in enumerate(self.map_types)}
+        self.mapping_ids = array('q', mapping_ids)
+        self.mapping_from_ids = array('q', [from_id or 0 for from_id in from_ids])
+        self.mapping_to_ids = array('q', [to_id or 0 for to_id in to_ids])
+        self.mapping_map_types = array('i', [map_type_indexes[map_type] for map_type in map_types])
+        self.mappings_retired = array('b', mappings_retired)
+        self.build_index()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for attr in ['versioned_object_ids', 'members', 'children', 'parents', 'mappings_from', 'mappings_to']:
+            state.pop(attr, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.build_index()
+
+    def build_index(self):
+        self.versioned_object_ids = dict(zip(self.concept_ids, self.concept_versioned_object_ids))
+        self.members = defaultdict(list)
+        for index, versioned_object_id in enumerate(self.concept_versioned_object_ids):
+            self.members[versioned_object_id].append(index)
+        self.children = defaultdict(list)
+        self.parents = defaultdict(list)
+        for parent_id, child_id in zip(self.parent_ids, self.child_ids):
+            self.children[parent_id].append(child_id)
+            self.parents[child_id].append(parent_id)
+        self.mappings_from = defaultdict(list)
+        self.mappings_to = defaultdict(list)
+        for index, (from_id, to_id) in enumerate(zip(self.mapping_from_ids, self.mapping_to_ids)):
+            self.mappings_from[from_id].append(index)
+            self.mappings_to[to_id].append(index)
+
+    @classmethod
+    def build(cls, container):
+        from core.concepts.models import HierarchicalConcepts
+        concepts = container.concepts.all()
+        member_ids, member_versioned_object_ids = concepts.values('id'), concepts.values('versioned_object_id')
+        hierarchy = HierarchicalConcepts.objects.filter(
+            Q(parent_id__in=member_ids) | Q(parent_id__in=member_versioned_object_ids) |
+            Q(child_id__in=member_ids) | Q(child_id__in=member_versioned_object_ids)
+        ).values_list('parent__versioned_object_id', 'child__versioned_object_id').distinct()
+        mappings = container.mappings.values_list(
+            'id', 'from_concept__versioned_object_id', 'to_concept__versioned_object_id', 'map_type', 'retired')
+        return cls(
+            list(concepts.values_list('id', 'versioned_object_id', 'retired')), list(hierarchy), list(mappings))
+
+    def get_member_ids(self, versioned_object_ids, include_retired):
+        return [
+            self.concept_ids[index] for versioned_object_id in versioned_object_ids
+            for index in self.members.get(versioned_object_id, [])
+            if include_retired or not self.concepts_retired[index]
+        ]
+
+    def get_cascaded(  # pylint: disable=too-many-arguments
+            self, concept_id, versioned_object_id, reverse=False, hierarchy=True, mapping_targets=True,
+            mappings=True, include_retired=False, map_types=None
+    ):
+        """Returns the member concept ids and mapping ids a concept cascades to, in the given direction."""
+        versioned_object_id = self.versioned_object_ids.get(concept_id, versioned_object_id)
+        concept_ids = []
+        if hierarchy:
+            concept_ids += self.get_member_ids(
+                (self.parents if reverse else self.children).get(versioned_object_id, []), include_retired)
+        mapping_ids = []
+        if mappings or mapping_targets:
+            targets = []
+            for index in (self.mappings_to if reverse else self.mappings_from).get(versioned_object_id, []):
+                if (not include_retired and self.mappings_retired[index]) or (
+                        map_types is not None and self.mapping_map_types[index] not in map_types):
+                    continue
+                mapping_ids.append(self.mapping_ids[index])
+                targets.append((self.mapping_from_ids if reverse else self.mapping_to_ids)[index])
+            if mapping_targets:
+                concept_ids += self.get_member_ids(targets, include_retired)
+            if not mappings:
+                mapping_ids = []
+        return concept_ids, mapping_ids
+
+    def get_map_type_indexes(self, criteria):
+        return {
+            index for index, map_type in enumerate(self.map_types) if q_matches(criteria, dict(map_type=map_type))}
+
+
+def get_concept_graph(repo_version, container):
+    """
+    Returns the cached graph of a released repo version, building and caching it on a miss.
+    A collection version's graph is keyed on its expansion's generation too, bumped when its members change.
+    """
+    namespace = get_repo_cache_namespace_from_uri(repo_version.uri)
+    namespaces = [namespace, get_repo_version_cache_namespace(namespace, repo_version.version)]
+    if container is not repo_version:
+        namespaces.append(get_expansion_cache_namespace(container))
+    generations = get_generations(*namespaces)
+    key = f"{CONCEPT_GRAPH_CACHE_PREFIX}:{container.__class__.__name__}:{container.id}:{generations}"
+    graph = LOCAL_CONCEPT_GRAPHS.get(key)
+    if graph is None:
+        graph = cache.get(key)
+        if graph is None:
+            graph = ConceptGraph.build(container)
+            cache.set(key, graph, settings.CONCEPT_GRAPH_CACHE_TTL)
+        LOCAL_CONCEPT_GRAPHS[key] = graph
+        while len(LOCAL_CONCEPT_GRAPHS) > settings.CONCEPT_GRAPH_LOCAL_CACHE_SIZE:
+            LOCAL_CONCEPT_GRAPHS.popitem(last=False)
+    else:
+        LOCAL_CONCEPT_GRAPHS.move_to_end(key)
+    return graph
+
+
+class ConceptCascade:
+    """
+    Computes a concept's $cascade (hierarchy and mappings, forward or reverse) in a single recursive CTE.
+    Every iteration of the CTE is one cascade level, it carries the level's frontier along with the concept and
+    mapping ids collected so far, so cycles stop at already collected ids and max_results is checked per level.
+    Released repo versions don't change, so they are walked level by level on their cached ConceptGraph instead.
+    """
+    # pylint: disable=too-many-instance-attributes,too-many-arguments
+    def __init__(
+            self, concept, repo_version, is_collection=False, source_mappings=True, source_to_concepts=True,
+            mappings_criteria=None, cascade_mappings=True, cascade_hierarchy=True, cascade_levels='*',
+            include_mappings=True, include_retired=False, reverse=False, max_results=1000
+    ):
+        self.concept = concept
+        self.repo_version = repo_version
+        self.is_collection = is_collection
+        self.mappings_criteria = mappings_criteria or Q()
+        self.cascade_mappings = cascade_mappings and (source_mappings or source_to_concepts)
+        self.cascade_mapping_targets = self.cascade_mappings and source_to_concepts
+        self.cascade_hierarchy = cascade_hierarchy and source_to_concepts
+        self.cascade_levels = None if cascade_levels == '*' else int(cascade_levels)
+        self.include_mappings = include_mappings
+        self.include_retired = include_retired
+        self.reverse = reverse
+        self.max_results = max_results
+
+    @property
+    def container(self):
+        return self.repo_version.expansion if self.is_collection else self.repo_version
+
+    def get_concepts_queryset(self):
+        queryset = self.container.concepts.all()
+        if not self.is_collection and self.repo_version.is_head:
+            queryset = queryset.filter(id=F('versioned_object_id'))
+        if not self.include_retired:
+            queryset = queryset.filter(retired=False)
+        return queryset.values('id', 'versioned_object_id')
+
+    def get_mappings_queryset(self):
+        queryset = self.container.mappings.filter(self.mappings_criteria)
+        if not self.is_collection and self.repo_version.is_head:
+            queryset = queryset.filter(id=F('versioned_object_id'))
+        if not self.include_retired:
+            queryset = queryset.filter(retired=False)
+        return queryset.values('id', 'from_concept_id', 'to_concept_id')
+
+    def get_targets_sql(self):
+        concepts_table = self.concept._meta.db_table  # pylint: disable=protected-access
+        frontier_ids = f"SELECT unnest(closure.frontier) UNION " \
+                       f"SELECT versioned_object_id FROM {concepts_table} WHERE id = ANY(closure.frontier)"
+        mapping_from, mapping_to = ('to_concept_id', 'from_concept_id') if self.reverse else (
+            'from_concept_id', 'to_concept_id')
+        targets = []
+        if self.cascade_hierarchy:
+            from core.concepts.models import HierarchicalConcepts
+            hierarchy_table = HierarchicalConcepts._meta.db_table  # pylint: disable=protected-access
+            hierarchy_from, hierarchy_to = ('child_id', 'parent_id') if self.reverse else ('parent_id', 'child_id')
+            # hierarchy is related to both the versioned object and its latest version
+            targets.append(
+                f"""
+                SELECT hierarchy_member.id FROM {hierarchy_table} AS hierarchy
+                JOIN {concepts_table} AS hierarchy_target ON hierarchy_target.id = hierarchy.{hierarchy_to}
+                JOIN eligible_concepts AS hierarchy_member
+                ON hierarchy_member.versioned_object_id = hierarchy_target.versioned_object_id
+                WHERE hierarchy.{hierarchy_from} IN (
+                    SELECT related.id FROM {concepts_table} AS frontier
+                    JOIN {concepts_table} AS related ON related.id = frontier.id OR (
+                        related.versioned_object_id = frontier.versioned_object_id
+                        AND (frontier.id = frontier.versioned_object_id OR frontier.is_latest_version)
+                        AND (related.id = related.versioned_object_id OR related.is_latest_version)
+                    )
+                    WHERE frontier.id = ANY(closure.frontier)
+                )
+                """
+            )
+        if self.cascade_mapping_targets:
+            targets.append(
+                f"""
+                SELECT mapping_target.id FROM eligible_mappings AS mapping
+                JOIN {concepts_table} AS endpoint ON endpoint.id = mapping.{mapping_to}
+                JOIN eligible_concepts AS mapping_target
+                ON mapping_target.versioned_object_id = endpoint.versioned_object_id
+                WHERE mapping.{mapping_from} IN ({frontier_ids})
+                """
+            )
+        concepts_sql = " UNION ".join(targets) if targets else "SELECT NULL::bigint AS id WHERE false"
+        mappings_sql = f"""
+            SELECT mapping.id FROM eligible_mappings AS mapping WHERE mapping.{mapping_from} IN ({frontier_ids})
+        """ if self.cascade_mappings and self.include_mappings else "SELECT NULL::bigint AS id WHERE false"
+
+        return concepts_sql, mappings_sql
+
+    def get_sql(self):
+        concepts_queryset_sql, concepts_queryset_params = self.get_concepts_queryset().query.sql_with_params()
+        mappings_queryset_sql, mappings_queryset_params = self.get_mappings_queryset().query.sql_with_params()
+        concepts_sql, mappings_sql = self.get_targets_sql()
+        sql = f"""
+            WITH RECURSIVE eligible_concepts AS NOT MATERIALIZED ({concepts_queryset_sql}),
+            eligible_mappings AS NOT MATERIALIZED ({mappings_queryset_sql}),
+            closure(level, frontier, concept_ids, mapping_ids) AS (
+                SELECT 0, ARRAY[%s]::bigint[], ARRAY[%s]::bigint[], ARRAY[]::bigint[]
+                UNION ALL
+                SELECT
+                    closure.level + 1, step.concept_ids,
+                    closure.concept_ids || step.concept_ids, closure.mapping_ids || step.mapping_ids
+                FROM closure CROSS JOIN LATERAL (
+                    SELECT
+                        ARRAY(
+                            SELECT DISTINCT target.id::bigint FROM ({concepts_sql}) AS target
+                            WHERE target.id <> ALL(closure.concept_ids)
+                        ) AS concept_ids,
+                        ARRAY(
+                            SELECT DISTINCT target.id::bigint FROM ({mappings_sql}) AS target
+                            WHERE target.id <> ALL(closure.mapping_ids)
+                        ) AS mapping_ids
+                ) AS step
+                WHERE cardinality(closure.frontier) > 0 AND (%s::int IS NULL OR closure.level < %s::int) AND (
+                    closure.level = 0 OR cardinality(closure.concept_ids) + cardinality(closure.mapping_ids) < %s
+                )
+            )
+            SELECT concept_ids, mapping_ids FROM closure ORDER BY level DESC LIMIT 1
+        """
+        params = [
+            *concepts_queryset_params, *mappings_queryset_params, self.concept.id, self.concept.id,
+            self.cascade_levels, self.cascade_levels, self.max_results
+        ]
+        return sql, params
+
+    def should_use_graph(self):
+        # an expansion still being populated would cache an incomplete graph
+        return settings.CONCEPT_GRAPH_CACHE_ENABLED and not self.repo_version.is_head and not (
+            self.is_collection and self.container.is_processing)
+
+    def get_graph(self):
+        """Returns the cached graph with the map types allowed by mappings_criteria, or None if it can't be used."""
+        if not self.should_use_graph():
+            return None, None
+        graph = get_concept_graph(self.repo_version, self.container)
+        try:
+            return graph, graph.get_map_type_indexes(self.mappings_criteria)
+        except ValueError:  # criteria other than map types are left to SQL
+            return None, None
+
+    def get_graph_cascaded(self, graph, concept_id, map_types):
+        return graph.get_cascaded(
+            concept_id, self.concept.versioned_object_id, reverse=self.reverse, hierarchy=self.cascade_hierarchy,
+            mapping_targets=self.cascade_mapping_targets, mappings=self.cascade_mappings and self.include_mappings,
+            include_retired=self.include_retired, map_types=map_types
+        )
+
+    def walk_graph(self, graph, map_types):
+        concept_ids, mapping_ids = {self.concept.id: None}, {}
+        frontier, level = [self.concept.id], 0
+        while frontier and (self.cascade_levels is None or level < self.cascade_levels) and (
+                level == 0 or len(concept_ids) + len(mapping_ids) < self.max_results):
+            new_concept_ids = {}
+            for concept_id in frontier:
+                cascaded_concept_ids, cascaded_mapping_ids = self.get_graph_cascaded(graph, concept_id, map_types)
+                new_concept_ids.update(
+                    {cascaded_id: None for cascaded_id in cascaded_concept_ids if cascaded_id not in concept_ids})
+                mapping_ids.update(dict.fromkeys(cascaded_mapping_ids))
+            concept_ids.update(new_concept_ids)
+            frontier = list(new_concept_ids)
+            level += 1
+        return list(concept_ids), list(mapping_ids)
+
+    def walk_graph_hierarchy(self, graph, map_types):
+        entries = {}
+        frontier, level = [self.concept.id], 0
+        while frontier and (self.cascade_levels is None or level < self.cascade_levels):
+            new_frontier = []
+            for concept_id in frontier:
+                if concept_id in entries:
+                    continue
+                concept_ids, mapping_ids = self.get_graph_cascaded(graph, concept_id, map_types)
+                entries[concept_id] = (sorted(set(concept_ids)), list(dict.fromkeys(mapping_ids)))
+                new_frontier += entries[concept_id][0]
+            frontier = new_frontier
+            level += 1
+        terminals = {}
+        for concept_id in frontier:  # last level, when cascade levels are finite
+            if concept_id not in entries and concept_id not in terminals:
+                concept_ids, mapping_ids = self.get_graph_cascaded(graph, concept_id, map_types)
+                terminals[concept_id] = not (concept_ids or mapping_ids)
+        return entries, terminals
+
+    def hierarchy(self):
+        """
+        Returns {concept_id: (concept_ids, mapping_ids)} of every cascaded concept in cascade order and
+        {concept_id: terminal} of the last level ones that aren't cascaded, walked on the cached graph,
+        or None when the graph can't be used.
+        """
+        if self.is_collection and not self.container:
+            return None
+        graph, map_types = self.get_graph()
+        if graph is None:
+            return None
+        return self.walk_graph_hierarchy(graph, map_types)
+
+    def run(self):
+        """Returns the cascaded concept ids (including the concept itself) and mapping ids."""
+        if self.cascade_levels == 0 or (self.is_collection and not self.container):
+            return [self.concept.id], []
+
+        graph, map_types = self.get_graph()
+        if graph is not None:
+            return self.walk_graph(graph, map_types)
+
+        sql, params = self.get_sql()
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            concept_ids, mapping_ids = cursor.fetchone()
+
+        return concept_ids, mapping_ids
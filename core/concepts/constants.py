@@ -44,3 +44,4 @@ PERSIST_CLONE_ERROR = 'An error occurred while saving new concept version.'
 PARENT_VERSION_NOT_LATEST_CANNOT_UPDATE_CONCEPT = 'Parent version is not the latest. Cannot update concept.'
 CONCEPT_PATTERN = r'[a-zA-Z0-9\-\.\_\@\+\%\s]+'
 CONCEPT_REGEX = re.compile(r'^' + CONCEPT_PATTERN + '$')
+HIERARCHY_CLOSURE_MAX_DEPTH = 64  # guards the closure's recursive CTE against hierarchy cycles
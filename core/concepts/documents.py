@@ -1,7 +1,10 @@
+from django.conf import settings
 from django_elasticsearch_dsl import Document, fields
 from django_elasticsearch_dsl.registries import registry
 from elasticsearch_dsl import analyzer
+from pydash import get
 
+from core.common.documents import PrefetchedIndexingMixin
 from core.common.utils import jsonify_safe, flatten_dict
 from core.concepts.models import Concept, LocalizedText
 from core.sources.models import Source
@@ -12,7 +15,7 @@ folding_analyzer = analyzer('folding_analyzer',
    )
 
 @registry.register_document
-class ConceptDocument(Document):
+class ConceptDocument(PrefetchedIndexingMixin, Document):
     class Index:
         name = 'concepts'
         settings = {'number_of_shards': 1, 'number_of_replicas': 0}
@@ -40,6 +43,7 @@ class ConceptDocument(Document):
     is_active = fields.KeywordField(attr='is_active')
     is_latest_version = fields.KeywordField(attr='is_latest_version')
     extras = fields.ObjectField(dynamic=True)
+    list_payload = fields.ObjectField(enabled=False)
     created_by = fields.KeywordField(attr='created_by.username')
     source_canonical_url = fields.KeywordField(attr='parent.canonical_url')
     name_types = fields.ListField(fields.KeywordField())
@@ -83,37 +87,42 @@ class ConceptDocument(Document):
 
     @staticmethod
     def prepare_locale(instance):
-        return list(
-            instance.names.filter(locale__isnull=False).distinct('locale').values_list('locale', flat=True)
-        )
+        return sorted({name.locale for name in instance.names.all() if name.locale})
 
     @staticmethod
     def prepare_synonyms(instance):
-        return list(map(lambda x: x.lower(), instance.names.filter(name__isnull=False).values_list('name', flat=True)))
+        return [name.name.lower() for name in instance.names.all() if name.name]
 
     @staticmethod
     def prepare_source_version(instance):
-        return list(instance.sources.values_list('version', flat=True))
+        return [source.version for source in instance.sources.all()]
 
     @staticmethod
     def prepare_collection_version(instance):
-        return list(set(instance.expansion_set.values_list('collection_version__version', flat=True)))
+        return list({get(expansion, 'collection_version.version') for expansion in instance.expansion_set.all()})
 
     @staticmethod
     def prepare_expansion(instance):
-        return list(instance.expansion_set.values_list('mnemonic', flat=True))
+        return [expansion.mnemonic for expansion in instance.expansion_set.all()]
 
     @staticmethod
     def prepare_collection(instance):
-        return list(set(instance.expansion_set.values_list('collection_version__mnemonic', flat=True)))
+        return list({get(expansion, 'collection_version.mnemonic') for expansion in instance.expansion_set.all()})
 
     @staticmethod
     def prepare_collection_url(instance):
-        return list(set(list(instance.expansion_set.values_list('collection_version__uri', flat=True))))
+        return list({get(expansion, 'collection_version.uri') for expansion in instance.expansion_set.all()})
 
     @staticmethod
     def prepare_collection_owner_url(instance):
-        return list(set(expansion.owner_url for expansion in instance.expansion_set.all()))
+        return list({expansion.owner_url for expansion in instance.expansion_set.all()})
+
+    @staticmethod
+    def prepare_list_payload(instance):
+        if not settings.ES_NATIVE_LIST_RESULTS:
+            return None
+        from core.concepts.serializers import ConceptListSerializer
+        return dict(ConceptListSerializer(instance).data)
 
     @staticmethod
     def prepare_extras(instance):
@@ -128,12 +137,8 @@ class ConceptDocument(Document):
 
     @staticmethod
     def prepare_name_types(instance):
-        return list(
-            instance.names.filter(type__isnull=False).distinct('type').values_list('type', flat=True)
-        )
+        return sorted({name.type for name in instance.names.all() if name.type is not None})
 
     @staticmethod
     def prepare_description_types(instance):
-        return list(
-            instance.descriptions.filter(type__isnull=False).distinct('type').values_list('type', flat=True)
-        )
+        return sorted({description.type for description in instance.descriptions.all() if description.type is not None})
@@ -0,0 +1,53 @@
+# Generated by Django 4.0.6 on 2026-10-18 10:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('concepts', '0035_remove_localizedtext_localized_t_name_9b0703_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConceptHierarchyClosure',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField()),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_closures', to='concepts.concept')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_closures', to='concepts.concept')),
+            ],
+            options={
+                'db_table': 'concept_hierarchy_closure',
+                'unique_together': {('ancestor', 'descendant')},
+            },
+        ),
+        migrations.AddIndex(
+            model_name='concepthierarchyclosure',
+            index=models.Index(fields=['descendant', 'depth'], name='concept_closure_desc_depth_idx'),
+        ),
+        migrations.RunSQL(
+            """
+            WITH RECURSIVE edges AS NOT MATERIALIZED (
+                SELECT DISTINCT child.versioned_object_id AS child_id, parent.versioned_object_id AS parent_id
+                FROM concepts_hierarchicalconcepts AS hierarchy
+                JOIN concepts AS child ON child.id = hierarchy.child_id
+                JOIN concepts AS parent ON parent.id = hierarchy.parent_id
+                WHERE (child.id = child.versioned_object_id OR child.is_latest_version)
+                AND child.versioned_object_id <> parent.versioned_object_id
+            ),
+            ancestors(descendant_id, ancestor_id, depth) AS (
+                SELECT child_id, parent_id, 1 FROM edges
+                UNION
+                SELECT ancestors.descendant_id, edges.parent_id, ancestors.depth + 1
+                FROM ancestors JOIN edges ON edges.child_id = ancestors.ancestor_id
+                WHERE ancestors.depth < 64 AND edges.parent_id <> ancestors.descendant_id
+            )
+            INSERT INTO concept_hierarchy_closure (ancestor_id, descendant_id, depth)
+            SELECT ancestor_id, descendant_id, MIN(depth) FROM ancestors GROUP BY ancestor_id, descendant_id
+            """,
+            migrations.RunSQL.noop
+        ),
+    ]
@@ -1,3 +1,6 @@
+from collections import deque, defaultdict
+from copy import copy
+
 from django.conf import settings
 from django.contrib.postgres.indexes import GinIndex, HashIndex
 from django.core.exceptions import ValidationError
@@ -10,13 +13,14 @@ from core.common.constants import ISO_639_1, LATEST, HEAD
 from core.common.mixins import SourceChildMixin
 from core.common.models import VersionedModel
 from core.common.tasks import process_hierarchy_for_new_concept, process_hierarchy_for_concept_version, \
-    process_hierarchy_for_new_parent_concept_version
+    process_hierarchy_for_new_parent_concept_version, index_concept_mappings
 from core.common.utils import generate_temp_version, drop_version, \
     encode_string, decode_string, named_tuple_fetchall, startswith_temp_version
+from core.concepts.cascade import ConceptCascade
 from core.concepts.constants import CONCEPT_TYPE, LOCALES_FULLY_SPECIFIED, LOCALES_SHORT, LOCALES_SEARCH_INDEX_TERM, \
     CONCEPT_WAS_RETIRED, CONCEPT_IS_ALREADY_RETIRED, CONCEPT_IS_ALREADY_NOT_RETIRED, CONCEPT_WAS_UNRETIRED, \
     PERSIST_CLONE_ERROR, PERSIST_CLONE_SPECIFY_USER_ERROR, ALREADY_EXISTS, CONCEPT_REGEX, MAX_LOCALES_LIMIT, \
-    MAX_NAMES_LIMIT, MAX_DESCRIPTIONS_LIMIT
+    MAX_NAMES_LIMIT, MAX_DESCRIPTIONS_LIMIT, HIERARCHY_CLOSURE_MAX_DEPTH
 from core.concepts.mixins import ConceptValidationMixin
 
 
@@ -62,6 +66,34 @@ class LocalizedText(models.Model):
 
         return cls.get_dormant_queryset().count()
 
+    @classmethod
+    def get_preferred_names(cls, concept_ids):
+        """
+        Returns {concept_id: name} with the preferred name of each concept in a single query, in the same order of
+        precedence as Concept.preferred_locale: parent's default locale, parent's supported locales, system default
+        locale and then any locale, preferring locale_preferred names and then the last created one at each step.
+        """
+        names = cls.objects.raw(
+            """
+            SELECT DISTINCT ON ("concepts_names"."concept_id") "concepts_names"."concept_id", "localized_texts".*
+            FROM "concepts_names"
+            JOIN "localized_texts" ON "localized_texts"."id" = "concepts_names"."localizedtext_id"
+            JOIN "concepts" ON "concepts"."id" = "concepts_names"."concept_id"
+            JOIN "sources" ON "sources"."id" = "concepts"."parent_id"
+            WHERE "concepts_names"."concept_id" = ANY(%s)
+            ORDER BY "concepts_names"."concept_id",
+                CASE
+                    WHEN "localized_texts"."locale" = "sources"."default_locale" THEN 0
+                    WHEN "localized_texts"."locale" = ANY("sources"."supported_locales") THEN 1
+                    WHEN "localized_texts"."locale" = %s THEN 2
+                    ELSE 3
+                END,
+                "localized_texts"."locale_preferred" DESC, "localized_texts"."created_at" DESC
+            """,
+            [list(concept_ids), settings.DEFAULT_LOCALE]
+        )
+        return {name.concept_id: name for name in names}
+
     def to_dict(self):
         return dict(
             external_id=self.external_id, name=self.name, type=self.type, locale=self.locale,
@@ -146,6 +178,114 @@ class HierarchicalConcepts(models.Model):
     parent = models.ForeignKey('concepts.Concept', related_name='parent_child', on_delete=models.CASCADE)
 
 
+class ConceptHierarchyClosure(models.Model):
+    """
+    Ancestors of every versioned concept at their shortest depth (1 for direct parents), derived from the
+    hierarchy of its versioned object and latest version. Refreshed from the hierarchy tasks.
+    """
+    class Meta:
+        db_table = 'concept_hierarchy_closure'
+        unique_together = ('ancestor', 'descendant')
+        indexes = [models.Index(name='concept_closure_desc_depth_idx', fields=['descendant', 'depth'])]
+
+    ancestor = models.ForeignKey('concepts.Concept', related_name='descendant_closures', on_delete=models.CASCADE)
+    descendant = models.ForeignKey('concepts.Concept', related_name='ancestor_closures', on_delete=models.CASCADE)
+    depth = models.PositiveIntegerField()
+
+    @classmethod
+    def insert_ancestors(cls, descendant_ids=None):
+        """
+        Inserts the closure rows of the given versioned concepts, or of every concept when not given. Rows inserted
+        meanwhile by a concurrent refresh of overlapping concepts are kept at their shortest depth.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                WITH RECURSIVE edges AS NOT MATERIALIZED (
+                    SELECT DISTINCT child.versioned_object_id AS child_id, parent.versioned_object_id AS parent_id
+                    FROM concepts_hierarchicalconcepts AS hierarchy
+                    JOIN concepts AS child ON child.id = hierarchy.child_id
+                    JOIN concepts AS parent ON parent.id = hierarchy.parent_id
+                    WHERE (child.id = child.versioned_object_id OR child.is_latest_version)
+                    AND child.versioned_object_id <> parent.versioned_object_id
+                ),
+                ancestors(descendant_id, ancestor_id, depth) AS (
+                    SELECT child_id, parent_id, 1 FROM edges WHERE %s::bigint[] IS NULL OR child_id = ANY(%s::bigint[])
+                    UNION
+                    SELECT ancestors.descendant_id, edges.parent_id, ancestors.depth + 1
+                    FROM ancestors JOIN edges ON edges.child_id = ancestors.ancestor_id
+                    WHERE ancestors.depth < %s AND edges.parent_id <> ancestors.descendant_id
+                )
+                INSERT INTO concept_hierarchy_closure (ancestor_id, descendant_id, depth)
+                SELECT ancestor_id, descendant_id, MIN(depth) FROM ancestors GROUP BY ancestor_id, descendant_id
+                ON CONFLICT (ancestor_id, descendant_id)
+                DO UPDATE SET depth = LEAST(concept_hierarchy_closure.depth, EXCLUDED.depth)
+                """,
+                [descendant_ids, descendant_ids, HIERARCHY_CLOSURE_MAX_DEPTH]
+            )
+
+    @classmethod
+    def refresh(cls, versioned_object_ids):
+        """Recomputes the closure rows of the given versioned concepts and of their descendants."""
+        versioned_object_ids = set(compact(versioned_object_ids))
+        if not versioned_object_ids:
+            return
+        affected_ids = versioned_object_ids | set(
+            cls.objects.filter(ancestor_id__in=versioned_object_ids).values_list('descendant_id', flat=True))
+        with transaction.atomic():
+            cls.objects.filter(descendant_id__in=affected_ids).delete()
+            cls.insert_ancestors(list(affected_ids))
+
+    @classmethod
+    def rebuild(cls):
+        with transaction.atomic():
+            cls.objects.all().delete()
+            cls.insert_ancestors()
+
+    @classmethod
+    def get_hierarchies(cls, versioned_object_ids):
+        """
+        Returns parent urls, child urls and hierarchy path (following the first parent up to the root) of the
+        given versioned concepts, with a single query on the closure.
+        """
+        rows = cls.objects.filter(
+            Q(descendant_id__in=versioned_object_ids) | Q(ancestor_id__in=versioned_object_ids, depth=1) | Q(
+                depth=1, descendant_id__in=cls.objects.filter(
+                    descendant_id__in=versioned_object_ids).values('ancestor_id'))
+        ).values_list('ancestor_id', 'descendant_id', 'depth', 'ancestor__uri', 'descendant__uri')
+
+        parents = defaultdict(dict)
+        children = defaultdict(list)
+        for ancestor_id, descendant_id, depth, ancestor_uri, descendant_uri in rows:
+            if depth == 1:
+                parents[descendant_id][ancestor_id] = drop_version(ancestor_uri)
+                children[ancestor_id].append(drop_version(descendant_uri))
+
+        return {
+            versioned_object_id: dict(
+                parent_concept_urls=list(parents.get(versioned_object_id, {}).values()),
+                child_concept_urls=children.get(versioned_object_id, []),
+                hierarchy_path=cls.get_hierarchy_path(parents, versioned_object_id)
+            ) for versioned_object_id in versioned_object_ids
+        }
+
+    @staticmethod
+    def get_hierarchy_path(parents, versioned_object_id):
+        """Follows the first parent ({descendant_id: {ancestor_id: ancestor_url}}) up to the root."""
+        path = []
+        visited = {versioned_object_id}
+        current_id = versioned_object_id
+        while parents.get(current_id):
+            parent_id = min(parents[current_id])
+            if parent_id in visited:
+                break
+            visited.add(parent_id)
+            path.append(parents[current_id][parent_id])
+            current_id = parent_id
+        path.reverse()
+        return path
+
+
 class Concept(ConceptValidationMixin, SourceChildMixin, VersionedModel):  # pylint: disable=too-many-public-methods
     class Meta:
         db_table = 'concepts'
@@ -227,10 +367,22 @@ class Concept(ConceptValidationMixin, SourceChildMixin, VersionedModel):  # pyli
     WAS_RETIRED = CONCEPT_WAS_RETIRED
     WAS_UNRETIRED = CONCEPT_WAS_UNRETIRED
 
+    index_buffered = True
+    index_prefetch_related = [
+        'names', 'descriptions', 'sources', 'expansion_set__collection_version', 'parent__organization',
+        'parent__user', 'created_by', 'versions_set'
+    ]
+
     # $cascade as hierarchy attributes
     cascaded_entries = None
     terminal = None
 
+    # parent/child urls and hierarchy path from ConceptHierarchyClosure, see prefetch_hierarchy
+    prefetched_hierarchy = None
+
+    # preferred name from LocalizedText.get_preferred_names (False if it has none), see prefetch_preferred_locales
+    prefetched_preferred_locale = None
+
     es_fields = {
         'id': {'sortable': True, 'filterable': True, 'exact': True},
         'numeric_id': {'sortable': True, 'filterable': False, 'exact': False},
@@ -307,6 +459,8 @@ class Concept(ConceptValidationMixin, SourceChildMixin, VersionedModel):  # pyli
 
     @property
     def preferred_locale(self):
+        if self.prefetched_preferred_locale is not None:
+            return self.prefetched_preferred_locale or None
         try:
             return self.__get_parent_default_locale_name() or self.__get_parent_supported_locale_name() or \
                    self.__get_system_default_locale() or self.__get_preferred_locale() or \
@@ -316,6 +470,15 @@ class Concept(ConceptValidationMixin, SourceChildMixin, VersionedModel):  # pyli
 
         return None
 
+    @classmethod
+    def prefetch_preferred_locales(cls, concepts):
+        """Sets prefetched_preferred_locale (behind display_name/display_locale) of concepts in one query."""
+        concepts = [concept for concept in concepts if concept.prefetched_preferred_locale is None and concept.id]
+        if concepts:
+            names = LocalizedText.get_preferred_names({concept.id for concept in concepts})
+            for concept in concepts:
+                concept.prefetched_preferred_locale = names.get(concept.id, False)
+
     def __get_system_default_locale(self):
         system_default_locale = settings.DEFAULT_LOCALE
 
@@ -351,7 +514,7 @@ class Concept(ConceptValidationMixin, SourceChildMixin, VersionedModel):  # pyli
 
     def __names_qs(self, filters, order_by=None, order='desc'):
         if getattr(self, '_prefetched_objects_cache', None) and \
-           'names' in self._prefetched_objects_cache:  # pragma: no cover
+           'names' in self._prefetched_objects_cache:
             return self.__names_from_prefetched_object_cache(filters, order_by, order)
 
         return self.__names_from_db(filters, order_by, order)
@@ -368,9 +531,15 @@ class Concept(ConceptValidationMixin, SourceChildMixin, VersionedModel):  # pyli
 
         return names
 
-    def __names_from_prefetched_object_cache(self, filters, order_by=None, order='desc'):  # pragma: no cover
+    def __names_from_prefetched_object_cache(self, filters, order_by=None, order='desc'):
         def is_eligible(name):
-            return all(get(name, key) == value for key, value in filters.items())
+            for key, value in filters.items():
+                if key.endswith('__in'):
+                    if get(name, key[:-4]) not in (value or []):
+                        return False
+                elif get(name, key) != value:
+                    return False
+            return True
 
         names = list(filter(is_eligible, self.names.all()))
         if order_by:
@@ -695,6 +864,7 @@ class Concept(ConceptValidationMixin, SourceChildMixin, VersionedModel):  # pyli
                     )
             if create_initial_version and concept._counted is True:
                 parent_resource.update_concepts_count()
+            concept.invalidate_response_cache()
         except ValidationError as ex:
             concept.errors.update(ex.message_dict)
         except IntegrityError as ex:
@@ -702,6 +872,155 @@ class Concept(ConceptValidationMixin, SourceChildMixin, VersionedModel):  # pyli
 
         return concept
 
+    @classmethod
+    def bulk_persist_new(cls, data_list, user):
+        """
+        Creates new concepts, like persist_new, with a few statements for the whole batch: ids are reserved upfront,
+        then concepts with their initial versions, names/descriptions and the M2M rows are written with bulk_create.
+        Parent concepts (hierarchy), mapping links (see link_mappings), counts and indexing are left to the caller.
+        Returns a concept for each data, the invalid ones unsaved with errors.
+        """
+        concepts = [cls.build_for_bulk_persist(data, user) for data in data_list]
+        new_concepts = cls.validate_for_bulk_persist(concepts)
+        if not new_concepts:
+            return concepts
+
+        versions = cls.build_initial_versions_for_bulk_persist(new_concepts, user)
+        try:
+            with transaction.atomic():
+                cls.objects.bulk_create(new_concepts + versions)
+                LocalizedText.objects.bulk_create([
+                    locale for concept in new_concepts for locale in concept.cloned_names + concept.cloned_descriptions
+                ])
+                names, descriptions, sources = cls.build_m2m_rows_for_bulk_persist(new_concepts, versions)
+                cls.names.through.objects.bulk_create(names)
+                cls.descriptions.through.objects.bulk_create(descriptions)
+                cls.sources.through.objects.bulk_create(sources)
+        except IntegrityError as ex:
+            for concept in new_concepts:
+                concept.id = None
+                concept.errors = dict(__all__=ex.args)
+            return concepts
+
+        for concept in {concept.parent_id: concept for concept in new_concepts}.values():
+            concept.invalidate_response_cache()
+        for concept in new_concepts:
+            concept.cloned_names = []
+            concept.cloned_descriptions = []
+
+        return concepts
+
+    @classmethod
+    def build_for_bulk_persist(cls, data, user):
+        data = data.copy()
+        names = [
+            name if isinstance(name, LocalizedText) else LocalizedText.build(name.copy())
+            for name in data.pop('names', []) or []
+        ]
+        descriptions = [
+            desc if isinstance(desc, LocalizedText) else LocalizedText.build(desc.copy(), 'description')
+            for desc in data.pop('descriptions', []) or []
+        ]
+        data.pop('parent_concept_urls', None)
+        concept = cls(**data, version=generate_temp_version())
+        concept.created_by = concept.updated_by = user
+        concept.errors = {}
+        concept.cloned_names = compact(names)
+        concept.cloned_descriptions = compact(descriptions)
+        return concept
+
+    @classmethod
+    def validate_for_bulk_persist(cls, concepts):
+        """Sets errors of the existing (or repeated) and invalid concepts, returns the valid ones."""
+        existing = set(cls.objects.filter(
+            parent_id__in={concept.parent_id for concept in concepts},
+            mnemonic__in={concept.mnemonic for concept in concepts}
+        ).values_list('parent_id', 'mnemonic'))
+        new_concepts = []
+        for concept in concepts:
+            if (concept.parent_id, concept.mnemonic) in existing:
+                concept.errors = dict(__all__=[ALREADY_EXISTS])
+                continue
+            try:
+                concept.validate_locales_limit(concept.cloned_names, concept.cloned_descriptions)
+                concept.full_clean(
+                    exclude=['parent', 'created_by', 'updated_by', 'versioned_object'], validate_unique=False)
+            except ValidationError as ex:
+                concept.errors.update(ex.message_dict)
+                continue
+            existing.add((concept.parent_id, concept.mnemonic))
+            new_concepts.append(concept)
+        return new_concepts
+
+    @classmethod
+    def build_initial_versions_for_bulk_persist(cls, concepts, user):
+        """Reserves the ids of the concepts and of their initial versions, returns the (unsaved) initial versions."""
+        from core.common.services import PostgresQL
+        ids = PostgresQL.next_ids(cls._meta.db_table, 2 * len(concepts))
+        versions = []
+        for concept in concepts:
+            parent = concept.parent
+            concept.id = concept.versioned_object_id = ids.pop(0)
+            concept.version = str(concept.id)
+            concept.is_latest_version = False
+            concept.public_access = parent.public_access
+            if not concept.external_id:
+                concept.external_id = parent.concept_external_id_next
+            concept.uri = concept.calculate_uri()
+
+            version = cls(
+                mnemonic=concept.mnemonic, public_access=concept.public_access, external_id=concept.external_id,
+                concept_class=concept.concept_class, datatype=concept.datatype, retired=concept.retired,
+                extras=concept.extras or {}, comment=concept.comment, parent=parent, versioned_object=concept,
+                released=True, is_latest_version=True, created_by=user, updated_by=user,
+                _counted=concept._counted, _index=concept._index  # pylint: disable=protected-access
+            )
+            version.id = ids.pop(0)
+            version.version = str(version.id)
+            version.uri = version.calculate_uri()
+            versions.append(version)
+        return versions
+
+    @classmethod
+    def build_m2m_rows_for_bulk_persist(cls, concepts, versions):
+        """Returns the names, descriptions and sources through rows of the concepts and their initial versions."""
+        names, descriptions, sources = [], [], []
+        for concept, version in zip(concepts, versions):
+            for concept_id in (concept.id, version.id):
+                names += [
+                    cls.names.through(concept_id=concept_id, localizedtext_id=name.id)
+                    for name in concept.cloned_names
+                ]
+                descriptions += [
+                    cls.descriptions.through(concept_id=concept_id, localizedtext_id=desc.id)
+                    for desc in concept.cloned_descriptions
+                ]
+                sources.append(cls.sources.through(concept_id=concept_id, source_id=concept.parent_id))
+        return names, descriptions, sources
+
+    @classmethod
+    def link_mappings(cls, concept_ids):
+        """
+        Set based update_mappings: points mappings to/from the codes of these (versioned) concepts in their
+        parent (by uri or canonical url) to them. Returns ids of the linked mappings.
+        """
+        mapping_ids = []
+        with connection.cursor() as cursor:
+            for side in ['to', 'from']:
+                cursor.execute(
+                    f"""
+                    UPDATE mappings SET {side}_concept_id = concepts.id
+                    FROM concepts JOIN sources ON sources.id = concepts.parent_id
+                    WHERE concepts.id = ANY(%s) AND mappings.{side}_concept_id IS NULL
+                    AND mappings.{side}_concept_code = concepts.mnemonic
+                    AND mappings.{side}_source_url IN (sources.uri, sources.canonical_url)
+                    RETURNING mappings.id
+                    """,
+                    [list(concept_ids)]
+                )
+                mapping_ids += [row[0] for row in cursor.fetchall()]
+        return mapping_ids
+
     def update_versioned_object(self):
         concept = self.versioned_object
         concept.extras = self.extras
@@ -730,6 +1049,7 @@ class Concept(ConceptValidationMixin, SourceChildMixin, VersionedModel):  # pyli
         persisted = False
         versioned_object = obj.versioned_object
         prev_latest_version = versioned_object.versions.exclude(id=obj.id).filter(is_latest_version=True).first()
+        names_changed = False
         try:
             with transaction.atomic():
                 cls.validate_locales_limit(obj.cloned_names, obj.cloned_descriptions)
@@ -745,6 +1065,10 @@ class Concept(ConceptValidationMixin, SourceChildMixin, VersionedModel):  # pyli
                     obj.clean()  # clean here to validate locales that can only be saved after obj is saved
                     obj.update_versioned_object()
                     if prev_latest_version:
+                        # the names of to/from concepts are stored in the list_payload of mapping documents
+                        names_changed = settings.ES_NATIVE_LIST_RESULTS and (
+                            obj.display_name, obj.display_locale
+                        ) != (prev_latest_version.display_name, prev_latest_version.display_locale)
                         prev_latest_version._index = obj._index  # pylint: disable=protected-access
                         prev_latest_version.is_latest_version = False
                         prev_latest_version.save(update_fields=['is_latest_version', '_index'])
@@ -761,6 +1085,7 @@ class Concept(ConceptValidationMixin, SourceChildMixin, VersionedModel):  # pyli
                     obj.sources.set([parent])
                     persisted = True
                     cls.resume_indexing()
+                    obj.invalidate_response_cache()
                     if get(settings, 'TEST_MODE', False):
                         process_hierarchy_for_concept_version(
                             obj.id, get(prev_latest_version, 'id'), parent_concept_uris, create_parent_version)
@@ -775,6 +1100,8 @@ class Concept(ConceptValidationMixin, SourceChildMixin, VersionedModel):  # pyli
                             if prev_latest_version:
                                 prev_latest_version.index()
                             obj.index()
+                            if names_changed:
+                                index_concept_mappings.delay(obj.versioned_object_id)
 
                     transaction.on_commit(index_all)
         except ValidationError as err:
@@ -851,6 +1178,14 @@ class Concept(ConceptValidationMixin, SourceChildMixin, VersionedModel):  # pyli
     def get_bidirectional_mappings(self):
         return self.get_unidirectional_mappings() | self.get_indirect_mappings()
 
+    def get_all_bidirectional_mappings(self):
+        """Mappings (of any source and version) from or to any version of this concept"""
+        from core.mappings.models import Mapping
+        return Mapping.objects.filter(
+            Q(from_concept__versioned_object_id=self.versioned_object_id) |
+            Q(to_concept__versioned_object_id=self.versioned_object_id)
+        )
+
     def get_bidirectional_mappings_for_collection(self, collection_url, collection_version=HEAD):
         queryset = self.get_unidirectional_mappings_for_collection(
             collection_url, collection_version
@@ -892,12 +1227,29 @@ class Concept(ConceptValidationMixin, SourceChildMixin, VersionedModel):  # pyli
 
     @property
     def parent_concept_urls(self):
+        if self.prefetched_hierarchy is not None:
+            return self.prefetched_hierarchy['parent_concept_urls']
         return self.__get_hierarchy_concept_urls('parent_concepts')
 
     @property
     def child_concept_urls(self):
+        if self.prefetched_hierarchy is not None:
+            return self.prefetched_hierarchy['child_concept_urls']
         return self.__get_hierarchy_concept_urls('child_concepts')
 
+    @classmethod
+    def prefetch_hierarchy(cls, concepts):
+        """Sets prefetched_hierarchy of the versioned objects and latest versions among concepts in one query."""
+        concepts = [
+            concept for concept in concepts if concept.prefetched_hierarchy is None and (
+                concept.is_versioned_object or concept.is_latest_version)
+        ]
+        if concepts:
+            hierarchies = ConceptHierarchyClosure.get_hierarchies(
+                {concept.versioned_object_id for concept in concepts})
+            for concept in concepts:
+                concept.prefetched_hierarchy = hierarchies[concept.versioned_object_id]
+
     def __get_hierarchy_concept_urls(self, relation):
         queryset = get(self, relation).all()
         if self.is_latest_version:
@@ -920,6 +1272,8 @@ class Concept(ConceptValidationMixin, SourceChildMixin, VersionedModel):  # pyli
 
     @property
     def has_children(self):
+        if self.prefetched_hierarchy is not None:
+            return bool(self.prefetched_hierarchy['child_concept_urls'])
         result = self.child_concepts.exists()
 
         if not result and self.is_latest_version:
@@ -944,6 +1298,11 @@ class Concept(ConceptValidationMixin, SourceChildMixin, VersionedModel):  # pyli
         return list({drop_version(uri) for uri in uris})
 
     def get_hierarchy_path(self):
+        if self.is_versioned_object or self.is_latest_version:
+            self.prefetch_hierarchy([self])
+        if self.prefetched_hierarchy is not None:
+            return self.prefetched_hierarchy['hierarchy_path']
+
         result = []
         parent_concept = self.parent_concepts.first()
         while parent_concept is not None:
@@ -982,40 +1341,15 @@ class Concept(ConceptValidationMixin, SourceChildMixin, VersionedModel):  # pyli
             from core.collections.models import Collection
             is_collection = repo_version.__class__ == Collection
 
-        cascaded = []
-
-        def iterate(level):
-            if level == '*' or level > 0:
-                if not cascaded or (result['concepts'].count() + result['mappings'].count()) < max_results:
-                    not_cascaded = result['concepts'].exclude(
-                        versioned_object_id__in=cascaded) if cascaded else result['concepts']
-                    if not_cascaded.exists():
-                        for concept in not_cascaded:
-                            res = concept.get_cascaded_resources(
-                                repo_version=repo_version,
-                                source_mappings=source_mappings, source_to_concepts=source_to_concepts,
-                                mappings_criteria=mappings_criteria, cascade_mappings=cascade_mappings,
-                                cascade_hierarchy=cascade_hierarchy, include_mappings=include_mappings,
-                                include_retired=include_retired, reverse=reverse, is_collection=is_collection
-                            )
-                            cascaded.append(concept.versioned_object_id)
-                            result['concepts'] = Concept.objects.filter(
-                                id__in=[
-                                    *res['concepts'].values_list('id', flat=True),
-                                    *res['hierarchy_concepts'].values_list('id', flat=True),
-                                    *result['concepts'].values_list('id', flat=True)
-                                ]
-                            )
-                            result['mappings'] = Mapping.objects.filter(
-                                id__in=[
-                                    *res['mappings'].values_list('id', flat=True),
-                                    *result['mappings'].values_list('id', flat=True)
-                                ]
-                            )
-
-                        iterate(level if level == '*' else level - 1)
-
-        iterate(cascade_levels)
+        concept_ids, mapping_ids = ConceptCascade(
+            self, repo_version, is_collection=is_collection,
+            source_mappings=source_mappings, source_to_concepts=source_to_concepts,
+            mappings_criteria=mappings_criteria, cascade_mappings=cascade_mappings,
+            cascade_hierarchy=cascade_hierarchy, cascade_levels=cascade_levels, include_mappings=include_mappings,
+            include_retired=include_retired, reverse=reverse, max_results=max_results
+        ).run()
+        result['concepts'] = Concept.objects.filter(id__in=concept_ids)
+        result['mappings'] = Mapping.objects.filter(id__in=mapping_ids)
         return result
 
     def cascade_as_hierarchy(  # pylint: disable=too-many-arguments,too-many-locals
@@ -1039,6 +1373,16 @@ class Concept(ConceptValidationMixin, SourceChildMixin, VersionedModel):  # pyli
             from core.collections.models import Collection
             is_collection = repo_version.__class__ == Collection
 
+        hierarchy = ConceptCascade(
+            self, repo_version, is_collection=is_collection,
+            source_mappings=source_mappings, source_to_concepts=source_to_concepts,
+            mappings_criteria=mappings_criteria, cascade_mappings=cascade_mappings,
+            cascade_hierarchy=cascade_hierarchy, cascade_levels=cascade_levels, include_mappings=include_mappings,
+            include_retired=include_retired, reverse=reverse
+        ).hierarchy()
+        if hierarchy is not None:
+            return self.set_cascaded_entries(*hierarchy)
+
         self.current_level = 0
         levels = {self.current_level: [self]}
 
@@ -1085,6 +1429,31 @@ class Concept(ConceptValidationMixin, SourceChildMixin, VersionedModel):  # pyli
 
         return self
 
+    def set_cascaded_entries(self, entries, terminals):
+        """Builds the cascade_as_hierarchy tree from ConceptCascade.hierarchy entries with a single fetch per type."""
+        from core.mappings.models import Mapping
+        concepts = Concept.objects.in_bulk({_id for concept_ids, _ in entries.values() for _id in concept_ids})
+        mappings = Mapping.objects.in_bulk({_id for _, mapping_ids in entries.values() for _id in mapping_ids})
+        cascaded = set()
+        queue = deque([self])
+        while queue:
+            concept = queue.popleft()
+            if concept.id not in entries:
+                concept.terminal = terminals.get(concept.id)
+                continue
+            concept_ids, mapping_ids = entries[concept.id]
+            concept.terminal = not (concept_ids or mapping_ids)
+            if concept.id in cascaded:
+                continue
+            cascaded.add(concept.id)
+            concept.cascaded_entries = dict(
+                concepts=[copy(concepts[_id]) for _id in concept_ids], mappings=[mappings[_id] for _id in mapping_ids],
+                hierarchy_concepts=[]
+            )
+            queue.extend(concept.cascaded_entries['concepts'])
+
+        return self
+
     def get_cascaded_resources(self, **kwargs):
         if kwargs.pop('is_collection', None):
             return self.get_cascaded_resources_for_collection_version(**kwargs)
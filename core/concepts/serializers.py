@@ -1,7 +1,8 @@
+from django.db.models import QuerySet
 from pydash import get
 from rest_framework.fields import CharField, DateTimeField, BooleanField, URLField, JSONField, SerializerMethodField, \
     UUIDField, ListField, IntegerField, ReadOnlyField
-from rest_framework.serializers import ModelSerializer
+from rest_framework.serializers import ModelSerializer, ListSerializer
 
 from core.common.constants import INCLUDE_INVERSE_MAPPINGS_PARAM, INCLUDE_MAPPINGS_PARAM, INCLUDE_EXTRAS_PARAM, \
     INCLUDE_PARENT_CONCEPTS, INCLUDE_CHILD_CONCEPTS, INCLUDE_SOURCE_VERSIONS, INCLUDE_COLLECTION_VERSIONS, \
@@ -100,7 +101,28 @@ class ConceptDescriptionSerializer(ConceptLabelSerializer):
         return ret
 
 
-class ConceptAbstractSerializer(ModelSerializer):
+class ConceptPagePrefetchMixin:
+    """
+    Resolves per concept lookups of the whole page (when serialized with many=True) with one query on its first
+    concept, e.g. display_name/display_locale through Concept.prefetch_preferred_locales.
+    A single concept keeps resolving its display name itself, from its prefetched names when indexing.
+    """
+    def to_representation(self, instance):
+        if any(field.source in ('display_name', 'display_locale') for field in self.fields.values()):
+            self.prefetch_page(instance, Concept.prefetch_preferred_locales, single=False)
+        return super().to_representation(instance)
+
+    def prefetch_page(self, instance, prefetch, single=True):
+        if isinstance(self.parent, ListSerializer) and isinstance(self.parent.instance, (list, QuerySet)):
+            prefetched = get(self.parent, '_prefetched', set())
+            if prefetch.__name__ not in prefetched:
+                self.parent._prefetched = {*prefetched, prefetch.__name__}  # pylint: disable=protected-access
+                prefetch(self.parent.instance)
+        elif single:
+            prefetch([instance])
+
+
+class ConceptAbstractSerializer(ConceptPagePrefetchMixin, ModelSerializer):
     uuid = CharField(source='id', read_only=True)
     mappings = SerializerMethodField()
     parent_concepts = SerializerMethodField()
@@ -168,6 +190,12 @@ class ConceptAbstractSerializer(ModelSerializer):
 
         super().__init__(*args, **kwargs)
 
+    def to_representation(self, instance):
+        if self.include_hierarchy_path or self.include_parent_concept_urls or self.include_child_concept_urls or \
+                'has_children' in self.fields:
+            self.prefetch_page(instance, Concept.prefetch_hierarchy)
+        return super().to_representation(instance)
+
     def get_references(self, obj):
         collection = get(self, 'context.request.instance')
         if collection:
@@ -216,7 +244,7 @@ class ConceptAbstractSerializer(ModelSerializer):
         return None
 
 
-class ConceptLookupListSerializer(ModelSerializer):
+class ConceptLookupListSerializer(ConceptPagePrefetchMixin, ModelSerializer):
     uuid = CharField(source='id')
     id = EncodedDecodedCharField(source='mnemonic')
     url = CharField(read_only=True, source='uri')
@@ -410,7 +438,7 @@ class ConceptDetailSerializer(ConceptAbstractSerializer):
         return instance
 
 
-class ConceptVersionExportSerializer(ModelSerializer):
+class ConceptVersionExportSerializer(ConceptPagePrefetchMixin, ModelSerializer):
     type = CharField(source='resource_type')
     uuid = CharField(source='id')
     id = EncodedDecodedCharField(source='mnemonic')
@@ -548,7 +576,7 @@ class ConceptVersionDetailSerializer(ModelSerializer):
         return None
 
 
-class ConceptHierarchySerializer(ModelSerializer):
+class ConceptHierarchySerializer(ConceptPagePrefetchMixin, ModelSerializer):
     uuid = CharField(source='id')
     id = EncodedDecodedCharField(source='mnemonic')
     url = CharField(source='uri')
@@ -590,7 +618,7 @@ class ConceptChildrenSerializer(ConceptListSerializer):
         return None
 
 
-class ConceptParentsSerializer(ModelSerializer):
+class ConceptParentsSerializer(ConceptPagePrefetchMixin, ModelSerializer):
     uuid = CharField(source='id')
     id = EncodedDecodedCharField(source='mnemonic')
     url = CharField(source='uri')
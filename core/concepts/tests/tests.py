@@ -1,12 +1,17 @@
+import pickle
+from unittest.mock import patch
 from uuid import UUID
 
 import factory
+from django.db.models import Q
+from django.test import override_settings
 from pydash import omit
 
 from core.collections.models import CollectionReference
 from core.collections.tests.factories import OrganizationCollectionFactory, ExpansionFactory
 from core.common.constants import CUSTOM_VALIDATION_SCHEMA_OPENMRS, HEAD, ACCESS_TYPE_EDIT, ACCESS_TYPE_VIEW
 from core.common.tests import OCLTestCase
+from core.concepts.cascade import ConceptGraph, q_matches
 from core.concepts.constants import (
     OPENMRS_MUST_HAVE_EXACTLY_ONE_PREFERRED_NAME,
     OPENMRS_FULLY_SPECIFIED_NAME_UNIQUE_PER_SOURCE_LOCALE, OPENMRS_AT_LEAST_ONE_FULLY_SPECIFIED_NAME,
@@ -15,9 +20,9 @@ from core.concepts.constants import (
     OPENMRS_NO_MORE_THAN_ONE_SHORT_NAME_PER_LOCALE, CONCEPT_IS_ALREADY_RETIRED, CONCEPT_IS_ALREADY_NOT_RETIRED,
     OPENMRS_CONCEPT_CLASS, OPENMRS_DATATYPE, OPENMRS_DESCRIPTION_TYPE, OPENMRS_NAME_LOCALE, OPENMRS_DESCRIPTION_LOCALE)
 from core.concepts.documents import ConceptDocument
-from core.concepts.models import Concept, LocalizedText
+from core.concepts.models import Concept, LocalizedText, ConceptHierarchyClosure
 from core.concepts.serializers import ConceptListSerializer, ConceptVersionListSerializer, ConceptDetailSerializer, \
-    ConceptVersionDetailSerializer, ConceptMinimalSerializer
+    ConceptVersionDetailSerializer, ConceptMinimalSerializer, ConceptVersionExportSerializer
 from core.concepts.tests.factories import LocalizedTextFactory, ConceptFactory
 from core.concepts.validators import ValidatorSpecifier
 from core.mappings.tests.factories import MappingFactory
@@ -133,6 +138,123 @@ class ConceptTest(OCLTestCase):
 
         self.assertEqual(concept.display_locale, preferred_locale.locale)
 
+    def test_prefetch_preferred_locales(self):
+        source = OrganizationSourceFactory(default_locale='fr', supported_locales=['fr', 'es'])
+        concept1 = ConceptFactory(
+            parent=source,
+            names=[
+                LocalizedTextFactory(locale_preferred=True, locale='en', name='MALARIA SMEAR, QUALITATIVE'),
+                LocalizedTextFactory(locale_preferred=False, locale='es', name='frotis de malaria (cualitativo)'),
+                LocalizedTextFactory(locale_preferred=True, locale='es', name='Frotis de paludismo'),
+                LocalizedTextFactory(locale_preferred=False, locale='es', name='Frotis'),
+            ]
+        )
+        concept2 = ConceptFactory(
+            parent=source,
+            names=[
+                LocalizedTextFactory(locale_preferred=False, locale='ch', name='ch name'),
+                LocalizedTextFactory(locale_preferred=False, locale='en', name='en name'),
+            ]
+        )
+        concept3 = ConceptFactory(parent=source, names=[
+            LocalizedTextFactory(locale_preferred=False, locale='ch', name='ch name 1'),
+            LocalizedTextFactory(locale_preferred=True, locale='ti', name='ti name'),
+            LocalizedTextFactory(locale_preferred=False, locale='ch', name='ch name 2'),
+        ])
+        concept4 = ConceptFactory(parent=source, names=[])
+        concepts = [concept1, concept2, concept3, concept4]
+        expected = [(concept.display_name, concept.display_locale) for concept in concepts]
+        self.assertEqual(
+            expected, [('Frotis de paludismo', 'es'), ('en name', 'en'), ('ti name', 'ti'), (None, None)])
+
+        concepts = list(Concept.objects.filter(id__in=[concept.id for concept in concepts]).order_by('id'))
+        with self.assertNumQueries(1):
+            Concept.prefetch_preferred_locales(concepts)
+            self.assertEqual([(concept.display_name, concept.display_locale) for concept in concepts], expected)
+
+        concepts = list(Concept.objects.filter(id__in=[concept.id for concept in concepts]).order_by('id'))
+        data = ConceptVersionExportSerializer(concepts, many=True).data
+        self.assertEqual([(item['display_name'], item['display_locale']) for item in data], expected)
+        self.assertTrue(all(concept.prefetched_preferred_locale is not None for concept in concepts))
+
+    def test_search_document_prepare_from_prefetched_relations(self):
+        source = OrganizationSourceFactory(default_locale='fr', supported_locales=['fr', 'en'])
+        concept = ConceptFactory(
+            parent=source,
+            names=[
+                LocalizedTextFactory(locale='en', name='Foo', type='FULLY_SPECIFIED'),
+                LocalizedTextFactory(locale='fr', name='Bar', type='SHORT', locale_preferred=True),
+            ],
+            descriptions=[LocalizedTextFactory(locale='en', name='Foobar', type='Definition')]
+        )
+        concept = Concept.objects.prefetch_related(*Concept.index_prefetch_related).get(id=concept.id)
+
+        with self.assertNumQueries(0):
+            data = ConceptDocument().prepare(concept)
+
+        self.assertEqual(data['locale'], ['en', 'fr'])
+        self.assertCountEqual(data['synonyms'], ['foo', 'bar'])
+        self.assertEqual(data['name_types'], ['FULLY_SPECIFIED', 'SHORT'])
+        self.assertEqual(data['description_types'], ['Definition'])
+        self.assertEqual(data['source_version'], ['HEAD'])
+        self.assertEqual(data['_name'], 'Bar')
+        self.assertEqual(data['expansion'], [])
+
+    @override_settings(ES_NATIVE_LIST_RESULTS=True)
+    def test_search_document_prepare_list_payload(self):
+        concept = ConceptFactory(names=[LocalizedTextFactory(locale='en', name='Foo')])
+
+        data = ConceptDocument().prepare(concept)
+
+        self.assertEqual(data['list_payload'], dict(ConceptListSerializer(concept).data))
+        self.assertEqual(data['list_payload']['display_name'], 'Foo')
+        self.assertEqual(data['list_payload']['url'], concept.versioned_object_url)
+        self.assertNotIn('extras', data['list_payload'])
+
+        with override_settings(ES_NATIVE_LIST_RESULTS=False):
+            self.assertIsNone(ConceptDocument().prepare(concept)['list_payload'])
+
+    @override_settings(ES_NATIVE_LIST_RESULTS=True)
+    def test_search_document_prepare_list_payload_from_prefetched_relations(self):
+        concept = ConceptFactory(names=[LocalizedTextFactory(locale='en', name='Foo')])
+        latest_version = concept.get_latest_version()
+        concept = Concept.objects.prefetch_related(*Concept.index_prefetch_related).get(id=concept.id)
+
+        with self.assertNumQueries(0):
+            payload = ConceptDocument().prepare_list_payload(concept)
+
+        self.assertEqual(payload['version_url'], latest_version.uri)
+        self.assertEqual(payload['display_name'], 'Foo')
+        self.assertEqual(payload['source'], concept.parent.mnemonic)
+
+    def test_get_all_bidirectional_mappings(self):
+        concept = ConceptFactory()
+        other_source_mapping = MappingFactory(from_concept=concept.get_latest_version())
+        indirect_mapping = MappingFactory(to_concept=concept)
+        MappingFactory()
+
+        self.assertCountEqual(
+            list(concept.get_all_bidirectional_mappings().values_list('id', flat=True)),
+            [other_source_mapping.id, indirect_mapping.id]
+        )
+
+    @override_settings(ES_NATIVE_LIST_RESULTS=True)
+    @patch('core.common.tasks.index_concept_mappings.delay')
+    def test_new_version_reindexes_mappings_when_names_change(self, index_concept_mappings_mock):
+        concept = ConceptFactory(names=[LocalizedTextFactory(locale='en', name='Foo')])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Concept.create_new_version_for(
+                concept.clone(), dict(names=[dict(locale='en', name='Foo')], datatype='Text'), concept.created_by)
+
+        index_concept_mappings_mock.assert_not_called()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Concept.create_new_version_for(
+                concept.clone(), dict(names=[dict(locale='en', name='Bar')]), concept.created_by)
+
+        index_concept_mappings_mock.assert_called_once_with(concept.id)
+
     def test_default_name_locales(self):
         es_locale = LocalizedTextFactory(locale='es')
         en_locale = LocalizedTextFactory(locale='en')
@@ -1296,6 +1418,254 @@ class ConceptTest(OCLTestCase):
             root.url
         )
 
+    def test_cascade(self):
+        source = OrganizationSourceFactory()
+        root = ConceptFactory(parent=source, mnemonic='root')
+        child = ConceptFactory(parent=source, mnemonic='child')
+        child.parent_concepts.add(root)
+        grand_child = ConceptFactory(parent=source, mnemonic='grand-child')
+        grand_child.parent_concepts.add(child)
+        mapped = ConceptFactory(parent=source, mnemonic='mapped')
+        mapping = MappingFactory(parent=source, from_concept=child, to_concept=mapped, map_type='Q-AND-A')
+        back_mapping = MappingFactory(parent=source, from_concept=mapped, to_concept=root)
+
+        def ids(queryset):
+            return sorted(queryset.values_list('id', flat=True))
+
+        result = root.cascade(source)
+        self.assertEqual(ids(result['concepts']), sorted([root.id, child.id, grand_child.id, mapped.id]))
+        self.assertEqual(ids(result['mappings']), sorted([mapping.id, back_mapping.id]))
+
+        result = root.cascade(source, cascade_levels=1)
+        self.assertEqual(ids(result['concepts']), sorted([root.id, child.id]))
+        self.assertEqual(ids(result['mappings']), [])
+
+        result = root.cascade(source, cascade_levels=2)
+        self.assertEqual(ids(result['concepts']), sorted([root.id, child.id, grand_child.id, mapped.id]))
+        self.assertEqual(ids(result['mappings']), [mapping.id])
+
+        result = root.cascade(source, mappings_criteria=~Q(map_type__in=['Q-AND-A']))
+        self.assertEqual(ids(result['concepts']), sorted([root.id, child.id, grand_child.id]))
+        self.assertEqual(ids(result['mappings']), [])
+
+        result = root.cascade(source, include_mappings=False)
+        self.assertEqual(ids(result['concepts']), sorted([root.id, child.id, grand_child.id, mapped.id]))
+        self.assertEqual(ids(result['mappings']), [])
+
+        result = root.cascade(source, cascade_hierarchy=False)
+        self.assertEqual(ids(result['concepts']), [root.id])
+
+        result = root.cascade(source, max_results=2)
+        self.assertEqual(ids(result['concepts']), sorted([root.id, child.id]))
+
+        result = grand_child.cascade(source, reverse=True)
+        self.assertEqual(ids(result['concepts']), sorted([root.id, child.id, grand_child.id, mapped.id]))
+        self.assertEqual(ids(result['mappings']), sorted([mapping.id, back_mapping.id]))
+
+        result = grand_child.cascade(source, reverse=True, cascade_levels=2)
+        self.assertEqual(ids(result['concepts']), sorted([root.id, child.id, grand_child.id]))
+        self.assertEqual(ids(result['mappings']), [])
+
+    def test_cascade_released_version(self):
+        source = OrganizationSourceFactory()
+        root = ConceptFactory(parent=source, mnemonic='root')
+        child = ConceptFactory(parent=source, mnemonic='child')
+        child.parent_concepts.add(root)
+        mapped = ConceptFactory(parent=source, mnemonic='mapped')
+        mapping = MappingFactory(parent=source, from_concept=child, to_concept=mapped, map_type='Q-AND-A')
+        source_v1 = OrganizationSourceFactory(
+            version='v1', mnemonic=source.mnemonic, organization=source.organization)
+        source_v1.seed_concepts(index=False)
+        source_v1.seed_mappings(index=False)
+        root_latest = root.get_latest_version()
+
+        def ids(queryset):
+            return sorted(queryset.values_list('id', flat=True))
+
+        expected_concept_ids = sorted([
+            root_latest.id, child.get_latest_version().id, mapped.get_latest_version().id])
+        with override_settings(CONCEPT_GRAPH_CACHE_ENABLED=False):
+            result = root_latest.cascade(source_v1)
+        self.assertEqual(ids(result['concepts']), expected_concept_ids)
+        self.assertEqual(ids(result['mappings']), [mapping.get_latest_version().id])
+
+        result = root_latest.cascade(source_v1)
+        self.assertEqual(ids(result['concepts']), expected_concept_ids)
+        self.assertEqual(ids(result['mappings']), [mapping.get_latest_version().id])
+
+        with self.assertNumQueries(2):
+            result = root_latest.cascade(source_v1, mappings_criteria=~Q(map_type__in=['Q-AND-A']))
+            self.assertEqual(ids(result['concepts']), sorted([root_latest.id, child.get_latest_version().id]))
+            self.assertEqual(ids(result['mappings']), [])
+
+        root_cascaded = root_latest.cascade_as_hierarchy(source_v1)
+        self.assertFalse(root_cascaded.terminal)
+        self.assertEqual(
+            [concept.id for concept in root_cascaded.cascaded_entries['concepts']], [child.get_latest_version().id])
+        child_cascaded = root_cascaded.cascaded_entries['concepts'][0]
+        self.assertEqual(
+            [concept.id for concept in child_cascaded.cascaded_entries['concepts']], [mapped.get_latest_version().id])
+        self.assertEqual(
+            [mapping.id for mapping in child_cascaded.cascaded_entries['mappings']], [mapping.get_latest_version().id])
+        self.assertTrue(child_cascaded.cascaded_entries['concepts'][0].terminal)
+
+        root_cascaded = root_latest.cascade_as_hierarchy(source_v1, cascade_levels=1)
+        child_cascaded = root_cascaded.cascaded_entries['concepts'][0]
+        self.assertFalse(root_cascaded.terminal)
+        self.assertFalse(child_cascaded.terminal)
+        self.assertFalse(hasattr(child_cascaded, 'cascaded_entries'))
+
+    def test_cascade_released_collection_version_follows_expansion_changes(self):
+        source = OrganizationSourceFactory()
+        root = ConceptFactory(parent=source, mnemonic='root')
+        child = ConceptFactory(parent=source, mnemonic='child')
+        child.parent_concepts.add(root)
+        collection = OrganizationCollectionFactory()
+        collection_v1 = OrganizationCollectionFactory(
+            version='v1', mnemonic=collection.mnemonic, organization=collection.organization)
+        expansion = ExpansionFactory(collection_version=collection_v1)
+        collection_v1.expansion_uri = expansion.uri
+        collection_v1.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            expansion.concepts.add(root.get_latest_version())
+
+        result = root.get_latest_version().cascade(collection_v1)
+        self.assertEqual(list(result['concepts'].values_list('id', flat=True)), [root.get_latest_version().id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            expansion.concepts.add(child.get_latest_version())
+
+        result = root.get_latest_version().cascade(collection_v1)
+        self.assertEqual(
+            sorted(result['concepts'].values_list('id', flat=True)),
+            sorted([root.get_latest_version().id, child.get_latest_version().id])
+        )
+
+        expansion.is_processing = True
+        expansion.save()
+        with patch('core.concepts.cascade.get_concept_graph') as get_concept_graph_mock:
+            result = root.get_latest_version().cascade(collection_v1)
+        self.assertEqual(result['concepts'].count(), 2)
+        get_concept_graph_mock.assert_not_called()
+
+
+class ConceptHierarchyClosureTest(OCLTestCase):
+    def setUp(self):
+        super().setUp()
+        self.parent = ConceptFactory(mnemonic='parent')
+        self.child = ConceptFactory(parent=self.parent.parent, mnemonic='child')
+        self.child.parent_concepts.add(self.parent)
+        self.grand_child = ConceptFactory(parent=self.parent.parent, mnemonic='grand-child')
+        self.grand_child.parent_concepts.add(self.child)
+        ConceptHierarchyClosure.refresh([self.child.id, self.grand_child.id])
+
+    def get_closure(self):
+        return sorted(ConceptHierarchyClosure.objects.values_list('ancestor_id', 'descendant_id', 'depth'))
+
+    def test_refresh(self):
+        self.assertEqual(
+            self.get_closure(),
+            sorted([
+                (self.parent.id, self.child.id, 1), (self.parent.id, self.grand_child.id, 2),
+                (self.child.id, self.grand_child.id, 1)
+            ])
+        )
+
+        self.grand_child.parent_concepts.set([self.parent])
+        ConceptHierarchyClosure.refresh([self.grand_child.id])
+        self.assertEqual(
+            self.get_closure(),
+            sorted([(self.parent.id, self.child.id, 1), (self.parent.id, self.grand_child.id, 1)])
+        )
+
+        self.grand_child.parent_concepts.set([self.child])
+        self.child.parent_concepts.clear()
+        ConceptHierarchyClosure.refresh([self.child.id, self.grand_child.id])
+        self.assertEqual(self.get_closure(), [(self.child.id, self.grand_child.id, 1)])
+
+        ConceptHierarchyClosure.objects.all().delete()
+        ConceptHierarchyClosure.rebuild()
+        self.assertEqual(self.get_closure(), [(self.child.id, self.grand_child.id, 1)])
+
+    def test_insert_ancestors_keeps_rows_inserted_concurrently(self):
+        closure = self.get_closure()
+        ConceptHierarchyClosure.objects.filter(ancestor_id=self.parent.id, descendant_id=self.grand_child.id).update(
+            depth=5)
+
+        ConceptHierarchyClosure.insert_ancestors([self.child.id, self.grand_child.id])
+
+        self.assertEqual(self.get_closure(), closure)
+
+    def test_get_hierarchies(self):
+        hierarchies = ConceptHierarchyClosure.get_hierarchies({self.parent.id, self.child.id, self.grand_child.id})
+
+        self.assertEqual(
+            hierarchies[self.parent.id],
+            dict(parent_concept_urls=[], child_concept_urls=[self.child.uri], hierarchy_path=[])
+        )
+        self.assertEqual(
+            hierarchies[self.child.id],
+            dict(
+                parent_concept_urls=[self.parent.uri], child_concept_urls=[self.grand_child.uri],
+                hierarchy_path=[self.parent.uri]
+            )
+        )
+        self.assertEqual(
+            hierarchies[self.grand_child.id],
+            dict(
+                parent_concept_urls=[self.child.uri], child_concept_urls=[],
+                hierarchy_path=[self.parent.uri, self.child.uri]
+            )
+        )
+
+    def test_prefetch_hierarchy(self):
+        concepts = [self.parent, self.child, self.grand_child, self.grand_child.get_latest_version()]
+
+        with self.assertNumQueries(1):
+            Concept.prefetch_hierarchy(concepts)
+            self.assertTrue(self.parent.has_children)
+            self.assertFalse(self.grand_child.has_children)
+            self.assertEqual(self.child.child_concept_urls, [self.grand_child.uri])
+            self.assertEqual(concepts[3].parent_concept_urls, [self.child.uri])
+            self.assertEqual(concepts[3].get_hierarchy_path(), [self.parent.uri, self.child.uri])
+
+
+class ConceptGraphTest(OCLTestCase):
+    def setUp(self):
+        super().setUp()
+        self.graph = ConceptGraph(
+            concepts=[(11, 1, False), (12, 2, False), (13, 3, True), (14, 4, False)],
+            hierarchy=[(1, 2), (2, 3)],
+            mappings=[(21, 1, 4, 'SAME-AS', False), (22, 2, 4, 'NARROWER-THAN', False), (23, 4, None, 'SAME-AS', False)]
+        )
+
+    def test_get_cascaded(self):
+        self.assertEqual(self.graph.get_cascaded(11, 1), ([12, 14], [21]))
+        self.assertEqual(self.graph.get_cascaded(12, 2), ([14], [22]))
+        self.assertEqual(self.graph.get_cascaded(12, 2, include_retired=True), ([13, 14], [22]))
+        self.assertEqual(self.graph.get_cascaded(14, 4, reverse=True), ([11, 12], [21, 22]))
+        self.assertEqual(self.graph.get_cascaded(11, 1, mappings=False), ([12, 14], []))
+        self.assertEqual(self.graph.get_cascaded(11, 1, hierarchy=False, mapping_targets=False), ([], [21]))
+        self.assertEqual(self.graph.get_cascaded(99, 1), ([12, 14], [21]))
+
+        map_types = self.graph.get_map_type_indexes(~Q(map_type__in=['SAME-AS']))
+        self.assertEqual(self.graph.get_cascaded(14, 4, reverse=True, map_types=map_types), ([12], [22]))
+
+    def test_pickle(self):
+        graph = pickle.loads(pickle.dumps(self.graph))
+
+        self.assertNotIn('members', pickle.loads(pickle.dumps(self.graph.__getstate__())))
+        self.assertEqual(graph.get_cascaded(11, 1), ([12, 14], [21]))
+        self.assertEqual(graph.map_types, ['NARROWER-THAN', 'SAME-AS'])
+
+    def test_q_matches(self):
+        self.assertTrue(q_matches(Q(), dict(map_type='SAME-AS')))
+        self.assertTrue(q_matches(Q(map_type__in=['SAME-AS']), dict(map_type='SAME-AS')))
+        self.assertFalse(q_matches(Q() & ~Q(map_type__in=['SAME-AS']), dict(map_type='SAME-AS')))
+        self.assertTrue(q_matches(Q(map_type='Q-AND-A') | Q(map_type='SAME-AS'), dict(map_type='SAME-AS')))
+        with self.assertRaises(ValueError):
+            q_matches(Q(map_type__icontains='SAME'), dict(map_type='SAME-AS'))
+
 
 class OpenMRSConceptValidatorTest(OCLTestCase):
     def setUp(self):
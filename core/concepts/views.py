@@ -15,10 +15,10 @@ from core.bundles.serializers import BundleSerializer
 from core.common.constants import (
     HEAD, INCLUDE_INVERSE_MAPPINGS_PARAM, INCLUDE_RETIRED_PARAM, ACCESS_TYPE_NONE)
 from core.common.exceptions import Http400
-from core.common.mixins import ListWithHeadersMixin, ConceptDictionaryMixin
+from core.common.mixins import ListWithHeadersMixin, ConceptDictionaryMixin, ResponseCacheMixin
 from core.common.swagger_parameters import (
-    q_param, limit_param, sort_desc_param, page_param, exact_match_param, sort_asc_param, verbose_param,
-    include_facets_header, updated_since_param, include_inverse_mappings_param, include_retired_param,
+    cursor_param, stream_param, q_param, limit_param, sort_desc_param, page_param, exact_match_param, sort_asc_param,
+    verbose_param, include_facets_header, updated_since_param, include_inverse_mappings_param, include_retired_param,
     compress_header, include_source_versions_param, include_collection_versions_param, cascade_method_param,
     cascade_map_types_params, cascade_exclude_map_types_params, cascade_hierarchy_param, cascade_mappings_param,
     include_mappings_param, cascade_levels_param, cascade_direction_param, cascade_view_hierarchy)
@@ -103,8 +103,9 @@ class ConceptLookupValuesView(ListAPIView, BaseAPIView):  # pragma: no cover
         raise Http404()
 
 
-class ConceptListView(ConceptBaseView, ListWithHeadersMixin, CreateModelMixin):
+class ConceptListView(ResponseCacheMixin, ConceptBaseView, ListWithHeadersMixin, CreateModelMixin):
     serializer_class = ConceptListSerializer
+    es_native_list_serializer_class = ConceptListSerializer
 
     def get_permissions(self):
         if self.request.method == 'POST':
@@ -158,7 +159,7 @@ class ConceptListView(ConceptBaseView, ListWithHeadersMixin, CreateModelMixin):
         manual_parameters=[
             q_param, limit_param, sort_desc_param, sort_asc_param, exact_match_param, page_param, verbose_param,
             include_retired_param, include_inverse_mappings_param, updated_since_param,
-            include_facets_header, compress_header
+            include_facets_header, compress_header, cursor_param, stream_param
         ]
     )
     def get(self, request, *args, **kwargs):
@@ -238,7 +239,9 @@ class ConceptCollectionMembershipView(ConceptBaseView, ListWithHeadersMixin):
         return self.list(request, *args, **kwargs)
 
 
-class ConceptRetrieveUpdateDestroyView(ConceptBaseView, RetrieveAPIView, UpdateAPIView, DestroyAPIView):
+class ConceptRetrieveUpdateDestroyView(
+        ResponseCacheMixin, ConceptBaseView, RetrieveAPIView, UpdateAPIView, DestroyAPIView
+):
     serializer_class = ConceptDetailSerializer
 
     def is_container_version_specified(self):
@@ -469,7 +472,7 @@ class ConceptMappingsView(ConceptBaseView, ListWithHeadersMixin):
         return self.list(request, *args, **kwargs)
 
 
-class ConceptVersionRetrieveView(ConceptBaseView, RetrieveAPIView, DestroyAPIView):
+class ConceptVersionRetrieveView(ResponseCacheMixin, ConceptBaseView, RetrieveAPIView, DestroyAPIView):
     serializer_class = ConceptVersionDetailSerializer
 
     def get_permissions(self):
@@ -1,9 +1,11 @@
+import hashlib
 import json
 import time
+import uuid
 from collections import deque
 from datetime import datetime
 
-from celery import group
+from celery import chord
 from celery.utils.log import get_task_logger
 from django.conf import settings
 from django.core.exceptions import ValidationError
@@ -14,8 +16,10 @@ from pydash import compact, get
 from core.collections.models import Collection
 from core.common.constants import HEAD
 from core.common.services import RedisService
-from core.common.tasks import bulk_import_parts_inline, delete_organization, batch_index_resources
-from core.common.utils import drop_version, is_url_encoded_string, encode_string, to_parent_uri, chunks
+from core.common.tasks import bulk_import_parts_inline, delete_organization, batch_index_resources, \
+    bulk_import_part_done
+from core.common.utils import drop_version, is_url_encoded_string, encode_string, to_parent_uri, chunks, \
+    get_export_service
 from core.concepts.models import Concept
 from core.mappings.models import Mapping
 from core.orgs.models import Organization
@@ -37,6 +41,106 @@ class ImportResults:
         )
 
 
+class ImportFile:
+    """
+    NDJSON import content stored as a file, an object of settings.EXPORT_SERVICE (key) or a local file (path),
+    optionally limited to the [start, end) byte range of its lines. Tasks get its reference (a small dict) instead
+    of the content and read the lines as a stream. A stored file also keeps its line count (total) and the sha256
+    of its content (digest), on which its import is locked.
+    """
+    chunk_size = 1024 * 1024
+
+    def __init__(  # pylint: disable=too-many-arguments
+            self, key=None, path=None, start=0, end=None, total=None, digest=None
+    ):
+        self.key = key
+        self.path = path
+        self.start = start or 0
+        self.end = end
+        self.total = total
+        self.digest = digest
+
+    @staticmethod
+    def is_reference(content):
+        return isinstance(content, dict) and bool(content.get('key') or content.get('path'))
+
+    @classmethod
+    def from_reference(cls, reference):
+        return cls(**reference)
+
+    @property
+    def reference(self):
+        reference = dict(key=self.key, path=self.path, start=self.start, end=self.end, total=self.total)
+        if self.digest:
+            reference['digest'] = self.digest
+        return reference
+
+    def part(self, start, end, total=None):
+        return ImportFile(self.key, self.path, start, end, total)
+
+    @classmethod
+    def store(cls, content, username):
+        """
+        Writes the content chunks (bytes) to the export service without holding them in memory, counting the
+        non-blank lines and hashing the content on the way.
+        """
+        key = f'imports/{username}/{uuid.uuid4()}.json'
+        digest = hashlib.sha256()
+        total = 0
+        buffer = b''
+        with get_export_service().multipart_writer(key) as out:
+            for chunk in content:
+                out.write(chunk)
+                digest.update(chunk)
+                lines = (buffer + chunk).split(b'\n')
+                buffer = lines.pop()
+                total += len([line for line in lines if line.strip()])
+        if buffer.strip():
+            total += 1
+        return cls(key=key, total=total, digest=digest.hexdigest())
+
+    def remove(self):
+        if self.key:
+            get_export_service().remove(self.key)
+
+    def read_chunks(self):
+        if self.end is not None and self.end <= self.start:
+            return
+        if self.key:
+            yield from get_export_service().read_stream(
+                self.key, chunk_size=self.chunk_size, start=self.start, end=self.end)
+            return
+        with open(self.path, 'rb') as file:
+            file.seek(self.start)
+            remaining = None if self.end is None else self.end - self.start
+            while remaining is None or remaining > 0:
+                chunk = file.read(self.chunk_size if remaining is None else min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    def lines(self):
+        """Yields (offset, line) of the non-blank lines, offset being the position of the line in the file."""
+        offset = self.start
+        buffer = b''
+        for chunk in self.read_chunks():
+            buffer += chunk
+            lines = buffer.split(b'\n')
+            buffer = lines.pop()
+            for line in lines:
+                if line.strip():
+                    yield offset, line
+                offset += len(line) + 1
+        if buffer.strip():
+            yield offset, buffer
+
+    def __iter__(self):
+        for _, line in self.lines():
+            yield json.loads(line)
+
+
 class BaseImporter:
     def __init__(
             self, content, username, update_if_exists, user=None, parse_data=True, set_user=True
@@ -59,6 +163,8 @@ class BaseImporter:
     def populate_input_list(self):
         if isinstance(self.content, list):
             self.input_list = self.content
+        elif ImportFile.is_reference(self.content):
+            self.input_list = ImportFile.from_reference(self.content)
         else:
             for line in self.content.splitlines():
                 self.input_list.append(json.loads(line))
@@ -376,6 +482,7 @@ class ConceptImporter(BaseResourceImporter):
         super().__init__(data, user, update_if_exists)
         self.version = False
         self.instance = None
+        self.parent = None
 
     def exists(self):
         return self.get_queryset().exists()
@@ -390,10 +497,15 @@ class ConceptImporter(BaseResourceImporter):
         )
         return self.queryset
 
+    def get_parent(self):
+        if not self.parent:
+            self.parent = Source.objects.filter(
+                **{self.get_owner_type_filter(): self.get('owner')}, mnemonic=self.get('source'), version=HEAD
+            ).first()
+        return self.parent
+
     def parse(self):
-        source = Source.objects.filter(
-            **{self.get_owner_type_filter(): self.get('owner')}, mnemonic=self.get('source'), version=HEAD
-        ).first()
+        source = self.get_parent()
         super().parse()
         self.data['parent'] = source
         self.data['name'] = self.data['mnemonic'] = str(self.data.pop('id', ''))
@@ -436,6 +548,124 @@ class ConceptImporter(BaseResourceImporter):
         return PERMISSION_DENIED
 
 
+class ConceptBulkImporter:
+    """
+    Creates the new concepts of consecutive concept lines in batches with Concept.bulk_persist_new.
+    Lines updating an existing concept (update_if_exists) go through ConceptImporter after their batch.
+    Mapping links and sources' concepts counts of the created concepts are done once by finalize.
+    """
+    def __init__(self, user, update_if_exists, batch_size=None):
+        self.user = user
+        self.update_if_exists = update_if_exists
+        self.batch_size = batch_size or settings.BULK_IMPORT_BATCH_SIZE
+        self.pending = []
+        self.parents = {}
+        self.created_ids = []
+        self.created_parents = {}
+
+    @staticmethod
+    def is_bulk_item(item):
+        """
+        Lines with parent concepts need the hierarchy processing of ConceptImporter, and the ones with an empty id
+        its mnemonic allocation (Concept.persist_new).
+        """
+        return bool(item.get('id')) and not item.get('parent_concept_urls')
+
+    def add(self, item, original_item):
+        self.pending.append((item, original_item))
+        if len(self.pending) >= self.batch_size:
+            return self.flush()
+        return []
+
+    def get_parent(self, importer):
+        key = (importer.get_owner_type(), importer.get('owner'), importer.get('source'))
+        if key not in self.parents:
+            parent = importer.get_parent()
+            self.parents[key] = (parent, bool(parent and parent.has_edit_access(self.user)))
+        return self.parents[key]
+
+    def flush(self):
+        """Imports the pending lines and returns (result, original_item, concept) for each."""
+        pending, self.pending = self.pending, []
+        results, importers = self.validate(pending)
+        to_create, to_update = self.classify(importers)
+        results += self.create(to_create)
+        for item, original_item in to_update:
+            importer = ConceptImporter(item, self.user, self.update_if_exists)
+            results.append((importer.run(), original_item, importer.instance))
+
+        return results
+
+    def validate(self, pending):
+        """Returns the results of the invalid (or not editable) lines and the importers of the others."""
+        results = []
+        importers = []
+        for item, original_item in pending:
+            importer = ConceptImporter(item, self.user, self.update_if_exists)
+            if not importer.is_valid():
+                results.append((False, original_item, None))
+                continue
+            importer.parent, can_edit = self.get_parent(importer)
+            if not importer.parent:
+                results.append((FAILED, original_item, None))
+            elif not can_edit:
+                results.append((PERMISSION_DENIED, original_item, None))
+            else:
+                importer.parse()
+                importers.append((importer, item, original_item))
+        return results, importers
+
+    def classify(self, importers):
+        """Splits the importers into the data to create and the lines updating an existing concept."""
+        existing = set()
+        if self.update_if_exists and importers:
+            existing = set(Concept.objects.filter(
+                parent_id__in={importer.parent.id for importer, _, _ in importers},
+                mnemonic__in={importer.data['mnemonic'] for importer, _, _ in importers}, id=F('versioned_object_id')
+            ).values_list('parent_id', 'mnemonic'))
+
+        to_create = []
+        to_update = []
+        for importer, item, original_item in importers:
+            key = (importer.parent.id, importer.data['mnemonic'])
+            if key in existing:
+                to_update.append((item, original_item))
+                continue
+            if self.update_if_exists:
+                existing.add(key)  # repeated in this batch, a new version of the one created here
+            if 'update_comment' in importer.data:
+                importer.data['comment'] = importer.data.pop('update_comment')
+            to_create.append(({**importer.data, '_counted': None, '_index': False}, original_item))
+        return to_create, to_update
+
+    def create(self, to_create):
+        results = []
+        if not to_create:
+            return results
+        concepts = Concept.bulk_persist_new([data for data, _ in to_create], self.user)
+        for concept, (_, original_item) in zip(concepts, to_create):
+            if concept.id:
+                self.created_ids.append(concept.id)
+                self.created_parents[concept.parent_id] = concept.parent
+                results.append((CREATED, original_item, concept))
+            else:
+                results.append((concept.errors or FAILED, original_item, None))
+        return results
+
+    def finalize(self):
+        """Links mappings to the created concepts and counts them. Returns ids of the linked mappings."""
+        if not self.created_ids:
+            return []
+        mapping_ids = Concept.link_mappings(self.created_ids)
+        for parent in self.created_parents.values():
+            parent.update_concepts_count(sync=True)
+        for ids in chunks(self.created_ids, 1000):
+            Concept.objects.filter(versioned_object_id__in=ids, _counted__isnull=True).update(_counted=True)
+        self.created_ids = []
+        self.created_parents = {}
+        return mapping_ids
+
+
 class MappingImporter(BaseResourceImporter):
     mandatory_fields = {"map_type", "from_concept_url"}
     allowed_fields = [
@@ -596,11 +826,14 @@ class ReferenceImporter(BaseResourceImporter):
 class BulkImportInline(BaseImporter):
     def __init__(  # pylint: disable=too-many-arguments
             self, content, username, update_if_exists=False, input_list=None, user=None, set_user=True,
-            self_task_id=None
+            self_task_id=None, bulk=None
     ):
         super().__init__(content, username, update_if_exists, user, not bool(input_list), set_user)
         self.self_task_id = self_task_id
-        if input_list:
+        self.bulk = settings.BULK_IMPORT_BULK_CREATE if bulk is None else bulk
+        if ImportFile.is_reference(input_list):
+            self.input_list = ImportFile.from_reference(input_list)
+        elif input_list:
             self.input_list = input_list
         self.unknown = []
         self.invalid = []
@@ -614,7 +847,7 @@ class BulkImportInline(BaseImporter):
         self.permission_denied = []
         self.others = []
         self.processed = 0
-        self.total = len(self.input_list)
+        self.total = (self.input_list.total or 0) if isinstance(self.input_list, ImportFile) else len(self.input_list)
         self.start_time = time.time()
         self.elapsed_seconds = 0
 
@@ -651,6 +884,15 @@ class BulkImportInline(BaseImporter):
         print("****Unexpected Result****", result)
         self.others.append(item)
 
+    def handle_concept_import_results(self, results, new_concept_ids):
+        for result, original_item, instance in results:
+            if get(instance, 'id'):
+                parent_url = instance.parent.uri
+                if parent_url not in new_concept_ids:
+                    new_concept_ids[parent_url] = []
+                new_concept_ids[parent_url].append(instance.mnemonic)
+            self.handle_item_import_result(result, original_item)
+
     def notify_progress(self):
         if self.self_task_id:  # pragma: no cover
             service = RedisService()
@@ -663,6 +905,7 @@ class BulkImportInline(BaseImporter):
             print("***************")
         new_concept_ids = {}
         new_mapping_ids = {}
+        concept_bulk_importer = ConceptBulkImporter(self.user, self.update_if_exists) if self.bulk else None
         for original_item in self.input_list:
             self.processed += 1
             logger.info('Processing %s of %s', str(self.processed), str(self.total))
@@ -670,6 +913,12 @@ class BulkImportInline(BaseImporter):
             item = original_item.copy()
             item_type = item.pop('type', '').lower()
             action = item.pop('__action', '').lower()
+            if concept_bulk_importer:
+                if item_type == 'concept' and ConceptBulkImporter.is_bulk_item(item):
+                    self.handle_concept_import_results(
+                        concept_bulk_importer.add(item, original_item), new_concept_ids)
+                    continue
+                self.handle_concept_import_results(concept_bulk_importer.flush(), new_concept_ids)
             if not item_type:
                 self.unknown.append(original_item)
             if item_type == 'organization':
@@ -726,6 +975,11 @@ class BulkImportInline(BaseImporter):
                 )
                 continue
 
+        if concept_bulk_importer:
+            self.handle_concept_import_results(concept_bulk_importer.flush(), new_concept_ids)
+            for chunk in chunks(concept_bulk_importer.finalize(), 1000):
+                batch_index_resources.apply_async(('mapping', dict(id__in=chunk), True), queue='indexing')
+
         if new_concept_ids:
             for parent_url, ids in new_concept_ids.items():
                 for chunk in chunks(ids, 1000):
@@ -737,6 +991,7 @@ class BulkImportInline(BaseImporter):
                     batch_index_resources.apply_async(
                         ('mapping', dict(mnemonic__in=chunk, parent__uri=parent_url), True), queue='indexing')
 
+        self.total = self.total or self.processed
         self.elapsed_seconds = time.time() - self.start_time
 
         self.make_result()
@@ -772,6 +1027,9 @@ class BulkImportInline(BaseImporter):
 
 
 class BulkImportParallelRunner(BaseImporter):  # pragma: no cover
+    children_data_types = ['concept', 'mapping', 'reference']
+    wait_timeout = 1  # seconds, progress is notified at least this often
+
     def __init__(
             self, content, username, update_if_exists, parallel=None, self_task_id=None
     ):  # pylint: disable=too-many-arguments
@@ -791,11 +1049,17 @@ class BulkImportParallelRunner(BaseImporter):  # pragma: no cover
         self.result = None
         self._json_result = None
         self.redis_service = RedisService()
-        if self.content:
-            self.input_list = self.content if isinstance(self.content, list) else self.content.splitlines()
-            self.total = len(self.input_list)
-        self.make_resource_distribution()
-        self.make_parts()
+        self.parts_key = f'bulk-import-parts-{self_task_id or uuid.uuid4()}'
+        self.import_file = None
+        if ImportFile.is_reference(self.content):
+            self.import_file = ImportFile.from_reference(self.content)
+            self.make_file_parts()
+        else:
+            if self.content:
+                self.input_list = self.content if isinstance(self.content, list) else self.content.splitlines()
+                self.total = len(self.input_list)
+            self.make_resource_distribution()
+            self.make_parts()
         self.content = None  # memory optimization
         self.input_list = []  # memory optimization
 
@@ -831,10 +1095,10 @@ class BulkImportParallelRunner(BaseImporter):  # pragma: no cover
             if data_type not in ['organization', 'source', 'collection']:
                 if prev_line:
                     prev_type = prev_line.get('type').lower()
-                    children_data_types = ['concept', 'mapping', 'reference']
-                    if prev_type == data_type or (
+                    children_data_types = self.children_data_types
+                    if (prev_type == data_type or (
                             data_type not in children_data_types and prev_type not in children_data_types
-                    ):
+                    )) and self.get_repo_key(prev_line) == self.get_repo_key(line):
                         self.parts[-1].append(line)
                     else:
                         self.parts.append([line])
@@ -842,6 +1106,130 @@ class BulkImportParallelRunner(BaseImporter):  # pragma: no cover
                     self.parts[-1].append(line)
                 prev_line = line
 
+    def make_file_parts(self):
+        """
+        Same parts as make_parts, from a single streaming pass over the import file. Organizations, sources and
+        collections are kept as lists, every other run of lines becomes a byte range of the file (a dict) with
+        split points (offset, lines before it) about every IMPORT_FILE_SPLIT_SIZE bytes, each at a line whose id
+        differs from the previous one, so that the versions of a resource stay in the same chunk.
+        """
+        children_data_types = self.children_data_types
+        ranges = []
+        prev_type = prev_id = prev_repo = None
+        for offset, line in self.import_file.lines():
+            data = json.loads(line)
+            data_type = data.get('type', None)
+            if not data_type:
+                raise ValidationError('"type" should be present in each line')
+            self.total += 1
+            if data_type.lower() in ['organization', 'source', 'collection']:
+                if data_type not in self.resource_distribution:
+                    self.resource_distribution[data_type] = []
+                self.resource_distribution[data_type].append(data)
+                prev_type = None  # a range can't span it
+                continue
+
+            data_type = data_type.lower()
+            line_id = data.get('id', None)
+            repo = self.get_repo_key(data)
+            if prev_type and repo == prev_repo and (prev_type == data_type or (
+                    data_type not in children_data_types and prev_type not in children_data_types)):
+                part = ranges[-1]
+                last_split = part['splits'][-1][0] if part['splits'] else part['start']
+                if data_type in children_data_types and line_id != prev_id and \
+                        offset - last_split >= settings.IMPORT_FILE_SPLIT_SIZE:
+                    part['splits'].append((offset, part['total']))
+                part['end'] = offset + len(line) + 1
+                part['total'] += 1
+            else:
+                ranges.append(
+                    dict(type=data_type, repo=repo, start=offset, end=offset + len(line) + 1, total=1, splits=[]))
+            prev_type = data_type
+            prev_id = line_id
+            prev_repo = repo
+
+        self.parts = deque(compact([
+            self.resource_distribution.get('Organization', None),
+            self.resource_distribution.get('Source', None),
+            self.resource_distribution.get('Collection', None),
+        ]) + ranges)
+
+    @staticmethod
+    def get_repo_key(line):
+        """(repo type, owner type, owner, repo id) of the source/collection a content line belongs to."""
+        data_type = line.get('type', '').lower()
+        if data_type in ['concept', 'mapping', 'source version']:
+            return 'source', line.get('owner_type'), line.get('owner'), line.get('source')
+        if data_type in ['reference', 'collection version']:
+            return 'collection', line.get('owner_type'), line.get('owner'), line.get('collection')
+        return None
+
+    @staticmethod
+    def get_part_type(part):
+        return part['type'] if isinstance(part, dict) else get(part, '0.type', '').lower()
+
+    def get_part_repo_key(self, part):
+        return part['repo'] if isinstance(part, dict) else self.get_repo_key(get(part, '0', None) or {})
+
+    def make_dependencies(self):
+        """
+        Indexes of the parts each part waits for. Organizations go before sources and collections, which go before
+        all content. Content of a source/collection keeps its file order, references also wait for the source
+        content before them (they can point to any source), mappings and concepts wait for all the concept and
+        mapping parts before them respectively (a mapping's target can be in any source, and the mapping's target
+        lookup and the concept's pending mappings link can both miss when they run together) and a part of no known
+        repo waits for everything before it, as does everything after it.
+        """
+        dependencies = []
+        repo_parts = set()
+        concept_parts = set()
+        mapping_parts = set()
+        last_part_of_repo = {}
+        barrier = None
+        for index, part in enumerate(self.parts):
+            part_type = self.get_part_type(part)
+            depends_on = set() if barrier is None else {barrier}
+            if part_type == 'organization':
+                repo_parts.add(index)
+            elif part_type in ['source', 'collection']:
+                depends_on.update(
+                    i for i in repo_parts if self.get_part_type(self.parts[i]) == 'organization')
+                repo_parts.add(index)
+            else:
+                repo = self.get_part_repo_key(part)
+                depends_on.update(repo_parts)
+                if repo is None:
+                    depends_on.update(range(index))
+                    barrier = index
+                elif repo in last_part_of_repo:
+                    depends_on.add(last_part_of_repo[repo])
+                if part_type == 'reference':
+                    depends_on.update(i for key, i in last_part_of_repo.items() if key[0] == 'source')
+                elif part_type == 'mapping':
+                    depends_on.update(concept_parts)
+                    mapping_parts.add(index)
+                elif part_type == 'concept':
+                    depends_on.update(mapping_parts)
+                    concept_parts.add(index)
+                if repo is not None:
+                    last_part_of_repo[repo] = index
+            dependencies.append(depends_on)
+        return dependencies
+
+    def chunk_file_range(self, part, is_child):
+        """Cuts a byte range part into up to `parallel` chunks of about the same size, at its split points."""
+        bounds = [(part['start'], 0)]
+        if is_child:
+            size = (part['end'] - part['start']) / self.parallel
+            for offset, count in part['splits']:
+                if len(bounds) < self.parallel and offset >= part['start'] + len(bounds) * size:
+                    bounds.append((offset, count))
+        bounds.append((part['end'], part['total']))
+        return [
+            self.import_file.part(start, end, total_end - total_start)
+            for (start, total_start), (end, total_end) in zip(bounds, bounds[1:])
+        ]
+
     @staticmethod
     def chunker_list(seq, size, is_child):  # pylint: disable=too-many-locals
         """
@@ -922,30 +1310,52 @@ class BulkImportParallelRunner(BaseImporter):  # pragma: no cover
             except:  # pylint: disable=bare-except
                 pass
 
-    def wait_till_tasks_alive(self):
-        while self.is_any_process_alive():
-            self.update_elapsed_seconds()
-            self.notify_progress()
-            time.sleep(1)
+    def wait_for_parts(self, running, done):
+        """
+        Blocks till a chord callback reports a finished part (or wait_timeout passes), then moves every finished
+        part from running to done. Finished is checked on the groups, a part with a failed task gets no callback.
+        """
+        self.redis_service.pop_from_list(self.parts_key, self.wait_timeout)
+        for index, (group_result, start_time) in list(running.items()):
+            if group_result.ready():
+                del running[index]
+                done.add(index)
+                part_type = self.get_part_type(self.parts[index])
+                if part_type in self.children_data_types:
+                    if part_type not in self.resource_wise_time:
+                        self.resource_wise_time[part_type] = 0
+                    self.resource_wise_time[part_type] += (time.time() - start_time)
+        self.update_elapsed_seconds()
+        self.notify_progress()
+
+    def run_parts(self):
+        """Queues each part as soon as the parts it depends on are done, independent parts run together."""
+        dependencies = self.make_dependencies()
+        pending = list(range(len(self.parts)))
+        running = {}
+        done = set()
+        try:
+            while pending or running:
+                for index in [index for index in pending if dependencies[index] <= done]:
+                    pending.remove(index)
+                    part = self.parts[index]
+                    part_type = self.get_part_type(part) if part else None
+                    if part_type:
+                        running[index] = (
+                            self.queue_tasks(part, part_type in self.children_data_types, index), time.time())
+                    else:
+                        done.add(index)
+                if running:
+                    self.wait_for_parts(running, done)
+        finally:
+            self.redis_service.delete(self.parts_key)
 
     def run(self):
         if self.self_task_id:
             print("****STARTED MAIN****")
             print(f"TASK ID: {self.self_task_id}")
             print("***************")
-        while len(self.parts) > 0:
-            part_list = self.parts.popleft()
-            if part_list:
-                part_type = get(part_list, '0.type', '').lower()
-                if part_type:
-                    is_child = part_type in ['concept', 'mapping', 'reference']
-                    start_time = time.time()
-                    self.queue_tasks(part_list, is_child)
-                    self.wait_till_tasks_alive()
-                    if is_child:
-                        if part_type not in self.resource_wise_time:
-                            self.resource_wise_time[part_type] = 0
-                        self.resource_wise_time[part_type] += (time.time() - start_time)
+        self.run_parts()
 
         print("Updating Active Concepts Count...")
         self.update_concept_counts()
@@ -1011,14 +1421,20 @@ class BulkImportParallelRunner(BaseImporter):  # pragma: no cover
             json=self.json_result, detailed_summary=self.detailed_summary, report=self.report
         )
 
-    def queue_tasks(self, part_list, is_child):
-        has_delete_action = not is_child and any(line.get('__action') == 'DELETE' for line in part_list)
-        chunked_lists = [part_list] if has_delete_action else compact(
-            self.chunker_list(part_list, self.parallel, is_child))
-        jobs = group(bulk_import_parts_inline.s(_list, self.username, self.update_if_exists) for _list in chunked_lists)
-        group_result = jobs.apply_async(queue='concurrent')
+    def queue_tasks(self, part_list, is_child, index):
+        if isinstance(part_list, dict):
+            chunked_lists = [part.reference for part in self.chunk_file_range(part_list, is_child)]
+        elif not is_child and any(line.get('__action') == 'DELETE' for line in part_list):
+            chunked_lists = [part_list]
+        else:
+            chunked_lists = compact(self.chunker_list(part_list, self.parallel, is_child))
+        group_result = chord(
+            bulk_import_parts_inline.s(_list, self.username, self.update_if_exists).set(queue='concurrent')
+            for _list in chunked_lists
+        )(bulk_import_part_done.s(self.parts_key, index)).parent
         self.groups.append(group_result)
         self.tasks += group_result.results
+        return group_result
 
     @staticmethod
     def update_concept_counts():
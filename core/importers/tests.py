@@ -1,3 +1,4 @@
+import hashlib
 import json
 import os
 import unittest
@@ -8,17 +9,21 @@ from celery_once import AlreadyQueued
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.management import call_command
 from django.db.models import F
+from django.test import override_settings
 from mock import patch, Mock, ANY, call, PropertyMock
 from ocldev.oclcsvtojsonconverter import OclStandardCsvToJsonConverter
 
 from core.collections.models import Collection
 from core.common.constants import CUSTOM_VALIDATION_SCHEMA_OPENMRS
+from core.common.tasks import bulk_import_inline, bulk_import_parallel_inline
 from core.common.tests import OCLAPITestCase, OCLTestCase
 from core.concepts.models import Concept
 from core.concepts.tests.factories import ConceptFactory
-from core.importers.models import BulkImport, BulkImportInline, BulkImportParallelRunner
+from core.importers.models import BulkImport, BulkImportInline, BulkImportParallelRunner, ImportFile, \
+    ConceptBulkImporter
 from core.importers.views import csv_file_data_to_input_list
 from core.mappings.models import Mapping
+from core.mappings.tests.factories import MappingFactory
 from core.orgs.models import Organization
 from core.orgs.tests.factories import OrganizationFactory
 from core.sources.models import Source
@@ -286,6 +291,89 @@ class BulkImportInlineTest(OCLTestCase):
         self.assertTrue(importer.elapsed_seconds > 0)
         batch_index_resources_mock.apply_async.assert_called()
 
+    @patch('core.importers.models.batch_index_resources')
+    def test_concept_bulk_import(self, batch_index_resources_mock):
+        source = OrganizationSourceFactory(
+            organization=(OrganizationFactory(mnemonic='DemoOrg')), mnemonic='DemoSource', version='HEAD'
+        )
+        ConceptFactory(parent=source, mnemonic='Existing')
+        mapping = MappingFactory(parent=source)
+        Mapping.objects.filter(id=mapping.id).update(to_concept=None, to_concept_code='Food', to_source_url=source.uri)
+
+        def concept_line(mnemonic, datatype='None'):
+            return {
+                "type": "Concept", "id": mnemonic, "concept_class": "Root", "datatype": datatype,
+                "source": "DemoSource", "owner": "DemoOrg", "owner_type": "Organization",
+                "names": [{"name": mnemonic, "locale": "en", "locale_preferred": True, "name_type": "Fully Specified"}],
+                "descriptions": [{"description": f"{mnemonic} desc", "locale": "en"}],
+            }
+
+        importer = BulkImportInline(
+            content=None, username='ocladmin', update_if_exists=False, bulk=True,
+            input_list=[concept_line('Food'), concept_line('Corn'), concept_line('Food'), concept_line('Existing'),
+                        {**concept_line('Bread'), 'owner': 'UnknownOrg'},
+                        {key: value for key, value in concept_line('Rice').items() if key != 'id'}]
+        )
+        importer.run()
+
+        self.assertEqual(importer.processed, 6)
+        self.assertEqual(len(importer.created), 2)
+        self.assertEqual(len(importer.failed), 3)
+        self.assertEqual(importer.failed[0]['id'], 'Bread')
+        self.assertEqual(importer.failed[1]['errors'], {'__all__': ['Concept ID must be unique within a source.']})
+        self.assertEqual(importer.failed[2]['errors'], {'__all__': ['Concept ID must be unique within a source.']})
+        self.assertEqual(len(importer.invalid), 1)
+
+        food = Concept.objects.get(parent=source, mnemonic='Food', id=F('versioned_object_id'))
+        food_version = food.get_latest_version()
+        self.assertEqual(food.uri, '/orgs/DemoOrg/sources/DemoSource/concepts/Food/')
+        self.assertEqual(food_version.uri, f'/orgs/DemoOrg/sources/DemoSource/concepts/Food/{food_version.id}/')
+        self.assertEqual(food.versions.count(), 1)
+        self.assertFalse(food.is_latest_version)
+        self.assertTrue(food_version.released)
+        for concept in [food, food_version]:
+            self.assertEqual(list(concept.names.values_list('name', flat=True)), ['Food'])
+            self.assertEqual(list(concept.descriptions.values_list('name', flat=True)), ['Food desc'])
+            self.assertEqual(list(concept.sources.all()), [source])
+            self.assertTrue(concept._counted)  # pylint: disable=protected-access
+        mapping.refresh_from_db()
+        self.assertEqual(mapping.to_concept_id, food.id)
+        source.refresh_from_db()
+        self.assertEqual(source.active_concepts, 3)
+        batch_index_resources_mock.apply_async.assert_any_call(
+            ('mapping', dict(id__in=[mapping.id]), True), queue='indexing')
+
+        importer = BulkImportInline(
+            content=None, username='ocladmin', update_if_exists=True, bulk=True,
+            input_list=[concept_line('Food', 'Rule'), concept_line('Rice')]
+        )
+        importer.run()
+
+        self.assertEqual(len(importer.created), 1)
+        self.assertEqual(len(importer.updated), 1)
+        self.assertEqual(food.versions.count(), 2)
+        self.assertEqual(food.get_latest_version().datatype, 'Rule')
+
+    @patch('core.importers.models.batch_index_resources', Mock())
+    def test_concept_bulk_import_without_id_allocates_mnemonic(self):
+        source = OrganizationSourceFactory(
+            organization=(OrganizationFactory(mnemonic='DemoOrg')), mnemonic='DemoSource', version='HEAD'
+        )
+        line = {
+            "type": "Concept", "id": "", "concept_class": "Root", "datatype": "None",
+            "source": "DemoSource", "owner": "DemoOrg", "owner_type": "Organization",
+            "names": [{"name": "Food", "locale": "en", "locale_preferred": True, "name_type": "Fully Specified"}],
+        }
+        self.assertFalse(ConceptBulkImporter.is_bulk_item(line))
+
+        importer = BulkImportInline(
+            content=None, username='ocladmin', update_if_exists=False, bulk=True, input_list=[line])
+        importer.run()
+
+        self.assertEqual(len(importer.created), 1)
+        concept = Concept.objects.get(parent=source, id=F('versioned_object_id'))
+        self.assertEqual(concept.mnemonic, str(concept.id))
+
     def test_concept_import_permission_denied(self):
         self.assertFalse(Concept.objects.filter(mnemonic='Food').exists())
 
@@ -538,6 +626,162 @@ class BulkImportParallelRunnerTest(OCLTestCase):
         self.assertEqual([l['type'] for l in importer.parts[5]], ['Source Version', 'Source Version'])
         self.assertEqual(list({l['type'] for l in importer.parts[6]}), ['Concept'])
 
+    @override_settings(IMPORT_FILE_SPLIT_SIZE=1)
+    @patch('core.importers.models.RedisService')
+    def test_make_file_parts(self, redis_service_mock):
+        redis_service_mock.return_value = Mock()
+        path = os.path.join(os.path.dirname(__file__), '..', 'samples/sample_ocldev.json')
+
+        importer = BulkImportParallelRunner(dict(path=path), 'ocladmin', True, parallel=2)
+
+        self.assertEqual(importer.total, 64)
+        self.assertEqual(len(importer.parts), 8)
+        self.assertEqual([line['type'] for line in importer.parts[0]], ['Organization', 'Organization'])
+        self.assertEqual([line['type'] for line in importer.parts[1]], ['Source', 'Source'])
+        ranges = list(importer.parts)[2:]
+        self.assertEqual(
+            [(part['type'], part['total']) for part in ranges],
+            [('source version', 1), ('concept', 23), ('mapping', 22), ('source version', 1), ('source version', 1),
+             ('concept', 12)]
+        )
+        concepts = ranges[1]
+        self.assertEqual(
+            [line['type'] for line in importer.import_file.part(concepts['start'], concepts['end'])], ['Concept'] * 23)
+
+        chunks = importer.chunk_file_range(concepts, True)
+        self.assertEqual(len(chunks), 2)
+        self.assertEqual(chunks[0].end, chunks[1].start)
+        self.assertEqual(sum(chunk.total for chunk in chunks), 23)
+        first, second = list(chunks[0]), list(chunks[1])
+        self.assertEqual([len(first), len(second)], [chunks[0].total, chunks[1].total])
+        self.assertNotEqual(first[-1]['id'], second[0]['id'])
+        self.assertEqual(len(importer.chunk_file_range(ranges[0], False)), 1)
+
+    def test_import_file(self):
+        path = os.path.join(os.path.dirname(__file__), '..', 'samples/sample_ocldev.json')
+        import_file = ImportFile.from_reference(dict(path=path))
+
+        lines = list(import_file.lines())
+        self.assertEqual(len(lines), 64)
+        offset, line = lines[3]
+        self.assertEqual(json.loads(line)['type'], 'Concept')
+        self.assertEqual(list(import_file.part(offset, offset + len(line) + 1)), [json.loads(line)])
+        self.assertEqual(list(import_file.part(offset, offset)), [])
+
+        importer = BulkImportInline(
+            content=None, username='ocladmin', input_list=import_file.part(0, lines[1][0], 1).reference)
+        self.assertIsInstance(importer.input_list, ImportFile)
+        self.assertEqual(importer.total, 1)
+
+    @patch('core.importers.models.get_export_service')
+    def test_import_file_store(self, export_service_mock):
+        chunks = [b'{"type": "Concept"}\n\n{"type": ', b'"Mapping"}\n{"type": "Concept"}']
+
+        import_file = ImportFile.store(iter(chunks), 'ocladmin')
+
+        self.assertTrue(import_file.key.startswith('imports/ocladmin/'))
+        self.assertEqual(import_file.total, 3)
+        self.assertEqual(import_file.digest, hashlib.sha256(b''.join(chunks)).hexdigest())
+        self.assertEqual(import_file.reference['digest'], import_file.digest)
+        writer = export_service_mock.return_value.multipart_writer.return_value.__enter__.return_value
+        self.assertEqual([args[0][0] for args in writer.write.call_args_list], chunks)
+
+        importer = BulkImportInline(content=None, username='ocladmin', input_list=import_file.reference)
+        self.assertEqual(importer.total, 3)
+
+    def test_stored_import_lock_key_is_content_hash(self):
+        reference = ImportFile(key='imports/ocladmin/1.json', total=3, digest='abc').reference
+        duplicate = ImportFile(key='imports/ocladmin/2.json', total=3, digest='abc').reference
+        other = ImportFile(key='imports/ocladmin/3.json', total=3, digest='def').reference
+
+        self.assertEqual(
+            bulk_import_inline.get_key((reference, 'ocladmin', True)),
+            bulk_import_inline.get_key((duplicate, 'ocladmin', True))
+        )
+        self.assertNotEqual(
+            bulk_import_inline.get_key((reference, 'ocladmin', True)),
+            bulk_import_inline.get_key((other, 'ocladmin', True))
+        )
+        self.assertEqual(
+            bulk_import_parallel_inline.get_key((reference, 'ocladmin', True, 5)),
+            bulk_import_parallel_inline.get_key(kwargs=dict(
+                to_import=duplicate, username='ocladmin', update_if_exists=True, threads=5))
+        )
+        self.assertEqual(
+            bulk_import_inline.get_key(('content', 'ocladmin', True)),
+            'qo_core.common.tasks.bulk_import_inline_to_import-content_update_if_exists-True_username-ocladmin'
+        )
+
+    @staticmethod
+    def get_two_sources_content():
+        repo = dict(owner='Org', owner_type='Organization')
+        return [
+            dict(type='Organization', id='Org'),
+            dict(type='Source', id='A', **repo),
+            dict(type='Source', id='B', **repo),
+            dict(type='Collection', id='C', **repo),
+            dict(type='Concept', id='a1', source='A', **repo),
+            dict(type='Concept', id='a2', source='A', **repo),
+            dict(type='Concept', id='b1', source='B', **repo),
+            dict(type='Mapping', source='A', **repo),
+            dict(type='Mapping', source='B', **repo),
+            dict(type='Reference', collection='C', **repo),
+            dict(type='Collection Version', id='v1', collection='C', **repo),
+            dict(type='Source Version', id='v1', source='A', **repo),
+        ]
+
+    @patch('core.importers.models.RedisService')
+    def test_make_dependencies(self, redis_service_mock):
+        redis_service_mock.return_value = Mock()
+
+        importer = BulkImportParallelRunner(self.get_two_sources_content(), 'ocladmin', True)
+
+        self.assertEqual(
+            [importer.get_part_type(part) for part in importer.parts],
+            ['organization', 'source', 'collection', 'concept', 'concept', 'mapping', 'mapping', 'reference',
+             'collection version', 'source version']
+        )
+        self.assertEqual([len(part) for part in importer.parts], [1, 2, 1, 2, 1, 1, 1, 1, 1, 1])
+        self.assertEqual(
+            importer.make_dependencies(),
+            [set(), {0}, {0}, {0, 1, 2}, {0, 1, 2}, {0, 1, 2, 3, 4}, {0, 1, 2, 3, 4}, {0, 1, 2, 5, 6},
+             {0, 1, 2, 7}, {0, 1, 2, 5}]
+        )
+
+        importer = BulkImportParallelRunner(
+            [*self.get_two_sources_content()[:5], dict(type='Foo'), dict(type='Mapping', source='A')],
+            'ocladmin', True
+        )
+        self.assertEqual(
+            importer.make_dependencies(), [set(), {0}, {0}, {0, 1, 2}, {0, 1, 2, 3}, {0, 1, 2, 3, 4}])
+
+        content = self.get_two_sources_content()
+        importer = BulkImportParallelRunner([*content[:3], content[7], content[6]], 'ocladmin', True)
+        self.assertEqual(
+            [importer.get_part_type(part) for part in importer.parts], ['organization', 'source', 'mapping', 'concept'])
+        self.assertEqual(importer.make_dependencies(), [set(), {0}, {0, 1}, {0, 1, 2}])
+
+    @patch('core.importers.models.RedisService')
+    def test_run_parts(self, redis_service_mock):
+        redis_instance_mock = Mock()
+        redis_service_mock.return_value = redis_instance_mock
+        importer = BulkImportParallelRunner(self.get_two_sources_content(), 'ocladmin', True, self_task_id='task')
+        importer.queue_tasks = Mock(return_value=Mock(ready=Mock(return_value=True)))
+
+        importer.run_parts()
+
+        self.assertEqual(
+            [(importer.get_part_type(part), is_child, index) for (part, is_child, index), _ in
+             importer.queue_tasks.call_args_list],
+            [('organization', False, 0), ('source', False, 1), ('collection', False, 2), ('concept', True, 3),
+             ('concept', True, 4), ('mapping', True, 5), ('mapping', True, 6), ('reference', True, 7),
+             ('source version', False, 9), ('collection version', False, 8)]
+        )
+        self.assertEqual(redis_instance_mock.pop_from_list.call_count, 6)
+        redis_instance_mock.pop_from_list.assert_called_with('bulk-import-parts-task', 1)
+        redis_instance_mock.delete.assert_called_once_with('bulk-import-parts-task')
+        self.assertEqual(sorted(importer.resource_wise_time.keys()), ['concept', 'mapping', 'reference'])
+
     @patch('core.importers.models.RedisService')
     def test_is_any_process_alive(self, redis_service_mock):
         redis_service_mock.return_value = Mock()
@@ -1035,6 +1279,40 @@ class BulkImportViewTest(OCLAPITestCase):
         self.assertEqual(bulk_import_mock.apply_async.call_args[1]['task_id'][37:], 'ocladmin~priority')
         self.assertEqual(bulk_import_mock.apply_async.call_args[1]['queue'], 'bulk_import_root')
 
+    @override_settings(IMPORT_FILE_MIN_SIZE=1)
+    @patch('core.importers.models.get_export_service')
+    @patch('core.importers.views.queue_bulk_import')
+    def test_post_inline_large_file_409_removes_stored_file(self, queue_bulk_import_mock, export_service_mock):
+        queue_bulk_import_mock.side_effect = AlreadyQueued('already-queued')
+        file = SimpleUploadedFile('file.json', b'{"key": "value"}', "application/json")
+
+        response = self.client.post(
+            "/importers/bulk-import-inline/?update_if_exists=true",
+            {'file': file},
+            HTTP_AUTHORIZATION='Token ' + self.token,
+        )
+
+        self.assertEqual(response.status_code, 409)
+        key = queue_bulk_import_mock.call_args[0][0]['key']
+        self.assertTrue(key.startswith('imports/ocladmin/'))
+        export_service_mock.return_value.multipart_writer.assert_called_once_with(key)
+        export_service_mock.return_value.remove.assert_called_once_with(key)
+
+    @override_settings(IMPORT_FILE_MIN_SIZE=1)
+    @patch('core.importers.models.get_export_service')
+    def test_post_inline_large_file_invalid_update_if_exists_removes_stored_file(self, export_service_mock):
+        file = SimpleUploadedFile('file.json', b'{"key": "value"}', "application/json")
+
+        response = self.client.post(
+            "/importers/bulk-import-inline/?update_if_exists=foo",
+            {'file': file},
+            HTTP_AUTHORIZATION='Token ' + self.token,
+        )
+
+        self.assertEqual(response.status_code, 400)
+        export_service_mock.return_value.remove.assert_called_once_with(
+            export_service_mock.return_value.multipart_writer.call_args[0][0])
+
     @patch('core.importers.views.QueueOnce.once_backend', new_callable=PropertyMock)
     @patch('core.importers.views.AsyncResult')
     @patch('core.importers.views.app')
@@ -4,6 +4,7 @@ import io
 import requests
 from celery.result import AsyncResult
 from celery_once import AlreadyQueued, QueueOnce
+from django.conf import settings
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from ocldev.oclcsvtojsonconverter import OclStandardCsvToJsonConverter
@@ -21,12 +22,19 @@ from core.common.swagger_parameters import update_if_exists_param, task_param, r
 from core.common.utils import parse_bulk_import_task_id, task_exists, flower_get, queue_bulk_import, \
     get_bulk_import_celery_once_lock_key, is_csv_file
 from core.importers.constants import ALREADY_QUEUED, INVALID_UPDATE_IF_EXISTS, NO_CONTENT_TO_IMPORT
+from core.importers.models import ImportFile
 
 
 def csv_file_data_to_input_list(file_content):
     return [row for row in csv.DictReader(io.StringIO(file_content))]  # pylint: disable=unnecessary-comprehension
 
 
+def discard_stored_content(data):
+    """Removes the stored file of an inline import that won't be queued, queued tasks remove it once done."""
+    if ImportFile.is_reference(data):
+        ImportFile.from_reference(data).remove()
+
+
 def import_response(request, import_queue, data, threads=None, inline=False):
     if not data:
         return Response(dict(exception=NO_CONTENT_TO_IMPORT), status=status.HTTP_400_BAD_REQUEST)
@@ -35,6 +43,7 @@ def import_response(request, import_queue, data, threads=None, inline=False):
     username = user.username
     update_if_exists = request.GET.get('update_if_exists', 'true')
     if update_if_exists not in ['true', 'false']:
+        discard_stored_content(data)
         return Response(
             dict(exception=INVALID_UPDATE_IF_EXISTS),
             status=status.HTTP_400_BAD_REQUEST
@@ -46,6 +55,7 @@ def import_response(request, import_queue, data, threads=None, inline=False):
     try:
         task = queue_bulk_import(data, import_queue, username, update_if_exists, threads, inline)
     except AlreadyQueued:
+        discard_stored_content(data)
         return Response(dict(exception=ALREADY_QUEUED), status=status.HTTP_409_CONFLICT)
     parsed_task = parse_bulk_import_task_id(task.id)
     return Response(
@@ -238,6 +248,57 @@ class BulkImportView(APIView):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+def get_inline_import_content(request):
+    """
+    Returns the content of an inline import request, from its uploaded file, file url or data.
+    JSON lines files of settings.IMPORT_FILE_MIN_SIZE bytes or more are stored without being loaded in memory
+    and their ImportFile reference is returned instead.
+    """
+    file = None
+    file_name = None
+    is_upload = 'file' in request.data
+    is_file_url = 'file_url' in request.data
+    is_data = 'data' in request.data
+    file_content = None
+    chunks = None
+    try:
+        if is_upload:
+            file = request.data['file']
+            file_name = file.name
+            if not is_csv_file(name=file_name) and file.size >= settings.IMPORT_FILE_MIN_SIZE:
+                chunks = file.chunks()
+            else:
+                file_content = file.read().decode('utf-8')
+        elif is_file_url:
+            file_name = request.data['file_url']
+            headers = {
+                'User-Agent': 'OCL'  # user-agent required by mod_security on some servers
+            }
+            file = requests.get(file_name, headers=headers, stream=True)
+            if not is_csv_file(name=file_name) and \
+                    int(file.headers.get('Content-Length') or 0) >= settings.IMPORT_FILE_MIN_SIZE:
+                chunks = file.iter_content(ImportFile.chunk_size)
+            else:
+                file_content = file.text
+    except:  # pylint: disable=bare-except
+        pass
+
+    if chunks is not None:  # storing failures aren't missing content, they are raised
+        return ImportFile.store(chunks, request.user.username).reference
+
+    if not file_content and not is_data:
+        return None
+
+    if file_name and is_csv_file(name=file_name):
+        return OclStandardCsvToJsonConverter(
+            input_list=csv_file_data_to_input_list(file_content),
+            allow_special_characters=True
+        ).process()
+    if file:
+        return file_content
+    return request.data.get('data')
+
+
 class BulkImportParallelInlineView(APIView):  # pragma: no cover
     permission_classes = (IsAuthenticated, )
     parser_classes = (MultiPartParser, FormParser)
@@ -247,40 +308,10 @@ class BulkImportParallelInlineView(APIView):  # pragma: no cover
     )
     def post(self, request, import_queue=None):
         parallel_threads = request.data.get('parallel') or 5
-        file = None
-        file_name = None
-        is_upload = 'file' in request.data
-        is_file_url = 'file_url' in request.data
-        is_data = 'data' in request.data
-        file_content = None
-        try:
-            if is_upload:
-                file = request.data['file']
-                file_name = file.name
-                file_content = file.read().decode('utf-8')
-            elif is_file_url:
-                file_name = request.data['file_url']
-                headers = {
-                    'User-Agent': 'OCL'  # user-agent required by mod_security on some servers
-                }
-                file = requests.get(file_name, headers=headers)
-                file_content = file.text
-        except:  # pylint: disable=bare-except
-            pass
-
-        if not file_content and not is_data:
+        data = get_inline_import_content(request)
+        if data is None:
             return Response(dict(exception=NO_CONTENT_TO_IMPORT), status=status.HTTP_400_BAD_REQUEST)
 
-        if file_name and is_csv_file(name=file_name):
-            data = OclStandardCsvToJsonConverter(
-                input_list=csv_file_data_to_input_list(file_content),
-                allow_special_characters=True
-            ).process()
-        elif file:
-            data = file_content
-        else:
-            data = request.data.get('data')
-
         return import_response(self.request, import_queue, data, parallel_threads, True)
 
 
@@ -292,38 +323,8 @@ class BulkImportInlineView(APIView):  # pragma: no cover
         manual_parameters=[update_if_exists_param, file_url_param, file_upload_param],
     )
     def post(self, request, import_queue=None):
-        file = None
-        file_name = None
-        is_upload = 'file' in request.data
-        is_file_url = 'file_url' in request.data
-        is_data = 'data' in request.data
-        file_content = None
-        try:
-            if is_upload:
-                file = request.data['file']
-                file_name = file.name
-                file_content = file.read().decode('utf-8')
-            elif is_file_url:
-                file_name = request.data['file_url']
-                headers = {
-                    'User-Agent': 'OCL'  # user-agent required by mod_security on some servers
-                }
-                file = requests.get(file_name, headers=headers)
-                file_content = file.text
-        except:  # pylint: disable=bare-except
-            pass
-
-        if not file_content and not is_data:
+        data = get_inline_import_content(request)
+        if data is None:
             return Response(dict(exception=NO_CONTENT_TO_IMPORT), status=status.HTTP_400_BAD_REQUEST)
 
-        if file_name and is_csv_file(name=file_name):
-            data = OclStandardCsvToJsonConverter(
-                input_list=csv_file_data_to_input_list(file_content),
-                allow_special_characters=True
-            ).process()
-        elif file:
-            data = file_content
-        else:
-            data = request.data.get('data')
-
         return import_response(self.request, import_queue, data, None, True)
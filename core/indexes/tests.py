@@ -76,6 +76,21 @@ class RebuildESIndexViewTest(OCLAPITestCase):
         )
         task_mock.delay.assert_called_once_with(None)
 
+    @patch('core.indexes.views.RebuildESIndexView.task')
+    def test_post_202_zero_downtime(self, task_mock):
+        task_mock.delay = Mock(return_value=Mock(state='state', task_id='task-id'))
+        response = self.client.post(
+            '/indexes/apps/rebuild/',
+            dict(apps='concepts,mappings', zero_downtime='true'),
+            HTTP_AUTHORIZATION=self.token_header,
+        )
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(
+            response.data,
+            dict(state='state', username=self.user.username, task='task-id', queue='default')
+        )
+        task_mock.delay.assert_called_once_with(['concepts', 'mappings'], zero_downtime=True)
+
 
 class ResourceIndexViewTest(OCLAPITestCase):
     def setUp(self):
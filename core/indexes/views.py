@@ -7,7 +7,8 @@ from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from core.common.swagger_parameters import apps_param, ids_param, resources_body_param, uri_param
+from core.common.swagger_parameters import apps_param, ids_param, resources_body_param, uri_param, \
+    zero_downtime_param
 from core.common.tasks import rebuild_indexes, populate_indexes, batch_index_resources
 from core.common.utils import get_resource_class_from_resource_name
 
@@ -22,17 +23,29 @@ class BaseESIndexView(APIView):  # pragma: no cover
         apps = request.data.get('apps', None)
         if apps:
             apps = apps.split(',')
-        result = self.task.delay(apps)
+        result = self.task.delay(apps, **self.get_task_kwargs())
 
         return Response(
             dict(state=result.state, username=self.request.user.username, task=result.task_id, queue='default'),
             status=status.HTTP_202_ACCEPTED
         )
 
+    def get_task_kwargs(self):
+        return {}
+
 
 class RebuildESIndexView(BaseESIndexView):  # pragma: no cover
     task = rebuild_indexes
 
+    @swagger_auto_schema(manual_parameters=[apps_param, zero_downtime_param])
+    def post(self, request):
+        return super().post(request)
+
+    def get_task_kwargs(self):
+        if self.request.data.get('zero_downtime', None) in ['true', True]:
+            return dict(zero_downtime=True)
+        return {}
+
 
 class PopulateESIndexView(BaseESIndexView):  # pragma: no cover
     task = populate_indexes
@@ -1,13 +1,15 @@
+from django.conf import settings
 from django_elasticsearch_dsl import Document, fields
 from django_elasticsearch_dsl.registries import registry
 from pydash import get
 
+from core.common.documents import PrefetchedIndexingMixin
 from core.common.utils import jsonify_safe, flatten_dict
 from core.mappings.models import Mapping
 
 
 @registry.register_document
-class MappingDocument(Document):
+class MappingDocument(PrefetchedIndexingMixin, Document):
     class Index:
         name = 'mappings'
         settings = {'number_of_shards': 1, 'number_of_replicas': 0}
@@ -47,6 +49,7 @@ class MappingDocument(Document):
     public_can_view = fields.BooleanField(attr='public_can_view')
     id = fields.KeywordField(attr='mnemonic', normalizer="lowercase")
     extras = fields.ObjectField(dynamic=True)
+    list_payload = fields.ObjectField(enabled=False)
     created_by = fields.KeywordField(attr='created_by.username')
 
     @staticmethod
@@ -79,27 +82,34 @@ class MappingDocument(Document):
 
     @staticmethod
     def prepare_source_version(instance):
-        return list(instance.sources.values_list('version', flat=True))
+        return [source.version for source in instance.sources.all()]
 
     @staticmethod
     def prepare_collection_version(instance):
-        return list(set(instance.expansion_set.values_list('collection_version__version', flat=True)))
+        return list({get(expansion, 'collection_version.version') for expansion in instance.expansion_set.all()})
 
     @staticmethod
     def prepare_expansion(instance):
-        return list(instance.expansion_set.values_list('mnemonic', flat=True))
+        return [expansion.mnemonic for expansion in instance.expansion_set.all()]
 
     @staticmethod
     def prepare_collection(instance):
-        return list(set(instance.expansion_set.values_list('collection_version__mnemonic', flat=True)))
+        return list({get(expansion, 'collection_version.mnemonic') for expansion in instance.expansion_set.all()})
 
     @staticmethod
     def prepare_collection_url(instance):
-        return list(set(list(instance.expansion_set.values_list('collection_version__uri', flat=True))))
+        return list({get(expansion, 'collection_version.uri') for expansion in instance.expansion_set.all()})
 
     @staticmethod
     def prepare_collection_owner_url(instance):
-        return list(set(expansion.owner_url for expansion in instance.expansion_set.all()))
+        return list({expansion.owner_url for expansion in instance.expansion_set.all()})
+
+    @staticmethod
+    def prepare_list_payload(instance):
+        if not settings.ES_NATIVE_LIST_RESULTS:
+            return None
+        from core.mappings.serializers import MappingListSerializer
+        return dict(MappingListSerializer(instance).data)
 
     @staticmethod
     def prepare_extras(instance):
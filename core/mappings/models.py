@@ -114,6 +114,15 @@ class Mapping(MappingValidationMixin, SourceChildMixin, VersionedModel):
     WAS_RETIRED = MAPPING_WAS_RETIRED
     WAS_UNRETIRED = MAPPING_WAS_UNRETIRED
 
+    index_buffered = True
+    index_prefetch_related = [
+        'sources', 'expansion_set__collection_version', 'parent__organization', 'parent__user', 'created_by',
+        'from_concept__names', 'from_concept__parent__organization', 'from_concept__parent__user',
+        'to_concept__names', 'to_concept__parent__organization', 'to_concept__parent__user',
+        'from_source__organization', 'from_source__user', 'to_source__organization', 'to_source__user',
+        'versions_set'
+    ]
+
     es_fields = {
         'id': {'sortable': True, 'filterable': True, 'exact': True},
         'last_update': {'sortable': True, 'filterable': False, 'facet': False, 'default': 'desc'},
@@ -412,6 +421,7 @@ class Mapping(MappingValidationMixin, SourceChildMixin, VersionedModel):
             mapping.sources.set([parent])
             if mapping._counted is True:
                 parent.update_mappings_count()
+            mapping.invalidate_response_cache()
         except ValidationError as ex:
             mapping.errors.update(ex.message_dict)
         except IntegrityError as ex:
@@ -474,6 +484,7 @@ class Mapping(MappingValidationMixin, SourceChildMixin, VersionedModel):
                     obj.sources.set([parent])
                     persisted = True
                     cls.resume_indexing()
+                    obj.invalidate_response_cache()
 
                     def index_all():
                         if obj._index:  # pylint: disable=protected-access
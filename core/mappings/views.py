@@ -10,11 +10,11 @@ from rest_framework.response import Response
 
 from core.common.constants import HEAD, ACCESS_TYPE_NONE
 from core.common.exceptions import Http400
-from core.common.mixins import ListWithHeadersMixin, ConceptDictionaryMixin
+from core.common.mixins import ListWithHeadersMixin, ConceptDictionaryMixin, ResponseCacheMixin
 from core.common.swagger_parameters import (
     q_param, limit_param, sort_desc_param, page_param, exact_match_param, sort_asc_param, verbose_param,
     include_facets_header, updated_since_param, include_retired_param,
-    compress_header, include_source_versions_param, include_collection_versions_param)
+    compress_header, include_source_versions_param, include_collection_versions_param, cursor_param, stream_param)
 from core.common.views import SourceChildCommonBaseView, SourceChildExtrasView, \
     SourceChildExtraRetrieveUpdateDestroyView
 from core.concepts.permissions import CanEditParentDictionary, CanViewParentDictionary
@@ -42,8 +42,9 @@ class MappingBaseView(SourceChildCommonBaseView):
         return Mapping.get_base_queryset(self.params)
 
 
-class MappingListView(MappingBaseView, ListWithHeadersMixin, CreateModelMixin):
+class MappingListView(ResponseCacheMixin, MappingBaseView, ListWithHeadersMixin, CreateModelMixin):
     serializer_class = MappingListSerializer
+    es_native_list_serializer_class = MappingListSerializer
 
     def get_permissions(self):
         if self.request.method == 'POST':
@@ -87,7 +88,7 @@ class MappingListView(MappingBaseView, ListWithHeadersMixin, CreateModelMixin):
         manual_parameters=[
             q_param, limit_param, sort_desc_param, sort_asc_param, exact_match_param, page_param, verbose_param,
             include_retired_param, updated_since_param,
-            include_facets_header, compress_header
+            include_facets_header, compress_header, cursor_param, stream_param
         ]
     )
     def get(self, request, *args, **kwargs):
@@ -132,7 +133,9 @@ class MappingListView(MappingBaseView, ListWithHeadersMixin, CreateModelMixin):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class MappingRetrieveUpdateDestroyView(MappingBaseView, RetrieveAPIView, UpdateAPIView, DestroyAPIView):
+class MappingRetrieveUpdateDestroyView(
+        ResponseCacheMixin, MappingBaseView, RetrieveAPIView, UpdateAPIView, DestroyAPIView
+):
     serializer_class = MappingDetailSerializer
 
     def is_container_version_specified(self):
@@ -282,7 +285,7 @@ class MappingVersionsView(MappingBaseView, ConceptDictionaryMixin, ListWithHeade
         return self.list(request, *args, **kwargs)
 
 
-class MappingVersionRetrieveView(MappingBaseView, RetrieveAPIView, DestroyAPIView):
+class MappingVersionRetrieveView(ResponseCacheMixin, MappingBaseView, RetrieveAPIView, DestroyAPIView):
     serializer_class = MappingVersionDetailSerializer
 
     def get_permissions(self):
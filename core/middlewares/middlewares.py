@@ -1,12 +1,17 @@
+import json
 import logging
+import random
 import time
 
 from request_logging.middleware import LoggingMiddleware
 from core.common.constants import VERSION_HEADER, REQUEST_USER_HEADER, RESPONSE_TIME_HEADER, REQUEST_URL_HEADER, \
-    REQUEST_METHOD_HEADER
+    REQUEST_METHOD_HEADER, PROFILE_PARAM
+from core.common.metrics import record_request
+from core.common.profiling import install_profiling, profile_request, get_current_profile
 from core.common.utils import set_current_user, set_request_url
 
 request_logger = logging.getLogger('request_logger')
+profile_logger = logging.getLogger('request_profiler')
 MAX_BODY_LENGTH = 50000
 
 
@@ -52,6 +57,80 @@ class ResponseHeadersMiddleware(BaseMiddleware):
         return response
 
 
+class ProfilingMiddleware(BaseMiddleware):
+    """
+    Opt-in profiling of a request (X-OCL-PROFILE: true header or profile=true query param): SQL count/time and
+    most repeated SQL shapes, ES requests/took, Redis calls and serializer time, returned as X-OCL-PROFILE-*
+    response headers to staff users. Profiles are logged as JSON with REQUEST_PROFILING_LOG, and a
+    REQUEST_PROFILING_SAMPLE_RATE of all requests is profiled and logged (without headers).
+    """
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        install_profiling()
+
+    @staticmethod
+    def is_requested(request):
+        return request.META.get('HTTP_X_OCL_PROFILE', '').lower() == 'true' or \
+            request.GET.get(PROFILE_PARAM, '').lower() == 'true'
+
+    def __call__(self, request):
+        from django.conf import settings
+        is_requested = self.is_requested(request)
+        is_sampled = random.random() < settings.REQUEST_PROFILING_SAMPLE_RATE
+        if not is_requested and not is_sampled:
+            return self.get_response(request)
+
+        with profile_request() as profile:
+            response = self.get_response(request)
+
+        user = getattr(request, 'user', None)
+        if is_requested and getattr(user, 'is_staff', False):
+            for header, value in profile.to_headers().items():
+                response[header] = value
+        if is_sampled or (is_requested and settings.REQUEST_PROFILING_LOG):
+            profile_logger.info(json.dumps(dict(
+                method=request.method, path=request.path, status=response.status_code, user=str(user),
+                sampled=is_sampled, **profile.to_dict()
+            )))
+        return response
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Records latency, SQL query and ES request counts of every request by view for /metrics."""
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        install_profiling()
+
+    @staticmethod
+    def get_view_name(request):
+        resolver_match = getattr(request, 'resolver_match', None)
+        if not resolver_match:
+            return 'unresolved'
+        view = resolver_match.func
+        return getattr(view, 'view_class', getattr(view, 'cls', view)).__name__
+
+    def __call__(self, request):
+        from django.conf import settings
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+
+        start_time = time.time()
+        profile = get_current_profile()
+        if profile:  # already profiled with details, count the difference
+            sql_count, es_count = profile.sql_count, profile.es_count
+            response = self.get_response(request)
+            sql_count, es_count = profile.sql_count - sql_count, profile.es_count - es_count
+        else:
+            with profile_request(detailed=False) as profile:
+                response = self.get_response(request)
+            sql_count, es_count = profile.sql_count, profile.es_count
+        record_request(
+            self.get_view_name(request), request.method, response.status_code, time.time() - start_time, sql_count,
+            es_count
+        )
+        return response
+
+
 class CurrentUserMiddleware(BaseMiddleware):
     def __call__(self, request):
         set_current_user(lambda self: getattr(request, 'user', None))
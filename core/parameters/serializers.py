@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from rest_framework.fields import CharField, SerializerMethodField, BooleanField
+from rest_framework.fields import CharField, SerializerMethodField, BooleanField, ListField, DictField
 
 from core.common.constants import HEAD
 from core.common.serializers import ReadSerializerMixin
@@ -8,13 +8,19 @@ from core.common.serializers import ReadSerializerMixin
 class ParameterCodingSerializer(ReadSerializerMixin, serializers.Serializer):
     system = CharField()
     code = CharField()
+    version = CharField(required=False)
+    display = CharField(required=False)
 
 
 class ParameterSerializer(ReadSerializerMixin, serializers.Serializer):
     name = CharField()
     valueString = CharField(required=False)
+    valueCode = CharField(required=False)
+    valueUri = CharField(required=False)
+    valueUrl = CharField(required=False)
     valueCoding = ParameterCodingSerializer(required=False)
     valueBoolean = BooleanField(required=False)
+    part = ListField(child=DictField(), required=False)
 
 
 class ParametersSerializer(ReadSerializerMixin, serializers.Serializer):
@@ -28,6 +34,10 @@ class ParametersSerializer(ReadSerializerMixin, serializers.Serializer):
     @staticmethod
     def from_concept(concept):
         source = concept.sources.filter(is_latest_version=True).exclude(version=HEAD).first()
+        return ParametersSerializer.from_lookup(source, concept.name if concept.name else concept.display_name)
+
+    @staticmethod
+    def from_lookup(source, display):
         parameters = {
             'parameter': [
                 {
@@ -40,9 +50,9 @@ class ParametersSerializer(ReadSerializerMixin, serializers.Serializer):
                 },
                 {
                     'name': 'display',
-                    'valueString': concept.name if concept.name else concept.display_name
+                    'valueString': display
                 }
             ]
         }
 
-        return ParametersSerializer(parameters)
\ No newline at end of file
+        return ParametersSerializer(parameters)
@@ -37,6 +37,7 @@ ALLOWED_HOSTS = ['*']
 
 CORS_ALLOW_HEADERS = default_headers + (
     'INCLUDEFACETS',
+    'X-OCL-PROFILE',
 )
 
 CORS_EXPOSE_HEADERS = (
@@ -54,6 +55,14 @@ CORS_EXPOSE_HEADERS = (
     'X-OCL-RESPONSE-TIME',
     'X-OCL-REQUEST-URL',
     'X-OCL-REQUEST-METHOD',
+    'X-OCL-PROFILE-SQL-COUNT',
+    'X-OCL-PROFILE-SQL-TIME',
+    'X-OCL-PROFILE-SQL-TOP',
+    'X-OCL-PROFILE-ES-COUNT',
+    'X-OCL-PROFILE-ES-TOOK',
+    'X-OCL-PROFILE-ES-TIME',
+    'X-OCL-PROFILE-REDIS-COUNT',
+    'X-OCL-PROFILE-SERIALIZER-TIME',
 )
 
 CORS_ORIGIN_ALLOW_ALL = True
@@ -143,6 +152,8 @@ MIDDLEWARE = [
     'core.middlewares.middlewares.CustomLoggerMiddleware',
     'core.middlewares.middlewares.FixMalformedLimitParamMiddleware',
     'core.middlewares.middlewares.ResponseHeadersMiddleware',
+    'core.middlewares.middlewares.ProfilingMiddleware',
+    'core.middlewares.middlewares.MetricsMiddleware',
     'core.middlewares.middlewares.CurrentUserMiddleware',
 ]
 
@@ -232,6 +243,11 @@ if ENV and ENV not in ['ci', 'development']:
                 'level': 'DEBUG',
                 'propagate': False,
             },
+            'request_profiler': {
+                'handlers': ['console', 'request_handler'],
+                'level': 'INFO',
+                'propagate': False,
+            },
         },
     }
 
@@ -301,6 +317,47 @@ if ENV and ENV not in ['ci']:
         }
     }
 
+# Per request profiling (X-OCL-PROFILE header/profile param for staff), log it and/or sample a rate of all requests
+REQUEST_PROFILING_LOG = os.environ.get('REQUEST_PROFILING_LOG', 'false') in ['true', True]
+REQUEST_PROFILING_SAMPLE_RATE = float(os.environ.get('REQUEST_PROFILING_SAMPLE_RATE', 0))
+
+# /metrics: per process samples are added to redis every METRICS_FLUSH_INTERVAL seconds
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true') in ['true', True]
+METRICS_FLUSH_INTERVAL = int(os.environ.get('METRICS_FLUSH_INTERVAL', 10))  # seconds
+METRICS_ACCESS_TOKEN = os.environ.get('METRICS_ACCESS_TOKEN', None)  # for scrapers, staff users don't need it
+METRICS_CELERY_QUEUES = [
+    'default', 'concurrent', 'indexing', 'bulk_import_0', 'bulk_import_1', 'bulk_import_2', 'bulk_import_3',
+    'bulk_import_root'
+]
+
+# GET responses of public released source versions (concepts/mappings), kept until invalidated
+RESPONSE_CACHE_ENABLED = os.environ.get('RESPONSE_CACHE_ENABLED', 'true') in ['true', True]
+
+# $cascade hierarchy/mapping graphs of released repo versions, kept in the django cache and a per process LRU
+CONCEPT_GRAPH_CACHE_ENABLED = os.environ.get('CONCEPT_GRAPH_CACHE_ENABLED', 'true') in ['true', True]
+CONCEPT_GRAPH_CACHE_TTL = int(os.environ.get('CONCEPT_GRAPH_CACHE_TTL', 24 * 60 * 60))  # seconds
+CONCEPT_GRAPH_LOCAL_CACHE_SIZE = int(os.environ.get('CONCEPT_GRAPH_LOCAL_CACHE_SIZE', 8))
+
+# FHIR $validate-code/$lookup of released CodeSystems/ValueSets through code indexes kept in the django cache and a
+# per process LRU, canonical url/version resolution is kept in process for TERMINOLOGY_RESOLVE_TTL
+TERMINOLOGY_INDEX_ENABLED = os.environ.get('TERMINOLOGY_INDEX_ENABLED', 'true') in ['true', True]
+TERMINOLOGY_INDEX_CACHE_TTL = int(os.environ.get('TERMINOLOGY_INDEX_CACHE_TTL', 24 * 60 * 60))  # seconds
+TERMINOLOGY_INDEX_LOCAL_CACHE_SIZE = int(os.environ.get('TERMINOLOGY_INDEX_LOCAL_CACHE_SIZE', 32))
+TERMINOLOGY_RESOLVE_TTL = int(os.environ.get('TERMINOLOGY_RESOLVE_TTL', 60))  # seconds
+TERMINOLOGY_RESOLVE_CACHE_SIZE = int(os.environ.get('TERMINOLOGY_RESOLVE_CACHE_SIZE', 10000))
+# codings of a batch $validate-code and entries of a FHIR batch/transaction Bundle
+TERMINOLOGY_BATCH_MAX_CODINGS = int(os.environ.get('TERMINOLOGY_BATCH_MAX_CODINGS', 1000))
+
+# BulkImportInline creates new concepts in batches (Concept.bulk_persist_new) instead of one by one
+BULK_IMPORT_BULK_CREATE = os.environ.get('BULK_IMPORT_BULK_CREATE', 'false') in ['true', True]
+BULK_IMPORT_BATCH_SIZE = int(os.environ.get('BULK_IMPORT_BATCH_SIZE', 1000))
+# inline imports of uploads/file urls from this size (bytes) are stored and read as a stream (ImportFile),
+# parallel ones are cut in byte ranges at split points about IMPORT_FILE_SPLIT_SIZE bytes apart
+IMPORT_FILE_MIN_SIZE = int(os.environ.get('IMPORT_FILE_MIN_SIZE', 10 * 1024 * 1024))
+IMPORT_FILE_SPLIT_SIZE = int(os.environ.get('IMPORT_FILE_SPLIT_SIZE', 1024 * 1024))
+# Collection.add_references resolves, checks and inserts plain concept/mapping references (system + code) set-wise
+COLLECTION_REFERENCES_BULK_ADD = os.environ.get('COLLECTION_REFERENCES_BULK_ADD', 'true') in ['true', True]
+
 # Celery
 CELERY_ENABLE_UTC = True
 CELERY_TIMEZONE = "UTC"
@@ -321,7 +378,8 @@ CELERY_TASK_ROUTES = {
     'core.common.tasks.handle_m2m_changed': {'queue': 'indexing'},
     'core.common.tasks.handle_pre_delete': {'queue': 'indexing'},
     'core.common.tasks.populate_indexes': {'queue': 'indexing'},
-    'core.common.tasks.rebuild_indexes': {'queue': 'indexing'}
+    'core.common.tasks.rebuild_indexes': {'queue': 'indexing'},
+    'core.common.tasks.drain_index_buffer': {'queue': 'indexing'},
 }
 CELERY_RESULT_BACKEND = f'redis://{REDIS_HOST}:{REDIS_PORT}/{REDIS_DB}'
 CELERY_RESULT_EXTENDED = True
@@ -347,6 +405,18 @@ ELASTICSEARCH_DSL_AUTO_REFRESH = True
 ELASTICSEARCH_DSL_AUTOSYNC = True
 ELASTICSEARCH_DSL_SIGNAL_PROCESSOR = 'core.common.models.CelerySignalProcessor'
 ES_SYNC = True
+# Concept/Mapping saves are collected in a Redis set and indexed in bulk by drain_index_buffer
+ES_BUFFERED_INDEXING = os.environ.get('ES_BUFFERED_INDEXING', 'true') in ['true', True]
+ES_INDEX_BUFFER_BATCH_SIZE = int(os.environ.get('ES_INDEX_BUFFER_BATCH_SIZE', 2000))
+ES_INDEX_BUFFER_DELAY = int(os.environ.get('ES_INDEX_BUFFER_DELAY', 2))  # seconds to collect saves before draining
+ES_INDEX_BUFFER_RETRY_DELAY = int(os.environ.get('ES_INDEX_BUFFER_RETRY_DELAY', 30))  # seconds, after a failed drain
+# batch_index: rows loaded per keyset batch and ES parallel_bulk tuning (in-flight bytes ~ threads * chunk bytes)
+ES_BATCH_INDEX_SIZE = int(os.environ.get('ES_BATCH_INDEX_SIZE', 1000))
+ES_BULK_CHUNK_SIZE = int(os.environ.get('ES_BULK_CHUNK_SIZE', 500))
+ES_BULK_THREAD_COUNT = int(os.environ.get('ES_BULK_THREAD_COUNT', 4))
+ES_BULK_MAX_CHUNK_BYTES = int(os.environ.get('ES_BULK_MAX_CHUNK_BYTES', 20 * 1024 * 1024))
+# render default concept/mapping search lists from the list_payload stored in the index
+ES_NATIVE_LIST_RESULTS = os.environ.get('ES_NATIVE_LIST_RESULTS', 'false') in ['true', True]
 USE_X_FORWARDED_HOST = True
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 # Only used for flower
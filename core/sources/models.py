@@ -1,11 +1,13 @@
 import uuid
 
+from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.db import models
 from django.db.models import UniqueConstraint, F
 from pydash import compact
 from dirtyfields import DirtyFieldsMixin
 
+from core.common.caching import invalidate_repo_cache, invalidate_repo_version_cache
 from core.common.models import ConceptContainerModel
 from core.common.services import PostgresQL
 from core.common.validators import validate_non_negative
@@ -16,6 +18,8 @@ from core.sources.constants import SOURCE_TYPE, SOURCE_VERSION_TYPE, HIERARCHY_R
 
 class Source(DirtyFieldsMixin, ConceptContainerModel):
     DEFAULT_AUTO_ID_START_FROM = 1
+    # attributes stored in the list_payload of the source's concept/mapping documents (source, display_name)
+    LIST_PAYLOAD_FIELDS = ['mnemonic', 'default_locale', 'supported_locales']
 
     es_fields = {
         'source_type': {'sortable': True, 'filterable': True, 'facet': True, 'exact': True},
@@ -284,11 +288,21 @@ class Source(DirtyFieldsMixin, ConceptContainerModel):
 
         super().save(force_insert=force_insert, force_update=force_update, using=using, update_fields=update_fields)
 
+        if not is_new:
+            if self.is_head and ('public_access' in dirty_fields or 'is_active' in dirty_fields):
+                invalidate_repo_cache(self)
+            invalidate_repo_version_cache(self)
+
         if self.id and self.is_head:
             if is_new:
                 self.__create_sequences()
             else:
                 self.__update_sequences(dirty_fields)
+                if settings.ES_NATIVE_LIST_RESULTS and any(
+                        field in dirty_fields for field in self.LIST_PAYLOAD_FIELDS):
+                    from core.common.tasks import index_source_concepts, index_source_mappings
+                    index_source_concepts.delay(self.id)
+                    index_source_mappings.delay(self.id)
 
     def __update_sequences(self, dirty_fields=[]):  # pylint: disable=dangerous-default-value
         def should_update(is_seq, field, start_from):
@@ -1,6 +1,7 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 
+from core.common.caching import invalidate_repo_version_cache
 from core.sources.models import Source
 
 
@@ -24,3 +25,9 @@ def propagate_parent_attributes(sender, instance=None, created=False, **kwargs):
         if updated_mappings:
             from core.mappings.documents import MappingDocument
             instance.batch_index(instance.mappings_set, MappingDocument)
+
+
+@receiver(post_delete, sender=Source)
+def invalidate_response_cache(sender, instance=None, **kwargs):  # pylint: disable=unused-argument
+    if instance:
+        invalidate_repo_version_cache(instance)
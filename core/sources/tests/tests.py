@@ -1,6 +1,7 @@
 import factory
 from django.core.exceptions import ValidationError
 from django.db import transaction, IntegrityError
+from django.test import override_settings
 from mock import patch, Mock, ANY, PropertyMock
 
 from core.collections.models import Collection
@@ -32,6 +33,24 @@ class SourceTest(OCLTestCase):
         self.new_source = OrganizationSourceFactory.build(organization=None)
         self.user = UserProfileFactory()
 
+    @override_settings(ES_NATIVE_LIST_RESULTS=True)
+    @patch('core.common.tasks.index_source_mappings.delay')
+    @patch('core.common.tasks.index_source_concepts.delay')
+    def test_save_reindexes_children_when_list_payload_fields_change(self, index_concepts_mock, index_mappings_mock):
+        source = OrganizationSourceFactory(default_locale='en', supported_locales=['en'])
+
+        source.name = 'new name'
+        source.save()
+
+        index_concepts_mock.assert_not_called()
+        index_mappings_mock.assert_not_called()
+
+        source.default_locale = 'fr'
+        source.save()
+
+        index_concepts_mock.assert_called_once_with(source.id)
+        index_mappings_mock.assert_called_once_with(source.id)
+
     def test_public_can_view(self):
         self.assertFalse(Source(public_access='none').public_can_view)
         self.assertFalse(Source(public_access='foobar').public_can_view)
@@ -838,14 +857,16 @@ class TasksTest(OCLTestCase):
     def test_index_source_mappings(self, batch_index_mock, source_mappings_mock):
         source = OrganizationSourceFactory()
         index_source_mappings(source.id)
-        batch_index_mock.assert_called_once_with(source_mappings_mock, MappingDocument)
+        batch_index_mock.assert_called_once_with(
+            source_mappings_mock, MappingDocument, checkpoint_key=f'{source.uri}mappings')
 
     @patch('core.sources.models.Source.concepts')
     @patch('core.sources.models.Source.batch_index')
     def test_index_source_concepts(self, batch_index_mock, source_concepts_mock):
         source = OrganizationSourceFactory()
         index_source_concepts(source.id)
-        batch_index_mock.assert_called_once_with(source_concepts_mock, ConceptDocument)
+        batch_index_mock.assert_called_once_with(
+            source_concepts_mock, ConceptDocument, checkpoint_key=f'{source.uri}concepts')
 
     @patch('core.sources.models.Source.validate_child_concepts')
     def test_update_validation_schema_success(self, validate_child_concepts_mock):
@@ -21,11 +21,12 @@ from rest_framework import permissions
 import core.concepts.views as concept_views
 import core.mappings.views as mapping_views
 from core import VERSION
+from core.bundles.views import FHIRBatchView
 from core.collections.views import ReferenceExpressionResolveView
 from core.common.constants import NAMESPACE_PATTERN
 from core.common.utils import get_api_base_url
 from core.common.views import RootView, FeedbackView, APIVersionView, ChangeLogView, ConceptDuplicateLocalesView, \
-    ConceptDormantLocalesView, ConceptMultipleLatestVersionsView
+    ConceptDormantLocalesView, ConceptMultipleLatestVersionsView, MetricsView
 from core.concepts.views import ConceptsHierarchyAmendAdminView
 from core.importers.views import BulkImportView
 import core.reports.views as report_views
@@ -50,6 +51,7 @@ urlpatterns = [
     re_path(r'^swagger/$', SchemaView.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     re_path(r'^redoc/$', SchemaView.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
     path('healthcheck/', include('core.common.healthcheck.urls')),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
     path('admin/reports/authored/', report_views.AuthoredView.as_view(), name='authored-report'),
     path('admin/reports/monthly-usage/', report_views.MonthlyUsageView.as_view(), name='monthly-usage-report'),
     path('admin/concepts/locales/duplicate/', ConceptDuplicateLocalesView.as_view(), name='concept-duplicate-locales'),
@@ -66,6 +68,7 @@ urlpatterns = [
     path('orgs/', include('core.orgs.urls'), name='orgs_url'),
     path('sources/', include('core.sources.urls'), name='sources_url'),
     #TODO: require FHIR subdomain
+    path('fhir/', FHIRBatchView.as_view(), name='fhir-batch'),
     path('fhir/CodeSystem/', include('core.code_systems.urls'), name='code_systems_urls'),
     path('fhir/ValueSet/', include('core.value_sets.urls'), name='value_sets_urls'),
     path('collections/', include('core.collections.urls'), name='collections_urls'),
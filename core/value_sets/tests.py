@@ -396,6 +396,44 @@ class ValueSetTest(OCLAPITestCase):
         self.assertEqual(resource['parameter'][0]['name'], 'result')
         self.assertEqual(resource['parameter'][0]['valueBoolean'], False)
 
+    def test_validate_code_batch(self):
+        self.collection.add_references([
+            CollectionReference(
+                expression=self.concept_1.uri, collection=self.collection, code=self.concept_1.mnemonic,
+                system=self.concept_1.parent.uri, version='v2'
+            ),
+        ])
+        self.collection_v1.seed_references()
+
+        response = self.client.post(
+            '/fhir/ValueSet/$validate-code/',
+            {'resourceType': 'Parameters', 'parameter': [
+                {'name': 'url', 'valueUri': 'http://c1.com'},
+                {'name': 'coding', 'valueCoding': {
+                    'system': 'http://some/url', 'code': self.concept_1.mnemonic, 'version': 'v2'}},
+                {'name': 'coding', 'valueCoding': {
+                    'system': 'http://some/url', 'code': self.concept_2.mnemonic, 'version': 'v2'}},
+            ]},
+            format='json'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        validations = response.data['parameter']
+        self.assertEqual(len(validations), 2)
+        self.assertEqual(validations[0]['part'][1], {'name': 'result', 'valueBoolean': True})
+        self.assertEqual(validations[1]['part'][1], {'name': 'result', 'valueBoolean': False})
+
+    def test_validate_code_batch_without_url(self):
+        response = self.client.post(
+            '/fhir/ValueSet/$validate-code/',
+            {'resourceType': 'Parameters', 'parameter': [
+                {'name': 'coding', 'valueCoding': {'system': 'http://some/url', 'code': self.concept_1.mnemonic}},
+            ]},
+            format='json'
+        )
+
+        self.assertEqual(response.status_code, 400)
+
     def test_expand(self):
         self.client.post(
             f'/users/{self.user.mnemonic}/ValueSet/',
@@ -1,6 +1,8 @@
 import logging
 
+from django.conf import settings
 from django.db.models import F
+from rest_framework.response import Response
 
 from core.bundles.serializers import FHIRBundleSerializer
 from core.collections.models import Collection
@@ -8,6 +10,8 @@ from core.collections.views import CollectionListView, CollectionRetrieveUpdateD
     CollectionVersionExpansionsView
 from core.common.constants import HEAD
 from core.common.fhir_helpers import translate_fhir_query
+from core.common.mixins import BatchValidateCodeMixin
+from core.common.terminology import TerminologyService, get_validation_parameters
 from core.concepts.views import ConceptRetrieveUpdateDestroyView
 from core.parameters.serializers import ParametersSerializer
 from core.sources.models import Source
@@ -49,9 +53,10 @@ class ValueSetListView(CollectionListView):
         return self.serializer_class(obj)
 
 
-class ValueSetValidateCodeView(ConceptRetrieveUpdateDestroyView):
+class ValueSetValidateCodeView(BatchValidateCodeMixin, ConceptRetrieveUpdateDestroyView):
     serializer_class = ParametersSerializer
     parameters = {}
+    is_value_set = True
 
     def process_parameters(self):
         self.parameters = {}
@@ -67,7 +72,7 @@ class ValueSetValidateCodeView(ConceptRetrieveUpdateDestroyView):
                 value = None
                 match name:
                     case 'url' | 'system':
-                        value = parameter.get('valueUrl') | parameter.get('valueUri')
+                        value = parameter.get('valueUrl') or parameter.get('valueUri')
                     case 'code' | 'displayLanguage':
                         value = parameter.get('valueCode')
                     case 'display' | 'systemVersion':
@@ -79,6 +84,18 @@ class ValueSetValidateCodeView(ConceptRetrieveUpdateDestroyView):
     def is_container_version_specified(self):
         return True
 
+    def get(self, request, *args, **kwargs):
+        self.process_parameters()
+        url = self.parameters.get('url')
+        code = self.parameters.get('code')
+        system = self.parameters.get('system')
+        system_version = self.parameters.get('systemVersion')
+        if settings.TERMINOLOGY_INDEX_ENABLED and url and code and system and system_version != HEAD:
+            validation = TerminologyService(request).validate_value_set_code(
+                url, system, code, system_version, self.parameters.get('display'))
+            return Response(ParametersSerializer({'parameter': get_validation_parameters(validation)}).data)
+        return super().get(request, *args, **kwargs)
+
     def get_queryset(self):
         queryset = super().get_queryset()
         self.process_parameters()